@@ -1,23 +1,37 @@
 #!/usr/bin/env python3
 
 import os
+import hmac
+import asyncio
 import logging
 import json
-from typing import List, Dict, Any, Optional
+from datetime import date
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 import ast
 
+import httpx
+import openai
 import pandas as pd
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
 
 # Import utility functions
-from utils import get_embeddings, cosine_similarity
+from utils import get_embeddings_async, https_verify
+from query_cache import embedding_cache
+from answer_cache import answer_cache
+from batcher import MicroBatcher
+from pipeline import Stage, run_graph
+from streaming import sse_event, stream_metrics
+from context_builder import ContextResult, build_context, context_metrics
+from llm_clients import LLMClients
+from rate_limit import PRIORITY_HIGH, RateLimitExceeded, estimate_tokens, scheduler_from_env
 
 import csv_data
-from csv_data import search_hcl_documents, search_service_documents, vector_search
+from csv_data import search_hcl_documents, search_service_documents, vector_search, hybrid_search
 
 # Define collection names for compatibility
 HCL_COLLECTION = "hcl_documents"
@@ -41,116 +55,184 @@ API_KEY_4O=os.getenv("API_KEY_4o")
 ENDPOINT_URL_4O=os.getenv("ENDPOINT_URL_4o")
 API_VERSION = os.getenv("API_VERSION")
 
-# Initialize global variables for data
-cached_hcl_docs = []
-cached_service_docs = []
+# Request timeouts (seconds) for the embedding and chat-completion endpoints
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "30"))
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "120"))
+
+# Per-stage timeouts (seconds) for the /askCombined pipeline
+RETRIEVAL_STAGE_TIMEOUT = float(os.getenv("RETRIEVAL_STAGE_TIMEOUT", "30"))
+GENERATION_STAGE_TIMEOUT = float(os.getenv("GENERATION_STAGE_TIMEOUT", str(CHAT_TIMEOUT)))
+
+# Micro-batching of concurrent query embeddings: window (ms) and maximum batch size
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+
+# Pooled embedding and chat clients, opened in the lifespan and shared by every request
+llm_clients = LLMClients(
+    chat_endpoint=ENDPOINT_URL_4O,
+    chat_api_key=API_KEY_4O,
+    api_version=API_VERSION,
+    embedding_timeout=EMBEDDING_TIMEOUT,
+    chat_timeout=CHAT_TIMEOUT,
+    embedding_verify=https_verify(),
+)
 
-def answer_query_with_cosine(query: str, collection_name: str, top_k: int = 5) -> List[Dict[str, Any]]:
-    global cached_hcl_docs, cached_service_docs  # Declare globals at the very beginning
-    logger.info(f"Processing query with cosine similarity: {query}")
-    endpoint, api_key = (ENDPOINT_URL, API_KEY) if collection_name == HCL_COLLECTION else (ENDPOINT_URL_SERV, API_KEY_SERV)
-    
-    query_embedding_list = get_embeddings([query], endpoint, api_key)
-    if not query_embedding_list:
-        logger.error("Failed to obtain embedding for the query.")
-        return []
-    query_embedding = query_embedding_list[0]
-    # print(f"mere:::",query_embedding)
-
-    # Make sure data is loaded
-    if not cached_hcl_docs and not cached_service_docs:
-        csv_data.load_csv_data()  
-        cached_hcl_docs = csv_data.hcl_data.copy() if csv_data.hcl_data else []
-        cached_service_docs = csv_data.service_data.copy() if csv_data.service_data else []
-
-    # Use cached documents based on the collection_name
-    all_docs = cached_hcl_docs if collection_name == HCL_COLLECTION else cached_service_docs
-    docs_with_scores = []
-    for doc in all_docs:
-        embedding = doc.get("embedings")
-        print("pere:",embedding)
-        if not embedding or not isinstance(embedding, list):
-            logger.warning(f"Skipping document {doc.get('_id')}: embedding type is {type(embedding)}, expected list")
-            continue
-        try:
-            score = cosine_similarity(query_embedding, embedding)
-            docs_with_scores.append((doc, score))
-        except Exception as e:
-            logger.warning(f"Error calculating similarity for document {doc.get('_id')}: {e}")
+# Rate-limit-aware schedulers: one per embedding endpoint (see get_embedding_batcher) and one for chat.
+# Limits come from EMBEDDING_RPM/_TPM/_MAX_CONCURRENCY and CHAT_RPM/_TPM/_MAX_CONCURRENCY.
+chat_scheduler = scheduler_from_env("chat", "CHAT", retry_exceptions=(openai.APIConnectionError, openai.InternalServerError))
+
+# Maximum tokens of retrieved document text in a prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Fuse BM25 and vector rankings for retrieval ("0" for vector search only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+
+# Seconds between checks of the data files for a new corpus (0 disables the watcher)
+CORPUS_WATCH_INTERVAL = float(os.getenv("CORPUS_WATCH_INTERVAL", "30"))
 
-    docs_with_scores.sort(key=lambda x: x[1], reverse=True)
-    return [doc for doc, _ in docs_with_scores[:top_k]]
+# Shared secret for POST /admin/reload, sent as the X-Admin-Token header (unset disables the endpoint)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-def get_best_hcl(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+# One batcher and one rate-limit scheduler per embedding endpoint
+_embedding_batchers: Dict[str, MicroBatcher] = {}
+_embedding_schedulers: Dict[str, Any] = {}
+
+def get_embedding_batcher(endpoint: str, api_key: str) -> MicroBatcher:
+    """Return the batcher that groups concurrent queries into one request to the endpoint."""
+    batcher = _embedding_batchers.get(endpoint)
+    if batcher is None:
+        scheduler = scheduler_from_env(endpoint, "EMBEDDING", retry_exceptions=(httpx.TimeoutException, httpx.TransportError))
+        _embedding_schedulers[endpoint] = scheduler
+        
+        async def embed_batch(texts: List[str]) -> List[Optional[List[float]]]:
+            embeddings = await get_embeddings_async(texts, endpoint, api_key, llm_clients.embedding, scheduler)
+            return embeddings if embeddings else [None] * len(texts)
+        
+        batcher = MicroBatcher(embed_batch, max_batch_size=EMBEDDING_BATCH_SIZE,
+                               max_wait_ms=EMBEDDING_BATCH_WAIT_MS, name=endpoint)
+        _embedding_batchers[endpoint] = batcher
+    return batcher
+
+async def embed_query(query: str, collection_name: str) -> Optional[List[float]]:
     """
-    Return a list of best HCL documents based on the query.
+    Embed a query with the endpoint used for the given collection.
     
     Args:
         query (str): The query text.
-        top_k (int): The number of top results to return.
+        collection_name (str): HCL_COLLECTION or SERVICE_COLLECTION.
         
     Returns:
-        List[Dict[str, Any]]: A list of top matching HCL documents.
+        Optional[List[float]]: The embedding, or None if the endpoint failed.
     """
-    return answer_query_with_cosine(query, HCL_COLLECTION, top_k)
+    endpoint, api_key = (ENDPOINT_URL, API_KEY) if collection_name == HCL_COLLECTION else (ENDPOINT_URL_SERV, API_KEY_SERV)
+    
+    # Repeated questions reuse the embedding computed for this endpoint
+    # Cache misses are batched with other in-flight queries for the same endpoint
+    batcher = get_embedding_batcher(endpoint, api_key)
+    return await embedding_cache.get_or_compute_async(endpoint, query, lambda: batcher.submit(query))
+
+async def get_corpus() -> csv_data.CorpusSnapshot:
+    """Return the published corpus, loading it first (once, however many requests wait) if needed."""
+    return await asyncio.wrap_future(csv_data.ensure_loaded())
+
+async def answer_query_with_cosine(query: str, collection_name: str, top_k: int = 5,
+                                   corpus: Optional[csv_data.CorpusSnapshot] = None,
+                                   filters: Optional[Dict[str, Any]] = None) -> List[int]:
+    logger.info(f"Processing query with cosine similarity: {query}")
+    
+    try:
+        query_embedding = await embed_query(query, collection_name)
+    except RateLimitExceeded:
+        # The whole request is answered with 503 and a Retry-After
+        raise
+    except Exception as e:
+        # Timeouts and HTTP errors: fall back to BM25 alone
+        logger.error(f"Embedding request failed for {collection_name}: {e!r}")
+        query_embedding = None
+    if not query_embedding:
+        logger.error("Failed to obtain embedding for the query.")
+        if not HYBRID_SEARCH:
+            return []
+
+    # Search the snapshot the request started with, even if a reload swaps in a new one meanwhile
+    corpus = corpus or await get_corpus()
+
+    # Score against the collection's pre-normalized embedding matrix, fused with BM25 when enabled
+    collection_type = 'hcl' if collection_name == HCL_COLLECTION else 'service'
+    try:
+        if HYBRID_SEARCH:
+            return hybrid_search(collection_type, query_embedding or None, query, top_k, corpus=corpus,
+                                 filters=filters, positions=True)
+        return vector_search(collection_type, query_embedding, top_k, corpus=corpus, filters=filters, positions=True)
+    except ValueError as e:
+        logger.error(f"Vector search failed for {collection_name}: {e}")
+        return []
 
-def get_hcl_content(hcl_docs: List[Dict[str, Any]]) -> str:
+async def get_best_hcl(query: str, top_k: int = 5,
+                       corpus: Optional[csv_data.CorpusSnapshot] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> List[int]:
     """
-    Extract and format content from HCL documents.
+    Return the positions of the best HCL documents for the query in the corpus snapshot.
     
     Args:
-        hcl_docs (List[Dict[str, Any]]): A list of HCL documents.
+        query (str): The query text.
+        top_k (int): The number of top results to return.
+        corpus (Optional[csv_data.CorpusSnapshot]): The snapshot to search (defaults to the current one).
+        filters (Optional[Dict[str, Any]]): Structured filters, e.g. a dataAdoptarii range.
         
     Returns:
-        str: Formatted content from the HCL documents.
+        List[int]: Positions of the top matching HCL documents, best first.
     """
-    content = []
-    for doc in hcl_docs:
-        hcl_text = f"HCL: {doc.get('HCL', 'N/A')}\n"
-        hcl_text += f"Data adoptării: {doc.get('dataAdoptarii', 'N/A')}\n"
-        hcl_text += f"Motivație și articole: {doc.get('motivatie_articole', 'N/A')}\n\n"
-        content.append(hcl_text)
-    
-    return "\n".join(content)
+    return await answer_query_with_cosine(query, HCL_COLLECTION, top_k, corpus, filters)
 
 # Functions for Services data
-def get_best_services(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+async def get_best_services(query: str, top_k: int = 5,
+                            corpus: Optional[csv_data.CorpusSnapshot] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[int]:
     """
-    Return a list of best service documents based on the query.
+    Return the positions of the best service documents for the query in the corpus snapshot.
     
     Args:
         query (str): The query text.
         top_k (int): The number of top results to return.
+        corpus (Optional[csv_data.CorpusSnapshot]): The snapshot to search (defaults to the current one).
+        filters (Optional[Dict[str, Any]]): Structured filters, e.g. a set of service ids.
         
     Returns:
-        List[Dict[str, Any]]: A list of top matching service documents.
+        List[int]: Positions of the top matching service documents, best first.
     """
-    return answer_query_with_cosine(query, SERVICE_COLLECTION, top_k)
+    return await answer_query_with_cosine(query, SERVICE_COLLECTION, top_k, corpus, filters)
 
-def get_service_content(service_docs: List[Dict[str, Any]]) -> str:
+def get_context(corpus: csv_data.CorpusSnapshot, hcl_rows: List[int], service_rows: List[int]) -> ContextResult:
     """
-    Extract and format content from service documents.
+    Assemble the prompt context from the retrieved documents of both collections,
+    within CONTEXT_TOKEN_BUDGET tokens. Documents were rendered and counted when
+    the corpus loaded, so this only selects and joins text.
     
     Args:
-        service_docs (List[Dict[str, Any]]): A list of service documents.
+        corpus (csv_data.CorpusSnapshot): The snapshot the positions refer to.
+        hcl_rows (List[int]): HCL document positions, best first.
+        service_rows (List[int]): Service document positions, best first.
         
     Returns:
-        str: Formatted content from the service documents.
+        ContextResult: The context text and the tokens it used.
     """
-    content = []
-    for doc in service_docs:
-        service_text = f"Service ID: {doc.get('service_id', 'N/A')}\n"
-        service_text += f"Name: {doc.get('name', 'N/A')}\n"
-        service_text += f"URL: {doc.get('url', 'N/A')}\n"
-        service_text += f"Lista mentiuni: {doc.get('Lista_mentiuni', 'N/A')}\n"
-        service_text += f"Querry HCL: {doc.get('QuerryHCL', 'N/A')}\n"
-        service_text += f"Service text: {doc.get('Service_text', 'N/A')}\n\n"
-        content.append(service_text)
-    
-    return "\n".join(content)
+    context = build_context([corpus.context_documents('hcl', hcl_rows),
+                             corpus.context_documents('service', service_rows)], CONTEXT_TOKEN_BUDGET)
+    context_metrics.record(context)
+    logger.info(f"Context: {context.tokens}/{context.budget} tokens from {len(context.documents)} documents "
+                f"(of {context.source_tokens} retrieved; {context.truncated} truncated, {context.dropped} dropped, "
+                f"{context.duplicates} duplicate sentences)")
+    return context
+
+SYSTEM_PROMPT = (
+    "Tu ești un asistent virtual conceput pentru a răspunde la întrebările publicului. "
+    "Răspunsurile tale pot include informații numerice, cum ar fi referințe la legi sau link-uri, "
+    "și trebuie să se bazeze exclusiv pe conținutul prezentat mai jos.\n\n"
+)
 
 # Function to get a response using Azure OpenAI
-def get_response(question: str, content: str) -> str:
+async def get_response(question: str, content: str) -> str:
     """
     Get a response from Azure OpenAI based on the question and content.
     
@@ -161,33 +243,90 @@ def get_response(question: str, content: str) -> str:
     Returns:
         str: The response from the AI model.
     """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT + content},
+        {"role": "user", "content": question}
+    ]
     try:
-        from openai import AzureOpenAI
-        
-        client = AzureOpenAI(
-            api_key=API_KEY_4O,  
-            api_version=API_VERSION,
-            azure_endpoint=ENDPOINT_URL_4O
+        chat_completion = await chat_scheduler.submit_async(
+            lambda: llm_clients.chat.chat.completions.create(model="gpt-4o", messages=messages),
+            tokens=estimate_tokens(SYSTEM_PROMPT, content, question),
         )
         
-        prompt = (
-            "Tu ești un asistent virtual conceput pentru a răspunde la întrebările publicului. "
-            "Răspunsurile tale pot include informații numerice, cum ar fi referințe la legi sau link-uri, "
-            "și trebuie să se bazeze exclusiv pe conținutul prezentat mai jos.\n\n"
-        )
+        return chat_completion.choices[0].message.content
+    except RateLimitExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting response from Azure OpenAI: {e}")
+        return f"Error generating response: {str(e)}"
+
+async def stream_response(question: str, content: str) -> AsyncIterator[str]:
+    """
+    Stream a response from Azure OpenAI token by token.
+    
+    Args:
+        question (str): The user's question.
+        content (str): The context content to use for answering.
         
-        chat_completion = client.chat.completions.create(
+    Yields:
+        str: Chunks of the generated text as they arrive.
+    """
+    # Streams finish an answer the user is already waiting on, so they are admitted first
+    # The scheduler slot is held until the whole stream has been read
+    stream = chat_scheduler.submit_stream_async(
+        lambda: llm_clients.chat.chat.completions.create(
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": prompt + content},
+                {"role": "system", "content": SYSTEM_PROMPT + content},
                 {"role": "user", "content": question}
-            ]
-        )
+            ],
+            stream=True,
+        ),
+        tokens=estimate_tokens(SYSTEM_PROMPT, content, question),
+        priority=PRIORITY_HIGH,
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.aclose()
+
+async def answer_from_documents(question: str, context: ContextResult) -> Optional[str]:
+    """
+    Generate the answer from the assembled context of both collections.
+    
+    Returns:
+        Optional[str]: The response, or None if no document made it into the context.
+    """
+    if not context.documents:
+        return None
+    
+    return await get_response(question, context.text)
+
+def search_filters(adopted_after: Optional[date] = None, adopted_before: Optional[date] = None,
+                   service_ids: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Build the HCL and service search filters from request parameters.
+    
+    Args:
+        adopted_after (Optional[date]): Only HCLs adopted on or after this date.
+        adopted_before (Optional[date]): Only HCLs adopted on or before this date.
+        service_ids (Optional[List[str]]): Only these services (numeric ids are matched as numbers).
         
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        logger.error(f"Error getting response from Azure OpenAI: {e}")
-        return f"Error generating response: {str(e)}"
+    Returns:
+        Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]: HCL and service filters, None when unfiltered.
+    """
+    adopted = {}
+    if adopted_after:
+        adopted["$gte"] = adopted_after.isoformat()
+    if adopted_before:
+        adopted["$lte"] = adopted_before.isoformat()
+    hcl_filters = {"dataAdoptarii": adopted} if adopted else None
+    service_filters = None
+    if service_ids:
+        service_filters = {"service_id": {"$in": [int(i) if i.isdigit() else i for i in service_ids]}}
+    return hcl_filters, service_filters
 
 # Pydantic models for API
 class QuestionRequest(BaseModel):
@@ -195,30 +334,54 @@ class QuestionRequest(BaseModel):
 
 class QuestionResponse(BaseModel):
     response: str
+    # Tokens of document context sent with the question (None for cached answers)
+    context_tokens: Optional[int] = None
 
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup code
+    llm_clients.open()
     await load_collections()  # For example, load your MongoDB collections into memory
+    watcher = asyncio.create_task(watch_corpus(CORPUS_WATCH_INTERVAL)) if CORPUS_WATCH_INTERVAL > 0 else None
     yield
-    # Shutdown code (if needed)
+    # Shutdown code: stop the watcher and release pooled connections
+    if watcher is not None:
+        watcher.cancel()
+    await llm_clients.close()
 
 async def load_collections():
-    global cached_hcl_docs, cached_service_docs
     try:
-        # Load data from CSV files using the csv_data module
-        csv_data.load_csv_data()
-        
-        # Copy data from the csv_data module's global variables
-        cached_hcl_docs = csv_data.hcl_data.copy() if csv_data.hcl_data else []
-        cached_service_docs = csv_data.service_data.copy() if csv_data.service_data else []
-        
-        logger.info(f"Cached {len(cached_hcl_docs)} HCL documents and {len(cached_service_docs)} Service documents on startup.")
+        # Load data from the binary stores or CSV files using the csv_data module
+        corpus = await get_corpus()
+        logger.info(f"Loaded {len(corpus.hcl_data)} HCL documents and {len(corpus.service_data)} Service documents on startup.")
     except Exception as e:
         logger.error(f"Error loading collections on startup: {e}")
 
+async def watch_corpus(interval: float):
+    """
+    Reload the corpus in the background when the data files change.
+    
+    A change is only acted on once the files have stayed the same for one
+    more interval, so a store that is still being written is not loaded.
+    """
+    pending = None
+    while True:
+        await asyncio.sleep(interval)
+        fingerprint = await asyncio.to_thread(csv_data.data_fingerprint)
+        if fingerprint == csv_data.current_corpus().fingerprint:
+            pending = None
+        elif fingerprint != pending:
+            pending = fingerprint
+        else:
+            pending = None
+            logger.info(f"Data files changed (fingerprint {fingerprint}); reloading corpus")
+            try:
+                await asyncio.wrap_future(csv_data.reload_corpus())
+            except Exception as e:
+                logger.error(f"Corpus reload failed, still serving version {csv_data.current_corpus().version}: {e}")
+
 app = FastAPI(
     title="ITFest 2025 API",
     description="API for answering questions based on HCL and Service data",
@@ -239,38 +402,183 @@ async def root():
     """Root endpoint to check if the API is running."""
     return {"message": "ITFest 2025 API is running"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the caches and per-endpoint embedding batch metrics."""
+    return {
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "embedding_batches": {endpoint: b.metrics.stats() for endpoint, b in _embedding_batchers.items()},
+    }
+
 @app.get("/askCombined", response_model=QuestionResponse)
-async def ask_combined(question: str):
+async def ask_combined(question: str, adopted_after: Optional[date] = None, adopted_before: Optional[date] = None,
+                       service_ids: Optional[List[str]] = Query(None)):
     """
     Ask a question and get a response based on data from both HCL and Service documents.
     
     Args:
         question (str): The user's question.
+        adopted_after (Optional[date]): Only use HCLs adopted on or after this date.
+        adopted_before (Optional[date]): Only use HCLs adopted on or before this date.
+        service_ids (Optional[List[str]]): Only use these services.
         
     Returns:
         QuestionResponse: The response from the AI model.
     """
     try:
-        # Get best matches from both collections
-        best_hcl_docs = get_best_hcl(question)
-        best_service_docs = get_best_services(question)
-        print(f"besthcl:{best_hcl_docs} \n\n\n\n bestservice:{best_service_docs}")
-        if not best_hcl_docs and not best_service_docs:
-            return {"response": "No relevant documents found for your question."}
+        # The whole request uses one corpus snapshot, even if a reload swaps in a new one meanwhile
+        corpus = await get_corpus()
+        hcl_filters, service_filters = search_filters(adopted_after, adopted_before, service_ids)
+        # Cached answers were built from unfiltered retrieval
+        use_answer_cache = hcl_filters is None and service_filters is None
         
-        # Combine content from both sources
-        hcl_content = get_hcl_content(best_hcl_docs)
-        service_content = get_service_content(best_service_docs)
-        combined_content = hcl_content + "\n\n" + service_content
+        # A near-duplicate of an already answered question gets the cached answer
+        question_embedding = await embed_query(question, HCL_COLLECTION) if use_answer_cache else None
+        if question_embedding:
+            cached = answer_cache.lookup(question_embedding, corpus.fingerprint)
+            if cached:
+                logger.info(f"Answer cache hit (similarity {cached['similarity']:.3f})")
+                return {"response": cached["response"]}
         
-        # Get response
-        response_text = get_response(question, combined_content)
+        # HCL and service retrieval are independent and run concurrently; generation needs both
+        results = await run_graph({
+            "hcl_rows": Stage(lambda: get_best_hcl(question, corpus=corpus, filters=hcl_filters),
+                              timeout=RETRIEVAL_STAGE_TIMEOUT, fallback=[], propagate=(RateLimitExceeded,)),
+            "service_rows": Stage(lambda: get_best_services(question, corpus=corpus, filters=service_filters),
+                                  timeout=RETRIEVAL_STAGE_TIMEOUT, fallback=[], propagate=(RateLimitExceeded,)),
+            "context": Stage(lambda hcl_rows, service_rows: get_context(corpus, hcl_rows, service_rows),
+                             deps=("hcl_rows", "service_rows")),
+            "response": Stage(
+                lambda context: answer_from_documents(question, context),
+                deps=("context",),
+                timeout=GENERATION_STAGE_TIMEOUT,
+            ),
+        })
+        response_text, context = results["response"], results["context"]
+        logger.debug("Context documents: %s", context.documents)
+        if response_text is None:
+            return {"response": "No relevant documents found for your question."}
         
-        return {"response": response_text}
+        if question_embedding and not response_text.startswith("Error generating response"):
+            # The documents that made it into the context are the ones the answer depends on
+            doc_ids = context.documents
+            answer_cache.store(question_embedding, response_text, doc_ids, corpus.fingerprint)
+        
+        return {"response": response_text, "context_tokens": context.tokens}
+    except RateLimitExceeded as e:
+        logger.error(f"askCombined rate limited: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         logger.error(f"Error in askCombined endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/askCombined/stream")
+async def ask_combined_stream(question: str, adopted_after: Optional[date] = None,
+                              adopted_before: Optional[date] = None, service_ids: Optional[List[str]] = Query(None)):
+    """
+    Streaming variant of /askCombined: the answer is sent as server-sent events
+    (token events, then a done event with the full response).
+    
+    Args:
+        question (str): The user's question.
+        adopted_after (Optional[date]): Only use HCLs adopted on or after this date.
+        adopted_before (Optional[date]): Only use HCLs adopted on or before this date.
+        service_ids (Optional[List[str]]): Only use these services.
+    """
+    hcl_filters, service_filters = search_filters(adopted_after, adopted_before, service_ids)
+    use_answer_cache = hcl_filters is None and service_filters is None
+    
+    async def events():
+        timer = stream_metrics.start()
+        try:
+            corpus = await get_corpus()
+            question_embedding = await embed_query(question, HCL_COLLECTION) if use_answer_cache else None
+            if question_embedding:
+                cached = answer_cache.lookup(question_embedding, corpus.fingerprint)
+                if cached:
+                    timer.first_token()
+                    yield sse_event("token", {"text": cached["response"]})
+                    yield sse_event("done", {"response": cached["response"], "cached": True})
+                    timer.finish()
+                    return
+            
+            results = await run_graph({
+                "hcl_rows": Stage(lambda: get_best_hcl(question, corpus=corpus, filters=hcl_filters),
+                                  timeout=RETRIEVAL_STAGE_TIMEOUT, fallback=[], propagate=(RateLimitExceeded,)),
+                "service_rows": Stage(lambda: get_best_services(question, corpus=corpus, filters=service_filters),
+                                      timeout=RETRIEVAL_STAGE_TIMEOUT, fallback=[], propagate=(RateLimitExceeded,)),
+            })
+            context = get_context(corpus, results["hcl_rows"], results["service_rows"])
+            if not context.documents:
+                response_text = "No relevant documents found for your question."
+                timer.first_token()
+                yield sse_event("token", {"text": response_text})
+                yield sse_event("done", {"response": response_text})
+                timer.finish()
+                return
+            
+            parts = []
+            async for text in stream_response(question, context.text):
+                timer.first_token()
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            response_text = "".join(parts)
+            
+            if question_embedding:
+                doc_ids = context.documents
+                answer_cache.store(question_embedding, response_text, doc_ids, corpus.fingerprint)
+            yield sse_event("done", {"response": response_text, "context": context.stats()})
+            timer.finish()
+        except Exception as e:
+            logger.error(f"Error in askCombined stream: {e}")
+            timer.finish(failed=True)
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/admin/reload")
+async def reload_corpus(x_admin_token: Optional[str] = Header(None)):
+    """
+    Load the corpus from the data files in the background and swap it in.
+    Requests already running finish on the previous version; concurrent
+    calls share one reload. Requires the X-Admin-Token header to match ADMIN_TOKEN.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Corpus reload is disabled; set ADMIN_TOKEN to enable it")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid X-Admin-Token header")
+    try:
+        corpus = await asyncio.wrap_future(csv_data.reload_corpus())
+    except Exception as e:
+        logger.error(f"Corpus reload failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving version "
+                                                    f"{csv_data.current_corpus().version}: {e}")
+    return corpus.stats()
+
+@app.get("/admin/corpus")
+async def corpus_info():
+    """Version, fingerprint and size of the corpus being served."""
+    return csv_data.current_corpus().stats()
+
+@app.get("/metrics/rate_limits")
+async def rate_limit_metrics():
+    """Queue depth, concurrency limit and 429 counters of the chat and embedding schedulers."""
+    return {
+        "chat": chat_scheduler.stats(),
+        "embeddings": {endpoint: scheduler.stats() for endpoint, scheduler in _embedding_schedulers.items()},
+    }
+
+@app.get("/metrics/context")
+async def context_token_metrics():
+    """Context tokens per request against CONTEXT_TOKEN_BUDGET, and how much retrieved text was cut."""
+    return {"budget": CONTEXT_TOKEN_BUDGET, **context_metrics.stats()}
+
+@app.get("/metrics/streaming")
+async def streaming_metrics():
+    """Time-to-first-token and stream duration percentiles."""
+    return stream_metrics.stats()
+
 
 def main():
     """
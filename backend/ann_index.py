@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+Approximate nearest-neighbour indexes over a normalized embedding matrix.
+
+Two index types are available, both CPU-only:
+    IVFIndex   inverted-file index in pure NumPy (spherical k-means lists),
+               tuned at query time with `nprobe`
+    HNSWIndex  graph index backed by the optional `hnswlib` package,
+               tuned at query time with `ef`
+
+Indexes are built offline from a binary store (see embedding_store.py) and
+saved next to it with a fingerprint of the matrix file they were built from;
+load_csv_data and the hcl_embeddings servers attach them when present and the
+fingerprint still matches. A plain .npy matrix (e.g. hcl_embeddings) works as a store too.
+
+Usage:
+    python ann_index.py build data/hcl_summarized_with_embeddings --kind ivf
+    python ann_index.py report data/hcl_summarized_with_embeddings --k 5
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_index import EmbeddingMatrix, top_k_indices, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are grouped into lists around k-means centroids
+    and a query only scores the rows of its `nprobe` closest lists.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray, nprobe: int = 8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.order = np.asarray(order, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 20,
+              seed: int = 0, nprobe: int = 8) -> "IVFIndex":
+        """
+        Cluster the rows of a normalized matrix with spherical k-means.
+
+        Args:
+            matrix (np.ndarray): The normalized (rows, dim) embedding matrix.
+            n_lists (Optional[int]): Number of lists; defaults to 4 * sqrt(rows).
+            n_iter (int): k-means iterations.
+            seed (int): Random seed for the initial centroids.
+            nprobe (int): Default number of lists scanned per query.
+
+        Returns:
+            IVFIndex: The built index.
+        """
+        n = matrix.shape[0]
+        if n == 0:
+            raise ValueError("Cannot build an IVF index over an empty matrix.")
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        centroids = np.array(matrix[rng.choice(n, n_lists, replace=False)], dtype=np.float32)
+        assign = np.zeros(n, dtype=np.int64)
+        for _ in range(n_iter):
+            assign = _assign(matrix, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, matrix)
+            counts = np.bincount(assign, minlength=n_lists)
+            # Re-seed empty lists with random rows so every list stays useful
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = matrix[rng.choice(n, len(empty), replace=False)]
+            centroids = normalize_rows(sums)
+        assign = _assign(matrix, centroids)
+
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls(centroids, order, offsets, nprobe=nprobe)
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k search for one normalized query.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Matrix row numbers and scores, best first.
+        """
+        nprobe = nprobe or self.nprobe
+        lists = top_k_indices(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+        scores = matrix[candidates] @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=self.kind, centroids=self.centroids, order=self.order,
+                 offsets=self.offsets, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        data = np.load(path)
+        return cls(data["centroids"], data["order"], data["offsets"], nprobe=int(data["nprobe"]))
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """Index of the closest centroid for every row, computed in chunks to bound memory."""
+    assign = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk):
+        assign[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+    return assign
+
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph via `hnswlib`, tuned with `ef` at query time."""
+
+    kind = "hnsw"
+
+    def __init__(self, graph, ef: int = 64):
+        self.graph = graph
+        self.ef = ef
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("HNSW indexes need the optional 'hnswlib' package: pip install hnswlib")
+        return hnswlib
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, M: int = 16, ef_construction: int = 200, ef: int = 64) -> "HNSWIndex":
+        hnswlib = cls._hnswlib()
+        graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        graph.init_index(max_elements=matrix.shape[0], M=M, ef_construction=ef_construction)
+        graph.add_items(np.asarray(matrix), np.arange(matrix.shape[0]))
+        return cls(graph, ef=ef)
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int,
+               ef: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        top_k = min(top_k, self.graph.get_current_count())
+        self.graph.set_ef(max(ef or self.ef, top_k))
+        labels, distances = self.graph.knn_query(query.reshape(1, -1), k=top_k)
+        # hnswlib's inner-product distance is 1 - dot
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def save(self, path: str) -> None:
+        self.graph.save_index(path)
+
+    @classmethod
+    def load(cls, path: str, dim: int, ef: int = 64) -> "HNSWIndex":
+        hnswlib = cls._hnswlib()
+        graph = hnswlib.Index(space="ip", dim=dim)
+        graph.load_index(path)
+        return cls(graph, ef=ef)
+
+
+def ann_path(stem: str, kind: str) -> str:
+    """Path of the ANN index saved next to a binary store."""
+    return f"{stem}.{kind}.npz" if kind == "ivf" else f"{stem}.{kind}.bin"
+
+
+def npy_ann_stem(matrix_path: str) -> str:
+    """Stem of the ANN index kept next to an .npy embedding matrix (the hcl_embeddings servers)."""
+    return os.path.splitext(matrix_path)[0]
+
+
+def matrix_fingerprint(stem: str) -> Dict[str, int]:
+    """Size and modification time of the <stem>.npy matrix an index is built over."""
+    stat = os.stat(f"{stem}.npy")
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save_ann(ann, stem: str) -> str:
+    """
+    Save an index next to a store, with the fingerprint of the store's current matrix.
+
+    Returns:
+        str: The index path.
+    """
+    path = ann_path(stem, ann.kind)
+    ann.save(path)
+    with open(f"{path}.json", "w", encoding="utf-8") as f:
+        json.dump(matrix_fingerprint(stem), f)
+    return path
+
+
+def rebuild_ann(stem: str, matrix: np.ndarray) -> None:
+    """
+    Rebuild any ANN index saved next to a store whose matrix was just rewritten.
+
+    An empty matrix cannot be indexed, so its indexes are deleted instead.
+    """
+    for kind, build in (("ivf", IVFIndex.build), ("hnsw", HNSWIndex.build)):
+        path = ann_path(stem, kind)
+        if not os.path.exists(path):
+            continue
+        if len(matrix):
+            save_ann(build(matrix), stem)
+            logger.info(f"Rebuilt {kind} index {path}")
+        else:
+            for stale in (path, f"{path}.json"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            logger.info(f"Removed {kind} index {path} of an empty store")
+
+
+def _is_current(stem: str, path: str) -> bool:
+    """Whether the index at path was built from the current contents of <stem>.npy."""
+    try:
+        with open(f"{path}.json", encoding="utf-8") as f:
+            return json.load(f) == matrix_fingerprint(stem)
+    except (OSError, ValueError):
+        return False
+
+
+def load_ann(stem: str, dim: int, rows: int):
+    """
+    Load the ANN index saved next to a store, if any.
+
+    IVF is preferred over HNSW when both exist. An index whose matrix
+    fingerprint or row count does not match the store (built before the store
+    was regenerated) is ignored. Query-time parameters can be overridden with
+    the ANN_NPROBE and ANN_EF environment variables.
+
+    Returns:
+        The loaded index, or None if no usable index file exists.
+    """
+    for kind in ("ivf", "hnsw"):
+        path = ann_path(stem, kind)
+        if os.path.exists(path):
+            break
+    else:
+        return None
+    if not _is_current(stem, path):
+        logger.warning(f"Ignoring stale {kind} index {path}: {stem}.npy changed since it was built; "
+                       f"rebuild it with ann_index.py build")
+        return None
+
+    if kind == "ivf":
+        index = IVFIndex.load(path)
+        index.nprobe = int(os.getenv("ANN_NPROBE", index.nprobe))
+        indexed = len(index.order)
+    else:
+        index = HNSWIndex.load(path, dim, ef=int(os.getenv("ANN_EF", 64)))
+        indexed = index.graph.get_current_count()
+    if indexed != rows:
+        logger.warning(f"Ignoring stale {kind} index for {stem}: {indexed} rows indexed, store has {rows}")
+        return None
+    return index
+
+
+def recall_report(index: EmbeddingMatrix, ann, queries: np.ndarray, k: int,
+                  settings: Sequence[int]) -> List[Dict[str, float]]:
+    """
+    Measure recall@k and mean latency of an ANN index against exact search.
+
+    Args:
+        index (EmbeddingMatrix): The exact matrix.
+        ann: An IVFIndex or HNSWIndex built over index.matrix.
+        queries (np.ndarray): Normalized query vectors.
+        k (int): The number of neighbours.
+        settings (Sequence[int]): nprobe (IVF) or ef (HNSW) values to try.
+
+    Returns:
+        List[Dict[str, float]]: One row per setting, plus the exact baseline first.
+    """
+    queries = normalize_rows(queries)
+
+    start = time.perf_counter()
+    exact = [set(top_k_indices(index.matrix @ q, k).tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    rows = [{"setting": 0, "recall": 1.0, "latency_ms": exact_ms}]
+
+    param = "nprobe" if ann.kind == "ivf" else "ef"
+    for value in settings:
+        hits = 0
+        start = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            found, _ = ann.search(index.matrix, q, k, **{param: value})
+            hits += len(truth.intersection(found.tolist()))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append({"setting": value, "recall": hits / (k * len(queries)), "latency_ms": latency_ms})
+    return rows
+
+
+def main():
+    """
+    Build an ANN index from a binary store, or report recall versus latency.
+    """
+    from embedding_store import load_store, store_paths
+
+    parser = argparse.ArgumentParser(description="Build and evaluate ANN indexes over an embedding store.")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("stem", help="binary store path without extension, e.g. data/hcl_summarized_with_embeddings")
+    parser.add_argument("--kind", choices=["ivf", "hnsw"], default="ivf")
+    parser.add_argument("--lists", type=int, default=None, help="IVF: number of lists (default 4*sqrt(rows))")
+    parser.add_argument("--M", type=int, default=16, help="HNSW: graph degree")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW: build-time beam width")
+    parser.add_argument("--k", type=int, default=5, help="report: neighbours per query")
+    parser.add_argument("--queries", type=int, default=200, help="report: number of sampled queries")
+    parser.add_argument("--settings", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="report: nprobe (IVF) or ef (HNSW) values")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if os.path.exists(store_paths(args.stem)[1]):
+        _, index = load_store(args.stem, mmap=False)
+    else:
+        # A plain .npy matrix, as used by the hcl_embeddings servers
+        matrix = np.load(f"{args.stem}.npy")
+        index = EmbeddingMatrix(matrix, np.arange(matrix.shape[0]))
+
+    if args.command == "build":
+        start = time.perf_counter()
+        if args.kind == "ivf":
+            ann = IVFIndex.build(index.matrix, n_lists=args.lists)
+        else:
+            ann = HNSWIndex.build(index.matrix, M=args.M, ef_construction=args.ef_construction)
+        save_ann(ann, args.stem)
+        logger.info(f"Built {args.kind} index over {len(index)} rows in {time.perf_counter() - start:.1f}s")
+        return
+
+    ann = IVFIndex.load(ann_path(args.stem, "ivf")) if args.kind == "ivf" else \
+        HNSWIndex.load(ann_path(args.stem, "hnsw"), index.dim)
+    # Real questions are not stored offline, so probe with perturbed document vectors
+    rng = np.random.default_rng(0)
+    sample = index.matrix[rng.choice(len(index), min(args.queries, len(index)), replace=False)]
+    queries = sample + rng.normal(scale=0.5 / np.sqrt(index.dim), size=sample.shape).astype(np.float32)
+
+    param = "nprobe" if args.kind == "ivf" else "ef"
+    print(f"{param:>8} {'recall@' + str(args.k):>10} {'ms/query':>10}")
+    for row in recall_report(index, ann, queries, args.k, args.settings):
+        label = "exact" if row["setting"] == 0 else str(row["setting"])
+        print(f"{label:>8} {row['recall']:>10.3f} {row['latency_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
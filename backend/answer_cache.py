@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+import os
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def file_fingerprint(*paths: str) -> str:
+    """
+    Corpus version derived from the size and modification time of the data files.
+
+    Missing files are part of the fingerprint too, so switching between the
+    binary store and the CSV fallback changes the version.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        else:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()[:12]
+
+
+class SemanticAnswerCache:
+    """
+    Cache of final answers looked up by question-embedding similarity.
+
+    Embeddings of cached questions live in one preallocated float32 matrix,
+    so a lookup is a single matrix-vector product over the occupied slots.
+    A new question whose cosine similarity to a cached one reaches
+    `threshold` gets that answer. Entries belong to one corpus version and
+    are dropped as soon as a lookup brings a different version; answers
+    stored for any other version than the current one are ignored, so
+    requests still finishing on the previous corpus during a reload cannot
+    reset the cache. When full, the least recently used slot is overwritten.
+    """
+
+    def __init__(self, max_size: int = 512, threshold: float = 0.97):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.corpus_version: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._used = np.zeros(max_size, dtype=bool)
+        self._last_used = np.zeros(max_size, dtype=np.int64)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_size
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return int(self._used.sum())
+
+    def _check_version(self, corpus_version: str) -> None:
+        """Drop every entry if the corpus changed since they were stored. Caller holds the lock."""
+        if corpus_version != self.corpus_version:
+            if self._used.any():
+                self.invalidations += 1
+            self._used[:] = False
+            self._entries = [None] * self.max_size
+            self.corpus_version = corpus_version
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        q = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        return q / norm if norm else None
+
+    def lookup(self, embedding: Sequence[float], corpus_version: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a question embedding.
+
+        Args:
+            embedding (Sequence[float]): The question embedding.
+            corpus_version (str): The version of the corpus currently served.
+
+        Returns:
+            Optional[Dict[str, Any]]: The entry ('response', 'doc_ids', 'similarity')
+            or None on a miss.
+        """
+        q = self._normalize(embedding)
+        with self._lock:
+            self._check_version(corpus_version)
+            if q is None or self._matrix is None or not self._used.any() or q.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+            slots = np.flatnonzero(self._used)
+            scores = self._matrix[slots] @ q
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            slot = slots[best]
+            self._clock += 1
+            self._last_used[slot] = self._clock
+            self.hits += 1
+            return {**self._entries[slot], "similarity": float(scores[best])}
+
+    def store(self, embedding: Sequence[float], response: Any, doc_ids: Sequence[str], corpus_version: str) -> None:
+        """
+        Cache an answer for a question embedding.
+
+        Args:
+            embedding (Sequence[float]): The question embedding.
+            response (Any): The final answer (or response payload) to return on a hit.
+            doc_ids (Sequence[str]): Ids of the documents the answer was built from.
+            corpus_version (str): The version of the corpus the answer was built from.
+        """
+        q = self._normalize(embedding)
+        if q is None:
+            return
+        with self._lock:
+            if self.corpus_version is None:
+                self._check_version(corpus_version)
+            elif corpus_version != self.corpus_version:
+                # Built from a corpus that is no longer (or not yet) the one served
+                return
+            if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                self._matrix = np.zeros((self.max_size, q.shape[0]), dtype=np.float32)
+                self._used[:] = False
+            free = np.flatnonzero(~self._used)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._matrix[slot] = q
+            self._entries[slot] = {"response": response, "doc_ids": list(doc_ids)}
+            self._used[slot] = True
+            self._clock += 1
+            self._last_used[slot] = self._clock
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "corpus_version": self.corpus_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Process-wide answer cache shared by every request in the same server
+answer_cache = SemanticAnswerCache(
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97")),
+)
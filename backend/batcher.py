@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Micro-batching dispatchers for embedding calls.
+
+Requests arriving within `max_wait_ms` of each other (or until
+`max_batch_size` is reached) are sent as one batch, and each caller gets
+back its own result. Two flavours share the same metrics:
+    MicroBatcher          asyncio, for the async backend (one embeddings request per batch)
+    ThreadedMicroBatcher  worker thread, for sync FastAPI endpoints running in the
+                          threadpool (one sim_model.encode call per batch)
+"""
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+
+class BatchMetrics:
+    """Per-batch size and queueing-delay counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_size = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.size_histogram: Dict[int, int] = {}
+
+    def record(self, size: int, waits_ms: Sequence[float]) -> None:
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.max_batch_size = max(self.max_batch_size, size)
+            self.total_wait_ms += sum(waits_ms)
+            self.max_wait_ms = max(self.max_wait_ms, max(waits_ms, default=0.0))
+            self.size_histogram[size] = self.size_histogram.get(size, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "mean_wait_ms": self.total_wait_ms / self.items if self.items else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+                "size_histogram": dict(sorted(self.size_histogram.items())),
+            }
+
+
+def _dedupe(items: List[Any]):
+    """Unique items in order, plus the position of every item in that list."""
+    positions: Dict[Any, int] = {}
+    for item in items:
+        positions.setdefault(item, len(positions))
+    return list(positions), [positions[item] for item in items]
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from coroutines and processes them with one
+    `batch_fn(items) -> results` call per batch. Identical items in a batch
+    are sent once.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int = 16, max_wait_ms: float = 10.0, name: str = ""):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.metrics = BatchMetrics()
+        self._pending: List[tuple] = []
+        self._timer = None
+        # The event loop only keeps weak references to tasks, so in-flight batches are held here
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result from the next batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.monotonic()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple]) -> None:
+        started = time.monotonic()
+        self.metrics.record(len(batch), [(started - queued) * 1000 for _, _, queued in batch])
+        unique, positions = _dedupe([item for item, _, _ in batch])
+        try:
+            results = await self.batch_fn(unique)
+            if len(results) != len(unique):
+                raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(unique)} items")
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), position in zip(batch, positions):
+            if not future.done():
+                future.set_result(results[position])
+
+
+class ThreadedMicroBatcher:
+    """
+    Thread-based variant for synchronous callers: a daemon worker drains the
+    queue into batches and runs `batch_fn(items) -> results` once per batch.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 10.0, name: str = ""):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.metrics = BatchMetrics()
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the returned Future resolves when its batch completes."""
+        future: Future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, items: List[Any]) -> List[Any]:
+        """Submit several items and block until all of them are processed."""
+        return [future.result() for future in [self.submit(item) for item in items]]
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch: List[tuple]) -> None:
+        started = time.monotonic()
+        self.metrics.record(len(batch), [(started - queued) * 1000 for _, _, queued in batch])
+        unique, positions = _dedupe([item for item, _, _ in batch])
+        try:
+            results = self.batch_fn(unique)
+            if len(results) != len(unique):
+                raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(unique)} items")
+        except Exception as e:
+            logger.error(f"Batch {self.name} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), position in zip(batch, positions):
+            future.set_result(results[position])
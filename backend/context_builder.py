@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Token-budgeted assembly of the document context sent with each chat prompt.
+
+Retrieved documents are taken in rank order, alternating between the
+collections (best HCL, best service, second HCL, ...), until the budget is
+spent. A sentence already included from a better-ranked document is not
+repeated, and the document that crosses the budget is cut at a sentence
+boundary (between words when not even its first sentence fits), so the
+prompt size is bounded however long the source texts are.
+
+Token counts use tiktoken's gpt-4o encoding when the optional 'tiktoken'
+package is installed, otherwise about four characters per token.
+"""
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from metrics_window import percentile, sample_window
+
+logger = logging.getLogger(__name__)
+
+# tiktoken encoding of the chat model (gpt-4o)
+TOKEN_ENCODING = "o200k_base"
+
+# Sentences shorter than this are never treated as duplicates ("Art. 1.", "Se aprobă.")
+MIN_DEDUP_CHARS = 40
+
+# A sentence ends at . ! ? or ; followed by a capital letter (so "Art. 1", "nr. 12", "alin. (2)" stay whole), or at a line break
+_SENTENCE_END = re.compile(r"[.!?;]\s+(?=[\"„«]?[A-ZĂÂÎȘŞȚŢ])")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        logger.info(f"tiktoken unavailable ({e}); estimating context tokens as characters / 4")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of a text for the chat model (estimated when tiktoken is not installed)."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text, ending between words, that fits in max_tokens ("" if none does)."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding()
+    if encoding is None:
+        prefix = text[:(max_tokens - 1) * 4]
+    else:
+        prefix = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    if prefix == text:
+        return text
+    # Drop the word the cut landed in (and any character split across tokens)
+    words = prefix.split()[:-1]
+    while words and count_tokens(" ".join(words)) > max_tokens:
+        words.pop()
+    return " ".join(words)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text at sentence ends and line breaks, dropping empty pieces."""
+    sentences = []
+    for line in text.splitlines():
+        start = 0
+        for match in _SENTENCE_END.finditer(line):
+            sentences.append(line[start:match.start() + 1].strip())
+            start = match.end()
+        sentences.append(line[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def _dedup_key(sentence: str) -> Optional[str]:
+    if len(sentence) < MIN_DEDUP_CHARS:
+        return None
+    return " ".join(sentence.casefold().split())
+
+
+class ContextDocument:
+    """
+    One document as prompt text: a header that is always kept whole
+    (identifiers, dates, links) and a body that may be cut between sentences.
+    Built once per document when the corpus loads (see csv_data), so a request
+    only joins precomputed text and adds up precomputed token counts.
+
+    Args:
+        doc_id (str): The document id, reported for included documents.
+        header (str): Text before the body, ending with the body's label.
+        body (str): The long free-text field.
+    """
+
+    def __init__(self, doc_id: str, header: str, body: str):
+        self.doc_id = doc_id
+        self.header = header
+        self.body = body
+        self.header_tokens = count_tokens(header)
+        self.sentences = split_sentences(body)
+        self.sentence_tokens = [count_tokens(sentence) + 1 for sentence in self.sentences]
+        self.keys = [_dedup_key(sentence) for sentence in self.sentences]
+        self.tokens = self.header_tokens + sum(self.sentence_tokens)
+        # The whole rendering, used as-is when nothing is cut or repeated
+        self.text = header + " ".join(self.sentences) + "\n\n"
+
+
+class ContextResult:
+    """The assembled context and what it took to fit the budget."""
+
+    def __init__(self, text: str, tokens: int, budget: int, documents: List[str],
+                 truncated: int, dropped: int, duplicates: int, source_tokens: int):
+        self.text = text
+        self.tokens = tokens
+        self.budget = budget
+        self.documents = documents
+        self.truncated = truncated
+        self.dropped = dropped
+        self.duplicates = duplicates
+        self.source_tokens = source_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "source_tokens": self.source_tokens,
+            "documents": len(self.documents),
+            "truncated": self.truncated,
+            "dropped": self.dropped,
+            "duplicate_sentences": self.duplicates,
+        }
+
+
+def build_context(rankings: Sequence[Sequence[ContextDocument]], budget: int) -> ContextResult:
+    """
+    Fill a token budget from ranked documents of one or more collections.
+
+    Args:
+        rankings (Sequence[Sequence[ContextDocument]]): One list per collection, best first.
+        budget (int): Maximum tokens of context.
+
+    Returns:
+        ContextResult: The context, with each collection's documents kept
+        together in rank order and the collections separated by a blank line.
+    """
+    # Rank order across collections: every collection's best document before any second-best
+    order = []
+    for rank in range(max((len(ranking) for ranking in rankings), default=0)):
+        for collection, ranking in enumerate(rankings):
+            if rank < len(ranking):
+                order.append((collection, ranking[rank]))
+    blocks: List[List[str]] = [[] for _ in rankings]
+    seen = set()
+    included: List[str] = []
+    used = truncated = dropped = duplicates = 0
+
+    for collection, doc in order:
+        cost = doc.header_tokens
+        if used + cost > budget:
+            dropped += 1
+            continue
+        sentences = []
+        keys = []
+        cut = False
+        for sentence, tokens, key in zip(doc.sentences, doc.sentence_tokens, doc.keys):
+            if key is not None and (key in seen or key in keys):
+                duplicates += 1
+                continue
+            if used + cost + tokens > budget:
+                if not sentences:
+                    # Not even one whole sentence fits: keep the head of this one
+                    head = truncate_to_tokens(sentence, budget - used - cost - 1)
+                    if head:
+                        sentences.append(head)
+                        keys.append(None)
+                        cost += count_tokens(head) + 1
+                cut = True
+                break
+            sentences.append(sentence)
+            keys.append(key)
+            cost += tokens
+        # A header whose whole body was cut (or repeated elsewhere) is not worth its tokens
+        if doc.sentences and not sentences:
+            dropped += 1
+            continue
+        truncated += cut
+        seen.update(key for key in keys if key is not None)
+        used += cost
+        included.append(doc.doc_id)
+        if len(sentences) == len(doc.sentences):
+            blocks[collection].append(doc.text)
+        else:
+            blocks[collection].append(doc.header + " ".join(sentences) + "\n\n")
+
+    text = "\n\n".join("\n".join(block) for block in blocks)
+    return ContextResult(text, used, budget, included, truncated, dropped, duplicates,
+                         sum(doc.tokens for _, doc in order))
+
+
+class ContextMetrics:
+    """Context tokens used per request, over the last `window` requests, plus lifetime counts."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._tokens = sample_window(window)
+        self.requests = 0
+        self.truncated = 0
+        self.dropped = 0
+        self.source_tokens = 0
+        self.tokens = 0
+
+    def record(self, result: ContextResult) -> None:
+        with self._lock:
+            self.requests += 1
+            self.truncated += result.truncated
+            self.dropped += result.dropped
+            self.source_tokens += result.source_tokens
+            self.tokens += result.tokens
+            self._tokens.append(result.tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_p50": percentile(self._tokens, 0.50),
+                "tokens_p95": percentile(self._tokens, 0.95),
+                "tokens_max": max(self._tokens, default=0),
+                "truncated_documents": self.truncated,
+                "dropped_documents": self.dropped,
+                # Share of the retrieved text that made it into prompts
+                "kept_ratio": self.tokens / self.source_tokens if self.source_tokens else 1.0,
+            }
+
+
+# Process-wide context metrics of this server
+context_metrics = ContextMetrics()
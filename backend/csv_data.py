@@ -2,13 +2,19 @@
 import os
 import json
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional, Union
+from typing import Callable, Dict, List, Any, Optional, Sequence, Tuple, Union
 from dotenv import load_dotenv
 import ast
-# Import utility functions
-from utils import cosine_similarity
+from vector_index import EmbeddingMatrix, EMBEDDING_FIELD
+from embedding_store import load_store, store_is_fresh
+from ann_index import load_ann
+from answer_cache import file_fingerprint
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from context_builder import ContextDocument
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,62 +24,494 @@ logger = logging.getLogger(__name__)
 HCL_CSV_PATH = "data/hcl_summarized_with_embeddings.csv"
 SERVICE_CSV_PATH = "data/ServicesEmbedings.csv"
 
-# Global variables to store data
+# Binary stores built from the CSVs by embedding_store.py (path without extension)
+HCL_STORE_PATH = "data/hcl_summarized_with_embeddings"
+SERVICE_STORE_PATH = "data/ServicesEmbedings"
+
+# Optional quantized scan mode for the embedding matrices: "int8", "float16" or empty for float32
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "")
+
+# Text fields indexed for BM25 search, with their weights
+HCL_TEXT_FIELDS = {"HCL": 2.0, "motivatie_articole": 1.0}
+SERVICE_TEXT_FIELDS = {"name": 2.0, "Service_text": 1.0}
+
+# Fields with hash indexes for equality lookups (search_hcl_documents / search_service_documents)
+HCL_INDEXED_FIELDS = ("_id", "HCL")
+SERVICE_INDEXED_FIELDS = ("_id", "service_id", "name")
+
+# Fields that vector_search can range-filter ($gt/$gte/$lt/$lte), and how their values compare
+HCL_RANGE_FIELDS = {"dataAdoptarii": "date"}
+SERVICE_RANGE_FIELDS = {"service_id": "number"}
+
+RANGE_OPERATORS = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+# Candidates taken from each of the vector and BM25 rankings before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# Global variables to store data (mirrors of the current snapshot, kept for existing callers)
 hcl_data = None
 service_data = None
 
-def load_csv_data():
+# Pre-normalized embedding matrices, one per collection
+hcl_index = None
+service_index = None
+
+# Fingerprint of the data files behind the loaded corpus (used to invalidate cached answers)
+corpus_version = None
+
+_MISSING = object()
+
+class FieldIndex:
     """
-    Load data from CSV files into global variables.
-    This function should be called at the start of the FastAPI application.
+    Hash index from the values of one field to the positions of the documents
+    holding them. Documents without the field (or with a NaN or unhashable
+    value, which never compare equal anyway) are not indexed.
     """
-    global hcl_data, service_data
     
-    logger.info("Loading data from CSV files...")
+    def __init__(self, docs: List[Dict[str, Any]], field: str):
+        positions: Dict[Any, List[int]] = {}
+        for i, doc in enumerate(docs):
+            value = doc.get(field, _MISSING)
+            if value is _MISSING or value != value:
+                continue
+            try:
+                positions.setdefault(value, []).append(i)
+            except TypeError:
+                continue
+        self.field = field
+        self.postings = {value: frozenset(rows) for value, rows in positions.items()}
+        self.ordered = {value: tuple(rows) for value, rows in positions.items()}
+    
+    def lookup(self, value: Any) -> frozenset:
+        try:
+            return self.postings.get(value, frozenset())
+        except TypeError:
+            return frozenset()
+
+def hcl_prompt_parts(doc: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Id, header and body of an HCL document as it appears in the prompt context."""
+    header = f"HCL: {doc.get('HCL', 'N/A')}\n"
+    header += f"Data adoptării: {doc.get('dataAdoptarii', 'N/A')}\n"
+    header += "Motivație și articole: "
+    return str(doc.get('_id')), header, str(doc.get('motivatie_articole', 'N/A'))
+
+def service_prompt_parts(doc: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Id, header and body of a service document as it appears in the prompt context."""
+    header = f"Service ID: {doc.get('service_id', 'N/A')}\n"
+    header += f"Name: {doc.get('name', 'N/A')}\n"
+    header += f"URL: {doc.get('url', 'N/A')}\n"
+    header += f"Lista mentiuni: {doc.get('Lista_mentiuni', 'N/A')}\n"
+    header += f"Querry HCL: {doc.get('QuerryHCL', 'N/A')}\n"
+    header += "Service text: "
+    return str(doc.get('_id')), header, str(doc.get('Service_text', 'N/A'))
+
+def render_context_documents(docs: List[Dict[str, Any]], parts: Callable[[Dict[str, Any]], Tuple[str, str, str]],
+                             previous: Sequence[ContextDocument] = ()) -> List[ContextDocument]:
+    """
+    Render every document of a collection for the prompt once, with its
+    sentence split and token counts, so requests only join precomputed text.
     
-    # Load HCL data
-    try:
-        hcl_df = pd.read_csv(HCL_CSV_PATH)
-        logger.info(f"Loaded {len(hcl_df)} HCL records from {HCL_CSV_PATH}")
+    Args:
+        docs (List[Dict[str, Any]]): The collection, by position.
+        parts (Callable): hcl_prompt_parts or service_prompt_parts.
+        previous (Sequence[ContextDocument]): The rendering of the last loaded
+            corpus; unchanged documents reuse it instead of being re-counted.
         
-        # Convert string embeddings to lists if needed using ast.literal_eval
-        if 'embedings' in hcl_df.columns and isinstance(hcl_df['embedings'].iloc[0], str):
-            hcl_df['embedings'] = hcl_df['embedings'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    Returns:
+        List[ContextDocument]: One rendering per document position.
+    """
+    reusable = {(d.doc_id, d.header, d.body): d for d in previous}
+    rendered = []
+    for doc in docs:
+        key = parts(doc)
+        rendered.append(reusable.get(key) or ContextDocument(*key))
+    return rendered
+
+class FilterColumn:
+    """
+    One field as a float64 array over document positions, for vectorized range
+    filters: dates as days since the epoch, other fields as numbers. Missing or
+    unparseable values are NaN and fall outside every range.
+    """
+    
+    def __init__(self, docs: List[Dict[str, Any]], field: str, kind: str):
+        self.field = field
+        self.kind = kind
+        self.values = self.convert([doc.get(field) for doc in docs])
+    
+    def convert(self, values: List[Any]) -> np.ndarray:
+        series = pd.Series(values, dtype=object)
+        if self.kind == "date":
+            # ISO strings first, so "2021-03-04" is never read day-first as 3 April
+            dates = pd.to_datetime(series, errors="coerce", format="ISO8601")
+            retry = dates.isna() & series.notna()
+            if retry.any():
+                dates[retry] = pd.to_datetime(series[retry], errors="coerce", format="mixed", dayfirst=True)
+            return ((dates - pd.Timestamp(0)) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64, na_value=np.nan)
+        return pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    def bound(self, value: Any) -> float:
+        """Convert a filter bound like the column values; ISO dates ("2020-06-01") are read as such."""
+        if self.kind == "date":
+            try:
+                return float(np.datetime64(value, "D").astype(np.int64))
+            except (ValueError, TypeError):
+                pass
+        return float(self.convert([value])[0])
+
+class CorpusSnapshot:
+    """
+    One loaded version of both collections. A snapshot is never modified after
+    it is published, so a query that took it keeps a consistent view while a
+    reload builds and swaps in the next one.
+    """
+    
+    def __init__(self, version: int, fingerprint: Optional[str], hcl_data: List[Dict[str, Any]],
+                 hcl_index: EmbeddingMatrix, service_data: List[Dict[str, Any]], service_index: EmbeddingMatrix,
+                 hcl_lexical: Optional[BM25Index] = None, service_lexical: Optional[BM25Index] = None,
+                 hcl_context: Optional[List[ContextDocument]] = None,
+                 service_context: Optional[List[ContextDocument]] = None):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.hcl_data = hcl_data
+        self.hcl_index = hcl_index
+        self.service_data = service_data
+        self.service_index = service_index
+        self.hcl_lexical = hcl_lexical or BM25Index(HCL_TEXT_FIELDS)
+        self.service_lexical = service_lexical or BM25Index(SERVICE_TEXT_FIELDS)
+        # Prompt renderings by document position (rendered on demand for snapshots built without them)
+        self.hcl_context = hcl_context if hcl_context is not None else render_context_documents(hcl_data, hcl_prompt_parts)
+        self.service_context = (service_context if service_context is not None
+                                else render_context_documents(service_data, service_prompt_parts))
+        # Field indexes are built on first use and belong to this snapshot, so a reload starts fresh
+        self._field_indexes: Dict[Any, FieldIndex] = {}
+        self._field_lock = threading.Lock()
+    
+    def field_index(self, collection_type: str, field: str) -> Optional[FieldIndex]:
+        """Return the hash index on an indexed field, building it on first use; None if the field is not indexed."""
+        indexed = HCL_INDEXED_FIELDS if collection_type.lower() == 'hcl' else SERVICE_INDEXED_FIELDS
+        if field not in indexed:
+            return None
+        key = (collection_type.lower(), field)
+        index = self._field_indexes.get(key)
+        if index is None:
+            with self._field_lock:
+                index = self._field_indexes.get(key)
+                if index is None:
+                    data, _ = self.collection(collection_type)
+                    index = FieldIndex(data or [], field)
+                    self._field_indexes[key] = index
+        return index
+    
+    def filter_column(self, collection_type: str, field: str) -> Optional[FilterColumn]:
+        """Return the range-filter column of a field, building it on first use; None if the field has none."""
+        kinds = HCL_RANGE_FIELDS if collection_type.lower() == 'hcl' else SERVICE_RANGE_FIELDS
+        if field not in kinds:
+            return None
+        key = ("range", collection_type.lower(), field)
+        column = self._field_indexes.get(key)
+        if column is None:
+            with self._field_lock:
+                column = self._field_indexes.get(key)
+                if column is None:
+                    data, _ = self.collection(collection_type)
+                    column = FilterColumn(data or [], field, kinds[field])
+                    self._field_indexes[key] = column
+        return column
+    
+    def filter_mask(self, collection_type: str, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Evaluate structured filters to a boolean array over document positions.
         
-        # Convert DataFrame to list of dictionaries for easier manipulation
-        hcl_data = hcl_df.to_dict('records')
+        Filters use the query syntax of the document search: field -> value for
+        equality, or field -> {"$in": [...]} / {"$gte": low, "$lt": high, ...}.
+        Equality and $in are answered from the field's hash index, ranges from
+        its column array, so no document is visited.
         
-        # Add unique IDs if not present
-        for i, doc in enumerate(hcl_data):
-            if '_id' not in doc:
-                doc['_id'] = str(i)
-    except Exception as e:
-        logger.error(f"Error loading HCL data: {e}")
-        hcl_data = []
-    
-    # Load Service data
-    try:
-        service_df = pd.read_csv(SERVICE_CSV_PATH)
-        logger.info(f"Loaded {len(service_df)} service records from {SERVICE_CSV_PATH}")
+        Args:
+            collection_type (str): 'hcl' or 'service'.
+            filters (Optional[Dict[str, Any]]): The filters, all of which must hold.
+            
+        Returns:
+            Optional[np.ndarray]: The mask, or None when there are no filters.
+            
+        Raises:
+            ValueError: For a field that cannot be filtered that way, an unknown
+                operator or an unparseable bound.
+        """
+        if not filters:
+            return None
+        data, _ = self.collection(collection_type)
+        mask = np.ones(len(data or []), dtype=bool)
+        for field, condition in filters.items():
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            for operator, value in operators.items():
+                if operator in ("$eq", "$in"):
+                    index = self.field_index(collection_type, field)
+                    if index is None:
+                        raise ValueError(f"Cannot filter {collection_type} documents on {field} by equality")
+                    selected = np.zeros(len(mask), dtype=bool)
+                    for item in (value if operator == "$in" else [value]):
+                        selected[list(index.lookup(item))] = True
+                    mask &= selected
+                elif operator in RANGE_OPERATORS:
+                    column = self.filter_column(collection_type, field)
+                    if column is None:
+                        raise ValueError(f"Cannot filter {collection_type} documents on a range of {field}")
+                    bound = column.bound(value)
+                    if np.isnan(bound):
+                        raise ValueError(f"Invalid {column.kind} bound for {field}: {value!r}")
+                    # NaN values (missing or unparseable) compare False, so they are filtered out
+                    mask &= RANGE_OPERATORS[operator](column.values, bound)
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+        return mask
+    
+    def find(self, collection_type: str, query: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        """
+        Documents equal to every field of the query, in corpus order.
         
-        # Convert string embeddings to lists if needed using ast.literal_eval
-        if 'embedings' in service_df.columns and isinstance(service_df['embedings'].iloc[0], str):
-            service_df['embedings'] = service_df['embedings'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+        Indexed fields are answered from their hash indexes, intersecting
+        the posting sets smallest first; other fields are checked on the
+        remaining candidates. Without any indexed field it scans.
+        """
+        data, _ = self.collection(collection_type)
+        if not data:
+            return []
+        indexes = [(self.field_index(collection_type, key), value) for key, value in query.items()]
+        indexed = [(index, value) for index, value in indexes if index is not None]
+        rest = [(key, value) for (index, _), (key, value) in zip(indexes, query.items()) if index is None]
         
-        # Convert DataFrame to list of dictionaries for easier manipulation
-        service_data = service_df.to_dict('records')
+        if not indexed:
+            candidates = range(len(data))
+        elif len(indexed) == 1:
+            index, value = indexed[0]
+            try:
+                candidates = index.ordered.get(value, ())
+            except TypeError:
+                candidates = ()
+        else:
+            postings = sorted((index.lookup(value) for index, value in indexed), key=len)
+            candidates = sorted(frozenset.intersection(*postings))
         
-        # Add unique IDs if not present
-        for i, doc in enumerate(service_data):
-            if '_id' not in doc:
-                doc['_id'] = str(i)
-    except Exception as e:
-        logger.error(f"Error loading service data: {e}")
-        service_data = []
+        results = []
+        for i in candidates:
+            doc = data[i]
+            if all(key in doc and doc[key] == value for key, value in rest):
+                results.append(doc)
+                if len(results) >= limit:
+                    break
+        return results
+    
+    def collection(self, collection_type: str):
+        """Return (documents, index) for 'hcl' or 'service', or (None, None) for an unknown type."""
+        if collection_type.lower() == 'hcl':
+            return self.hcl_data, self.hcl_index
+        if collection_type.lower() == 'service':
+            return self.service_data, self.service_index
+        return None, None
+    
+    def context_documents(self, collection_type: str, rows: Sequence[int]) -> List[ContextDocument]:
+        """Precomputed prompt renderings of the documents at the given positions."""
+        rendered = self.hcl_context if collection_type.lower() == 'hcl' else self.service_context
+        return [rendered[i] for i in rows]
+    
+    def lexical(self, collection_type: str) -> Optional[BM25Index]:
+        """Return the BM25 index for 'hcl' or 'service'."""
+        if collection_type.lower() == 'hcl':
+            return self.hcl_lexical
+        if collection_type.lower() == 'service':
+            return self.service_lexical
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "hcl_documents": len(self.hcl_data),
+            "service_documents": len(self.service_data),
+        }
+
+# The published snapshot; version 0 means nothing has been loaded yet
+_snapshot = CorpusSnapshot(0, None, [], EmbeddingMatrix.from_documents([]), [], EmbeddingMatrix.from_documents([]))
+
+# Single-flight reloads: at most one load runs, concurrent callers share its result
+_reload_lock = threading.Lock()
+_reload_future: Optional[Future] = None
+_reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="corpus-reload")
+
+def read_csv_documents(csv_path: str) -> List[Dict[str, Any]]:
+    """
+    Read a CSV export into a list of document dicts with parsed embeddings.
     
+    Args:
+        csv_path (str): The CSV file to read.
+        
+    Returns:
+        List[Dict[str, Any]]: The documents, each with an '_id'.
+    """
+    df = pd.read_csv(csv_path)
+    
+    # Convert string embeddings to lists if needed using ast.literal_eval
+    if EMBEDDING_FIELD in df.columns and len(df) and isinstance(df[EMBEDDING_FIELD].iloc[0], str):
+        df[EMBEDDING_FIELD] = df[EMBEDDING_FIELD].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    
+    # Convert DataFrame to list of dictionaries for easier manipulation
+    docs = df.to_dict('records')
+    
+    # Add unique IDs if not present
+    for i, doc in enumerate(docs):
+        if '_id' not in doc:
+            doc['_id'] = str(i)
+    
+    return docs
+
+def _load_collection(csv_path: str, store_path: str, label: str):
+    """
+    Load one collection, preferring the binary store over the CSV.
+    
+    Returns:
+        Tuple[List[Dict[str, Any]], EmbeddingMatrix]: The documents and their matrix.
+    """
+    docs, index = _read_collection(csv_path, store_path, label)
+    if EMBEDDING_QUANTIZATION and len(index):
+        index.quantize(EMBEDDING_QUANTIZATION)
+        logger.info(f"Scanning {label} embeddings as {EMBEDDING_QUANTIZATION} codes "
+                    f"({index.codes.nbytes / 1e6:.1f} MB, full matrix {'memory-mapped' if isinstance(index.matrix, np.memmap) else 'in memory'})")
+    return docs, index
+
+def _read_collection(csv_path: str, store_path: str, label: str):
+    """
+    Read one collection's documents and matrix from the binary store or the CSV.
+    """
+    if store_is_fresh(store_path, csv_path):
+        try:
+            docs, index = load_store(store_path)
+            if len(index):
+                index.ann = load_ann(store_path, index.dim, len(index))
+                if index.ann is not None:
+                    logger.info(f"Using {index.ann.kind} ANN index for {label} search")
+            logger.info(f"Loaded {len(docs)} {label} records from {store_path}.npy")
+            return docs, index
+        except Exception as e:
+            logger.warning(f"Could not load {label} store {store_path}, falling back to CSV: {e}")
+    else:
+        logger.info(f"No up-to-date {label} store at {store_path}.npy; run embedding_store.py to build it")
+    
+    docs = read_csv_documents(csv_path)
+    logger.info(f"Loaded {len(docs)} {label} records from {csv_path}")
+    index = EmbeddingMatrix.from_documents(docs)
+    
+    # The matrix holds the vectors now; drop the per-document lists so both load paths look the same
+    for doc in docs:
+        doc.pop(EMBEDDING_FIELD, None)
+    return docs, index
+
+def data_fingerprint() -> str:
+    """Fingerprint of every file a load may read, used to detect corpus changes."""
+    return file_fingerprint(HCL_CSV_PATH, f"{HCL_STORE_PATH}.npy", f"{HCL_STORE_PATH}.meta.json",
+                            SERVICE_CSV_PATH, f"{SERVICE_STORE_PATH}.npy", f"{SERVICE_STORE_PATH}.meta.json")
+
+def current_corpus() -> CorpusSnapshot:
+    """Return the published snapshot. Take it once per request and use it throughout."""
+    return _snapshot
+
+def build_snapshot(strict: bool = True) -> CorpusSnapshot:
+    """
+    Load both collections into a new, unpublished snapshot.
+    
+    Args:
+        strict (bool): Raise if a collection fails to load. Otherwise the
+            collection is left empty, which is what startup has always done.
+        
+    Returns:
+        CorpusSnapshot: The loaded corpus, numbered after the published one.
+    """
+    fingerprint = data_fingerprint()
+    collections = []
+    for csv_path, store_path, label in ((HCL_CSV_PATH, HCL_STORE_PATH, "HCL"),
+                                        (SERVICE_CSV_PATH, SERVICE_STORE_PATH, "service")):
+        try:
+            collections.append(_load_collection(csv_path, store_path, label))
+        except Exception as e:
+            if strict:
+                raise
+            logger.error(f"Error loading {label} data: {e}")
+            collections.append(([], EmbeddingMatrix.from_documents([])))
+    (hcl_docs, hcl_matrix), (service_docs, service_matrix) = collections
+    
+    # Only documents whose text changed since the published snapshot are re-tokenized
+    hcl_lexical = BM25Index(HCL_TEXT_FIELDS).build(hcl_docs, previous=_snapshot.hcl_lexical)
+    service_lexical = BM25Index(SERVICE_TEXT_FIELDS).build(service_docs, previous=_snapshot.service_lexical)
+    
+    # Prompt text and token counts are computed here once, not per request
+    hcl_context = render_context_documents(hcl_docs, hcl_prompt_parts, _snapshot.hcl_context)
+    service_context = render_context_documents(service_docs, service_prompt_parts, _snapshot.service_context)
+    return CorpusSnapshot(_snapshot.version + 1, fingerprint, hcl_docs, hcl_matrix, service_docs, service_matrix,
+                          hcl_lexical, service_lexical, hcl_context, service_context)
+
+def publish_snapshot(snapshot: CorpusSnapshot) -> None:
+    """Make a snapshot current with a single reference swap; queries already running keep the old one."""
+    global _snapshot, hcl_data, service_data, hcl_index, service_index, corpus_version
+    _snapshot = snapshot
+    hcl_data, hcl_index = snapshot.hcl_data, snapshot.hcl_index
+    service_data, service_index = snapshot.service_data, snapshot.service_index
+    corpus_version = snapshot.fingerprint
+    logger.info(f"Corpus version {snapshot.version} live: {len(hcl_index)} HCL rows, "
+                f"{len(service_index)} service rows (fingerprint {snapshot.fingerprint})")
+
+def load_csv_data():
+    """
+    Load HCL and service data into global variables.
+    Uses the memory-mapped binary stores when available and falls back to the CSV files.
+    This function should be called at the start of the FastAPI application.
+    """
+    logger.info("Loading HCL and service data...")
+    publish_snapshot(build_snapshot(strict=False))
     logger.info("Data loading complete")
 
-def vector_search(collection_type: str, embedding: List[float], limit: int = 5) -> List[Dict[str, Any]]:
+def _reload(strict: bool) -> CorpusSnapshot:
+    snapshot = build_snapshot(strict=strict)
+    publish_snapshot(snapshot)
+    return snapshot
+
+def reload_corpus(force: bool = True) -> Future:
+    """
+    Reload the corpus in the background and swap it in when it is ready.
+    
+    Single-flight: while a reload is running, every caller gets that reload's
+    future instead of starting another. If it fails, the current snapshot
+    stays published and the future raises.
+    
+    Args:
+        force (bool): Reload even if the data files have not changed.
+        
+    Returns:
+        Future: Resolves to the published CorpusSnapshot.
+    """
+    global _reload_future
+    with _reload_lock:
+        if _reload_future is not None and not _reload_future.done():
+            return _reload_future
+        if not force and _snapshot.version and _snapshot.fingerprint == data_fingerprint():
+            done: Future = Future()
+            done.set_result(_snapshot)
+            return done
+        # The first load keeps the startup behaviour of serving whatever loaded
+        _reload_future = _reload_executor.submit(_reload, _snapshot.version > 0)
+        return _reload_future
+
+def ensure_loaded() -> Future:
+    """Load the corpus if nothing is published yet (single-flight); resolves to the current snapshot."""
+    if _snapshot.version:
+        done: Future = Future()
+        done.set_result(_snapshot)
+        return done
+    return reload_corpus(force=False)
+
+def vector_search(collection_type: str, embedding: List[float], limit: int = 5,
+                  corpus: Optional[CorpusSnapshot] = None, filters: Optional[Dict[str, Any]] = None,
+                  positions: bool = False) -> Union[List[Dict[str, Any]], List[int]]:
     """
     Performs a vector search using the embedding field.
     
@@ -81,33 +519,71 @@ def vector_search(collection_type: str, embedding: List[float], limit: int = 5)
         collection_type (str): The type of collection to search ('hcl' or 'service').
         embedding (List[float]): The query embedding vector.
         limit (int): The maximum number of documents to return.
+        corpus (Optional[CorpusSnapshot]): The snapshot to search (defaults to the current one).
+        filters (Optional[Dict[str, Any]]): Structured filters (see CorpusSnapshot.filter_mask),
+            e.g. {"dataAdoptarii": {"$gte": "2020-01-01"}} or {"service_id": {"$in": [3, 7]}}.
+        positions (bool): Return the documents' positions in the snapshot instead of the documents.
         
     Returns:
-        List[Dict[str, Any]]: A list of matching documents.
+        Union[List[Dict[str, Any]], List[int]]: A list of matching documents (or their positions).
     """
-    if collection_type.lower() == 'hcl':
-        data = hcl_data
-    elif collection_type.lower() == 'service':
-        data = service_data
-    else:
+    corpus = corpus or _snapshot
+    data, index = corpus.collection(collection_type)
+    if data is None:
         logger.error(f"Invalid collection type: {collection_type}")
         return []
     
-    # Calculate cosine similarity for each document
-    docs_with_scores = []
+    if not data or index is None:
+        return []
+    
+    # Filters are applied before scoring, so only matching rows are scanned and the top-k stays full
+    mask = corpus.filter_mask(collection_type, filters)
     
-    for doc in data:
-        if "embedings" in doc and doc["embedings"]:
-            score = cosine_similarity(embedding, doc["embedings"])
-            docs_with_scores.append((doc, score))
+    # One matrix-vector product over the collection (or the filtered rows), then top-k selection
+    rows, _ = index.search(embedding, limit, mask=None if mask is None else mask[index.row_ids])
     
-    # Sort by similarity score (descending)
-    docs_with_scores.sort(key=lambda x: x[1], reverse=True)
+    if positions:
+        return rows.tolist()
+    return [data[i] for i in rows]
+
+def hybrid_search(collection_type: str, embedding: Optional[List[float]], query: str, limit: int = 5,
+                  corpus: Optional[CorpusSnapshot] = None, filters: Optional[Dict[str, Any]] = None,
+                  positions: bool = False) -> Union[List[Dict[str, Any]], List[int]]:
+    """
+    Combine vector and BM25 search with reciprocal-rank fusion.
     
-    # Get the top documents
-    top_docs = [doc for doc, _ in docs_with_scores[:limit]]
+    Exact references ("HCL 155/2009", a service name) rank high in BM25 even
+    when the embedding ranks them low, so top_k can stay small.
     
-    return top_docs
+    Args:
+        collection_type (str): The type of collection to search ('hcl' or 'service').
+        embedding (Optional[List[float]]): The query embedding; None searches lexically only.
+        query (str): The query text.
+        limit (int): The maximum number of documents to return.
+        corpus (Optional[CorpusSnapshot]): The snapshot to search (defaults to the current one).
+        filters (Optional[Dict[str, Any]]): Structured filters applied to both rankings.
+        positions (bool): Return the documents' positions in the snapshot instead of the documents.
+        
+    Returns:
+        Union[List[Dict[str, Any]], List[int]]: The fused matches (or their positions), best first.
+    """
+    corpus = corpus or _snapshot
+    data, index = corpus.collection(collection_type)
+    if data is None:
+        logger.error(f"Invalid collection type: {collection_type}")
+        return []
+    if not data:
+        return []
+    
+    candidates = max(limit, HYBRID_CANDIDATES)
+    mask = corpus.filter_mask(collection_type, filters)
+    rankings = [corpus.lexical(collection_type).search(query, candidates, mask=mask)[0]]
+    if embedding is not None and index is not None:
+        rankings.insert(0, index.search(embedding, candidates, mask=None if mask is None else mask[index.row_ids])[0])
+    rows = reciprocal_rank_fusion(rankings, limit)
+    if positions:
+        return rows
+    return [data[i] for i in rows]
 
 def search_hcl_documents(query: Dict[str, Any], limit: int = 10) -> List[Dict[str, Any]]:
     """
@@ -120,21 +596,8 @@ def search_hcl_documents(query: Dict[str, Any], limit: int = 10) -> List[Dict[st
     Returns:
         List[Dict[str, Any]]: A list of matching HCL documents.
     """
-    results = []
-    
-    for doc in hcl_data:
-        match = True
-        for key, value in query.items():
-            if key not in doc or doc[key] != value:
-                match = False
-                break
-        
-        if match:
-            results.append(doc)
-            if len(results) >= limit:
-                break
-    
-    return results
+    # Hash-index lookups on the current snapshot instead of comparing every document
+    return _snapshot.find('hcl', query, limit)
 
 def search_service_documents(query: Dict[str, Any], limit: int = 10) -> List[Dict[str, Any]]:
     """
@@ -147,21 +610,8 @@ def search_service_documents(query: Dict[str, Any], limit: int = 10) -> List[Dic
     Returns:
         List[Dict[str, Any]]: A list of matching service documents.
     """
-    results = []
-    
-    for doc in service_data:
-        match = True
-        for key, value in query.items():
-            if key not in doc or doc[key] != value:
-                match = False
-                break
-        
-        if match:
-            results.append(doc)
-            if len(results) >= limit:
-                break
-    
-    return results
+    # Hash-index lookups on the current snapshot instead of comparing every document
+    return _snapshot.find('service', query, limit)
 
 def main():
     """
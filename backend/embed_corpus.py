@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Incremental, resumable embedding of the source documents.
+
+Each document's embedded text (the collection's text fields joined) is
+hashed together with the embedding model's identity. Rows whose hash is
+already in the previous output or in the checkpoint are reused; only new
+or changed documents are sent to the model, in batches admitted by a
+RateLimitScheduler (EMBEDDING_RPM / _TPM / _MAX_CONCURRENCY).
+
+Every finished batch is appended to <out>.checkpoint.jsonl, so an
+interrupted run resumes where it stopped. The checkpoint is removed once
+the output is written. Output formats:
+    store  <out>.npy + <out>.meta.json, loaded by csv_data.py
+    npy    <out>_embeddings.npy + <out>_texts.npy (+ <out>_hashes.json),
+           loaded by the hcl_embeddings servers
+An ANN index already built next to a store is rebuilt for the new rows.
+
+Usage:
+    python embed_corpus.py hcl data/hcl_summarized.csv
+    python embed_corpus.py services data/Services.csv --dry-run
+    python embed_corpus.py hcl hcl.csv --format npy --out ../hcl_embeddings/hcl \\
+        --encoder local:Alibaba-NLP/gte-Qwen2-7B-instruct
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from vector_index import EmbeddingMatrix, EMBEDDING_FIELD, normalize_rows
+from embedding_store import store_paths, write_store
+from ann_index import npy_ann_stem, rebuild_ann
+from rate_limit import PRIORITY_LOW, RateLimited, estimate_tokens, retry_after_seconds, scheduler_from_env
+import csv_data
+
+logger = logging.getLogger(__name__)
+
+# Text fields embedded for each collection, the endpoint settings used for it and its default output
+COLLECTIONS = {
+    "hcl": {
+        "fields": ("HCL", "motivatie_articole"),
+        "endpoint_env": ("ENDPOINT_URL", "API_KEY"),
+        "out": csv_data.HCL_STORE_PATH,
+    },
+    "services": {
+        "fields": ("name", "Service_text"),
+        "endpoint_env": ("ENDPOINT_URL_SERV", "API_KEY_SERV"),
+        "out": csv_data.SERVICE_STORE_PATH,
+    },
+}
+
+
+def document_text(doc: Dict[str, Any], fields: Sequence[str]) -> str:
+    """Join the non-empty text fields of a document into the text that is embedded."""
+    parts = [str(doc[field]).strip() for field in fields if field in doc and pd.notna(doc[field])]
+    return "\n".join(part for part in parts if part)
+
+
+def content_hash(model_id: str, text: str) -> str:
+    """Hash of the embedded text; a different model gives a different hash."""
+    return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+class AzureEmbedder:
+    """Embeds batches with an Azure OpenAI embeddings endpoint, one attempt per scheduler admission."""
+
+    def __init__(self, endpoint_url: str, api_key: str, timeout: float = 60.0):
+        import httpx
+        from utils import https_verify
+
+        self.model_id = endpoint_url
+        self.endpoint_url = endpoint_url
+        self.headers = {"Content-Type": "application/json", "api-key": api_key}
+        self.client = httpx.Client(timeout=timeout, verify=https_verify())
+        self.scheduler = scheduler_from_env("embed_corpus", "EMBEDDING",
+                                            retry_exceptions=(httpx.TimeoutException, httpx.TransportError))
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        def attempt():
+            response = self.client.post(self.endpoint_url, json={"input": texts}, headers=self.headers)
+            if response.status_code == 429:
+                raise RateLimited(retry_after_seconds(response.headers))
+            response.raise_for_status()
+            return [item["embedding"] for item in response.json()["data"]]
+
+        return self.scheduler.submit(attempt, tokens=estimate_tokens(*texts), priority=PRIORITY_LOW)
+
+
+class LocalEmbedder:
+    """Embeds batches with a local SentenceTransformer model, as the hcl_embeddings servers do."""
+
+    def __init__(self, model_name: str):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model_id = f"local:{model_name}"
+        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.model = SentenceTransformer(model_name, trust_remote_code=True).to(self.device)
+
+    def __call__(self, texts: List[str]) -> List[np.ndarray]:
+        return list(self.model.encode(texts, convert_to_numpy=True, device=self.device))
+
+
+def output_paths(out: str, fmt: str) -> Dict[str, str]:
+    if fmt == "store":
+        matrix_path, meta_path = store_paths(out)
+        return {"matrix": matrix_path, "meta": meta_path, "checkpoint": f"{out}.checkpoint.jsonl"}
+    return {
+        "matrix": f"{out}_embeddings.npy",
+        "texts": f"{out}_texts.npy",
+        "hashes": f"{out}_hashes.json",
+        "checkpoint": f"{out}.checkpoint.jsonl",
+    }
+
+
+def load_previous(out: str, fmt: str) -> Dict[str, np.ndarray]:
+    """Embeddings of the previous output, keyed by content hash (empty if there is none)."""
+    paths = output_paths(out, fmt)
+    hashes_path = paths["meta"] if fmt == "store" else paths["hashes"]
+    if not (os.path.exists(paths["matrix"]) and os.path.exists(hashes_path)):
+        return {}
+    with open(hashes_path, encoding="utf-8") as f:
+        data = json.load(f)
+    hashes = data.get("content_hashes") if fmt == "store" else data
+    if not hashes:
+        return {}
+    # Read into memory rather than memory-mapped: the reused rows must not be
+    # views of a file that this run replaces (which fails on Windows)
+    matrix = np.load(paths["matrix"])
+    if len(hashes) != matrix.shape[0]:
+        logger.warning(f"Ignoring previous output {paths['matrix']}: {matrix.shape[0]} rows, {len(hashes)} hashes")
+        return {}
+    return {h: matrix[i] for i, h in enumerate(hashes)}
+
+
+def read_checkpoint(path: str) -> Dict[str, List[float]]:
+    """Embeddings saved by an interrupted run; a partially written last line is ignored."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            done[record["hash"]] = record["embedding"]
+    return done
+
+
+def embed_corpus(docs: List[Dict[str, Any]], fields: Sequence[str], embedder: Callable[[List[str]], Sequence[Any]],
+                 out: str, fmt: str = "store", batch_size: int = 16, workers: int = 4,
+                 source: str = "", dry_run: bool = False) -> Dict[str, int]:
+    """
+    Embed the documents that changed since the last run and write the output files.
+
+    Args:
+        docs (List[Dict[str, Any]]): Source documents; embeddings in them are ignored.
+        fields (Sequence[str]): Text fields that make up each document's embedded text.
+        embedder (Callable): Maps a batch of texts to their embeddings; has a model_id attribute.
+        out (str): Output path without extension.
+        fmt (str): "store" or "npy".
+        batch_size (int): Texts per embedding call.
+        workers (int): Batches sent concurrently (the scheduler still caps in-flight calls).
+        source (str): The source file, recorded in the store metadata.
+        dry_run (bool): Only report what would be embedded.
+
+    Returns:
+        Dict[str, int]: Counts of documents, reused embeddings and embedded texts.
+    """
+    paths = output_paths(out, fmt)
+    texts = [document_text(doc, fields) for doc in docs]
+    rows = [i for i, text in enumerate(texts) if text]
+    hashes = {i: content_hash(embedder.model_id, texts[i]) for i in rows}
+
+    known: Dict[str, Any] = load_previous(out, fmt)
+    reused_from_output = len(set(hashes.values()) & set(known))
+    known.update(read_checkpoint(paths["checkpoint"]))
+
+    pending: Dict[str, str] = {}
+    for i in rows:
+        if hashes[i] not in known:
+            pending.setdefault(hashes[i], texts[i])
+    stats = {
+        "documents": len(docs),
+        "without_text": len(docs) - len(rows),
+        "reused": len(rows) - sum(1 for i in rows if hashes[i] in pending),
+        "from_previous_output": reused_from_output,
+        "to_embed": len(pending),
+    }
+    logger.info(f"{stats['documents']} documents: {stats['reused']} unchanged, {stats['to_embed']} to embed, "
+                f"{stats['without_text']} without text")
+    if dry_run:
+        return stats
+
+    batches = [list(pending.items())[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    lock = threading.Lock()
+    progress = {"done": 0}
+    started = time.perf_counter()
+
+    def run(batch):
+        vectors = embedder([text for _, text in batch])
+        if len(vectors) != len(batch):
+            raise RuntimeError(f"Embedder returned {len(vectors)} vectors for {len(batch)} texts")
+        records = [{"hash": h, "embedding": [float(x) for x in v]} for (h, _), v in zip(batch, vectors)]
+        with lock:
+            with open(paths["checkpoint"], "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            for record in records:
+                known[record["hash"]] = record["embedding"]
+            progress["done"] += len(batch)
+            logger.info(f"Embedded {progress['done']}/{len(pending)} texts "
+                        f"({time.perf_counter() - started:.1f}s)")
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            # list() re-raises the first failure; finished batches stay in the checkpoint
+            list(executor.map(run, batches))
+
+    matrix = normalize_rows(np.asarray([known[hashes[i]] for i in rows], dtype=np.float32)) if rows \
+        else np.zeros((0, 0), dtype=np.float32)
+    row_hashes = [hashes[i] for i in rows]
+    if fmt == "store":
+        index = EmbeddingMatrix(matrix, np.asarray(rows, dtype=np.int64),
+                                [str(docs[i].get("_id", i)) for i in rows], normalized=True)
+        write_store(out, docs, index, source=source, content_hashes=row_hashes)
+    else:
+        np.save(paths["matrix"] + ".tmp.npy", matrix)
+        np.save(paths["texts"] + ".tmp.npy", np.asarray([texts[i] for i in rows], dtype=object))
+        with open(paths["hashes"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(row_hashes, f)
+        os.replace(paths["matrix"] + ".tmp.npy", paths["matrix"])
+        os.replace(paths["texts"] + ".tmp.npy", paths["texts"])
+        os.replace(paths["hashes"] + ".tmp", paths["hashes"])
+        logger.info(f"Wrote {matrix.shape[0]} rows to {paths['matrix']} and {paths['texts']}")
+    # The same stems the readers load an ANN index from: the store, or retrieval.load_text_index
+    rebuild_ann(out if fmt == "store" else npy_ann_stem(paths["matrix"]), matrix)
+
+    if os.path.exists(paths["checkpoint"]):
+        os.remove(paths["checkpoint"])
+    return stats
+
+
+def main():
+    """
+    Embed a collection's source documents incrementally and write the index files.
+    """
+    parser = argparse.ArgumentParser(description="Incrementally embed source documents into binary index files.")
+    parser.add_argument("collection", choices=sorted(COLLECTIONS))
+    parser.add_argument("source", help="CSV file with the source documents")
+    parser.add_argument("--out", help="output path without extension (default: the collection's store path); "
+                                      "with --format npy, the prefix the hcl_embeddings servers load, "
+                                      "e.g. hcl_embeddings/hcl for hcl_embeddings.npy")
+    parser.add_argument("--format", choices=["store", "npy"], default="store")
+    parser.add_argument("--fields", nargs="+", help="text fields to embed (default depends on the collection)")
+    parser.add_argument("--encoder", default="azure",
+                        help="'azure' (the collection's endpoint from .env) or 'local:<sentence-transformers model>'")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="only report how many documents changed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    config = COLLECTIONS[args.collection]
+
+    if args.encoder == "azure":
+        endpoint_var, key_var = config["endpoint_env"]
+        if not os.getenv(endpoint_var) or not os.getenv(key_var):
+            raise SystemExit(f"{endpoint_var} and {key_var} must be set in .env")
+        embedder = AzureEmbedder(os.getenv(endpoint_var), os.getenv(key_var))
+    elif args.encoder.startswith("local:"):
+        embedder = LocalEmbedder(args.encoder[len("local:"):])
+    else:
+        raise SystemExit(f"Unknown encoder {args.encoder!r}")
+
+    docs = csv_data.read_csv_documents(args.source)
+    for doc in docs:
+        doc.pop(EMBEDDING_FIELD, None)
+    stats = embed_corpus(docs, args.fields or config["fields"], embedder, args.out or config["out"],
+                         fmt=args.format, batch_size=args.batch_size, workers=args.workers,
+                         source=args.source, dry_run=args.dry_run)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Binary embedding store for the backend collections.
+
+A store is two files next to each other:
+    <stem>.npy        float32 matrix, one L2-normalized embedding per row
+    <stem>.meta.json  document metadata (every CSV column except the embedding)
+                      plus the row -> document position map
+
+The matrix is memory-mapped on load, so startup cost is reading the JSON
+metadata rather than parsing every embedding string with ast.literal_eval.
+
+Usage:
+    python embedding_store.py              # convert both CSVs in data/
+    python embedding_store.py --compare    # also time CSV vs store loading
+
+Stores can also be produced directly from source documents, re-embedding
+only changed rows, with embed_corpus.py.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ann_index import rebuild_ann
+from vector_index import EmbeddingMatrix, EMBEDDING_FIELD
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+
+
+def store_paths(stem: str) -> Tuple[str, str]:
+    """Return the (matrix, metadata) file paths for a store stem."""
+    return f"{stem}.npy", f"{stem}.meta.json"
+
+
+def store_is_fresh(stem: str, source_path: Optional[str] = None) -> bool:
+    """
+    Check whether a store exists and is not older than its source CSV.
+
+    Args:
+        stem (str): The store path without extension.
+        source_path (Optional[str]): The CSV the store was built from.
+
+    Returns:
+        bool: True if the store can be loaded in place of the CSV.
+    """
+    matrix_path, meta_path = store_paths(stem)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        return False
+    if source_path and os.path.exists(source_path):
+        store_mtime = min(os.path.getmtime(matrix_path), os.path.getmtime(meta_path))
+        return store_mtime >= os.path.getmtime(source_path)
+    return True
+
+
+def write_store(stem: str, docs: List[Dict[str, Any]], index: EmbeddingMatrix, source: str = "",
+                content_hashes: Optional[List[str]] = None) -> None:
+    """
+    Write documents and their embedding matrix as a binary store.
+
+    Args:
+        stem (str): The store path without extension.
+        docs (List[Dict[str, Any]]): The documents, embeddings included or not.
+        index (EmbeddingMatrix): The normalized matrix built from docs.
+        source (str): The file the documents were read from, for reference.
+        content_hashes (Optional[List[str]]): Hash of the embedded text of each
+            row, so embed_corpus.py can reuse unchanged rows.
+    """
+    matrix_path, meta_path = store_paths(stem)
+    documents = [{k: v for k, v in doc.items() if k != EMBEDDING_FIELD} for doc in docs]
+    meta = {
+        "version": STORE_FORMAT_VERSION,
+        "source": source,
+        "rows": len(index),
+        "dim": index.dim if len(index) else 0,
+        "row_ids": index.row_ids.tolist(),
+        "documents": documents,
+    }
+    if content_hashes is not None:
+        meta["content_hashes"] = content_hashes
+
+    # Write to temporary files first so a crash never leaves a half-written store behind
+    np.save(matrix_path + ".tmp.npy", index.matrix)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+    os.replace(matrix_path + ".tmp.npy", matrix_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    logger.info(f"Wrote {len(index)} x {meta['dim']} store to {matrix_path}")
+
+
+def load_store(stem: str, mmap: bool = True) -> Tuple[List[Dict[str, Any]], EmbeddingMatrix]:
+    """
+    Load documents and the embedding matrix from a binary store.
+
+    Args:
+        stem (str): The store path without extension.
+        mmap (bool): Memory-map the matrix instead of reading it into memory.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], EmbeddingMatrix]: The documents (without
+        embeddings) and the collection matrix.
+    """
+    matrix_path, meta_path = store_paths(stem)
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported store version {meta.get('version')} in {meta_path}")
+
+    matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+    docs = meta["documents"]
+    row_ids = np.asarray(meta["row_ids"], dtype=np.int64)
+    if matrix.shape[0] != len(row_ids):
+        raise ValueError(f"Store {matrix_path} has {matrix.shape[0]} rows but {len(row_ids)} row ids")
+
+    doc_ids = [str(docs[i].get("_id", i)) for i in row_ids]
+    if matrix.shape[0] == 0:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    return docs, EmbeddingMatrix(matrix, row_ids, doc_ids, normalized=True)
+
+
+def build_stores() -> None:
+    """Convert the backend CSV files into binary stores, rebuilding their ANN indexes."""
+    import csv_data
+
+    for csv_path, stem in ((csv_data.HCL_CSV_PATH, csv_data.HCL_STORE_PATH),
+                           (csv_data.SERVICE_CSV_PATH, csv_data.SERVICE_STORE_PATH)):
+        docs = csv_data.read_csv_documents(csv_path)
+        index = EmbeddingMatrix.from_documents(docs)
+        write_store(stem, docs, index, source=csv_path)
+        # An index saved next to the old matrix no longer matches it
+        rebuild_ann(stem, index.matrix)
+
+
+def compare_load_times() -> None:
+    """Print how long loading takes from the CSVs and from the binary stores."""
+    import csv_data
+
+    for csv_path, stem in ((csv_data.HCL_CSV_PATH, csv_data.HCL_STORE_PATH),
+                           (csv_data.SERVICE_CSV_PATH, csv_data.SERVICE_STORE_PATH)):
+        start = time.perf_counter()
+        docs = csv_data.read_csv_documents(csv_path)
+        EmbeddingMatrix.from_documents(docs)
+        csv_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_store(stem)
+        store_seconds = time.perf_counter() - start
+
+        print(f"{os.path.basename(csv_path)}: {len(docs)} docs, "
+              f"CSV {csv_seconds:.3f}s, store {store_seconds:.3f}s "
+              f"({csv_seconds / max(store_seconds, 1e-9):.1f}x faster)")
+
+
+def main():
+    """
+    Main function to build the binary stores from the CSV files.
+    """
+    parser = argparse.ArgumentParser(description="Convert embedding CSVs into memory-mappable .npy stores.")
+    parser.add_argument("--compare", action="store_true", help="time CSV loading against store loading")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    build_stores()
+    if args.compare:
+        compare_load_times()
+
+
+if __name__ == "__main__":
+    main()
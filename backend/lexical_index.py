@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+In-process BM25 index over document text fields, and reciprocal-rank fusion.
+
+Embedding search misses exact references such as "HCL 155/2009" or a
+service name; a lexical index catches them. Text is folded the same way
+as cache keys (case, ș/ş/ț/ţ/ă/â/î diacritics, whitespace), split into
+tokens that keep references like 155/2009 whole (and also index their
+parts), filtered for Romanian stop words and lightly stemmed.
+
+Tokenized documents are cached by content hash, so rebuilding the index
+for a reloaded corpus only tokenizes new or changed documents.
+"""
+import re
+import math
+import hashlib
+import logging
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+(?:[/.\-]\w+)*")
+# Combining marks left by NFKD: ș/ş -> s, ț/ţ -> t, ă/â -> a, î -> i
+_COMBINING = re.compile("[\u0300-\u036f]")
+
+STOP_WORDS = frozenset("""
+a ai al ale alt am ar are as asa au ca cand care cat ce cea cei cel cele cu da daca de deci din
+dintr dintre e ea ei el este eu fi fie fost i ii il in inca intr intre iar la le li lor lui m ma
+mai mi mult ne nici noi nu o ori pe pentru prin sa sau se si sunt ta te tot toti un una unei unor
+unui va vor
+""".split())
+
+# Inflectional endings stripped from long alphabetic tokens, longest first
+_SUFFIXES = ("urilor", "ilor", "elor", "ului", "urile", "uri", "ele", "ii", "ul", "le", "lor", "ea", "a", "e", "i")
+_MIN_STEM = 4
+
+
+def fold(text: str) -> str:
+    """Case-fold and strip diacritics, like query_cache.canonicalize_question but regex-based for bulk text."""
+    return _COMBINING.sub("", unicodedata.normalize("NFKD", text.casefold()))
+
+
+@lru_cache(maxsize=1 << 16)
+def _stem(token: str) -> str:
+    if not token.isalpha():
+        return token
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            token = token[:-len(suffix)]
+            break
+    # Article endings leave the plural or feminine vowel behind (cladirile -> cladiri -> cladir)
+    if token[-1] in "aeiu" and len(token) > _MIN_STEM - 1:
+        token = token[:-1]
+    return token
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_terms(token: str) -> Tuple[str, ...]:
+    token = token.strip("_")
+    if not token or token in STOP_WORDS:
+        return ()
+    if token.isalnum():
+        return (_stem(token),)
+    parts = [_stem(part) for part in re.split(r"[/.\-_]", token) if part and part not in STOP_WORDS]
+    return (_stem(token), *parts)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Fold and split text into index terms.
+
+    Args:
+        text (str): Raw document or query text.
+
+    Returns:
+        List[str]: Terms; a compound like "155/2009" yields itself and "155", "2009".
+    """
+    terms: List[str] = []
+    for token in _TOKEN.findall(fold(text)):
+        terms.extend(_token_terms(token))
+    return terms
+
+
+def _field_text(value: Any) -> str:
+    # Empty CSV cells arrive as NaN floats
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over weighted text fields of a document list.
+
+    Args:
+        fields (Mapping[str, float]): Field name -> weight (term counts are scaled by it).
+        k1 (float): Term-frequency saturation.
+        b (float): Document-length normalization.
+    """
+
+    def __init__(self, fields: Mapping[str, float], k1: float = 1.2, b: float = 0.75):
+        self.fields = dict(fields)
+        self.k1 = k1
+        self.b = b
+        self.n_docs = 0
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        self.doc_norm = np.zeros(0, dtype=np.float32)
+        self._terms_by_hash: Dict[str, Counter] = {}
+
+    def _doc_terms(self, doc: Mapping[str, Any]) -> Tuple[str, Counter]:
+        texts = [_field_text(doc.get(field)) for field in self.fields]
+        key = hashlib.sha1("\0".join(texts).encode("utf-8")).hexdigest()
+        terms = self._terms_by_hash.get(key)
+        if terms is None:
+            terms = Counter()
+            for (field, weight), text in zip(self.fields.items(), texts):
+                if text:
+                    for term, count in Counter(tokenize(text)).items():
+                        terms[term] += count * weight
+        return key, terms
+
+    def build(self, docs: Sequence[Mapping[str, Any]], previous: Optional["BM25Index"] = None) -> "BM25Index":
+        """
+        Index documents by position, reusing the tokenization of unchanged
+        documents from `previous` (the index of the last loaded corpus).
+
+        Returns:
+            BM25Index: self, for chaining.
+        """
+        if previous is not None and previous.fields == self.fields:
+            self._terms_by_hash = previous._terms_by_hash
+        cache: Dict[str, Counter] = {}
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        lengths = np.zeros(len(docs), dtype=np.float32)
+        reused = 0
+        for row, doc in enumerate(docs):
+            key, terms = self._doc_terms(doc)
+            reused += key in self._terms_by_hash
+            cache[key] = terms
+            lengths[row] = sum(terms.values())
+            for term, tf in terms.items():
+                rows, tfs = postings.setdefault(term, ([], []))
+                rows.append(row)
+                tfs.append(tf)
+        # Keep only the documents of this corpus in the tokenization cache
+        self._terms_by_hash = cache
+
+        self.n_docs = len(docs)
+        avg_length = float(lengths.mean()) if len(docs) else 0.0
+        self.doc_norm = self.k1 * (1 - self.b + self.b * lengths / max(avg_length, 1e-9))
+        self.postings = {term: (np.asarray(rows, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+                         for term, (rows, tfs) in postings.items()}
+        self.idf = {term: math.log(1 + (self.n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                    for term, (rows, _) in self.postings.items()}
+        logger.info(f"BM25 index: {self.n_docs} documents, {len(self.postings)} terms "
+                    f"({reused} tokenizations reused)")
+        return self
+
+    def search(self, query: str, top_k: int = 5, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best-matching document positions for a text query.
+
+        Args:
+            query (str): The query text.
+            top_k (int): The number of results to return.
+            mask (Optional[np.ndarray]): Boolean array over document positions;
+                documents not set in it are never returned.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Positions and BM25 scores, best first;
+            documents sharing no term with the query are not returned.
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            rows, tfs = entry
+            scores[rows] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.doc_norm[rows])
+            matched = True
+        if not matched:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if mask is not None:
+            scores[~mask] = 0.0
+        rows = top_k_indices(scores, min(top_k, int(np.count_nonzero(scores))))
+        return rows, scores[rows]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], top_k: int, k: int = 60) -> List[int]:
+    """
+    Fuse ranked lists of document positions: score(d) = sum over lists of 1 / (k + rank).
+
+    Args:
+        rankings (Sequence[Sequence[int]]): Each list best first.
+        top_k (int): Number of fused results.
+        k (int): Damping constant; 60 is the usual choice.
+
+    Returns:
+        List[int]: Document positions, best first.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[int(row)] = scores.get(int(row), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Process-wide pooled clients for the embedding and chat-completion endpoints.
+
+The registry is opened once in the FastAPI lifespan and closed on shutdown,
+so every request reuses the same connection pools (and their TLS sessions)
+instead of building a client per call.
+
+Pool settings come from the environment:
+    LLM_MAX_CONNECTIONS      connections per client (default 20)
+    LLM_MAX_KEEPALIVE        idle keep-alive connections kept open (default 10)
+    LLM_KEEPALIVE_EXPIRY     seconds an idle connection is kept (default 60)
+
+Benchmark of per-request clients against the pooled client:
+    python llm_clients.py --benchmark [--requests 200]
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def pool_limits() -> httpx.Limits:
+    """Connection pool limits from the environment."""
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+class LLMClients:
+    """
+    Holds one pooled httpx.AsyncClient for embedding requests and one
+    AsyncAzureOpenAI client (on its own pooled httpx client) for chat completions.
+
+    Args:
+        chat_endpoint (str): Azure OpenAI endpoint for chat completions.
+        chat_api_key (str): Key for the chat endpoint.
+        api_version (str): Azure OpenAI API version.
+        embedding_timeout (float): Request timeout (seconds) for embeddings.
+        chat_timeout (float): Request timeout (seconds) for chat completions.
+        embedding_verify (bool): Whether to verify TLS certificates of the
+            embedding endpoints. The chat client always verifies them.
+        limits (Optional[httpx.Limits]): Pool limits, from the environment by default.
+    """
+
+    def __init__(self, chat_endpoint: str, chat_api_key: str, api_version: str,
+                 embedding_timeout: float = 30.0, chat_timeout: float = 120.0,
+                 embedding_verify: bool = True, limits: Optional[httpx.Limits] = None):
+        self.chat_endpoint = chat_endpoint
+        self.chat_api_key = chat_api_key
+        self.api_version = api_version
+        self.embedding_timeout = embedding_timeout
+        self.chat_timeout = chat_timeout
+        self.embedding_verify = embedding_verify
+        self.limits = limits or pool_limits()
+        self._embedding: Optional[httpx.AsyncClient] = None
+        self._chat = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._embedding is not None
+
+    def open(self) -> None:
+        """Create the pooled clients. Called once at startup."""
+        if self.is_open:
+            return
+        from openai import AsyncAzureOpenAI
+
+        self._embedding = httpx.AsyncClient(timeout=self.embedding_timeout, limits=self.limits,
+                                            verify=self.embedding_verify)
+        self._chat = AsyncAzureOpenAI(
+            api_key=self.chat_api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.chat_endpoint,
+            timeout=self.chat_timeout,
+            # 429s and retries are handled by the shared RateLimitScheduler, not per request
+            max_retries=0,
+            http_client=httpx.AsyncClient(timeout=self.chat_timeout, limits=self.limits, verify=True),
+        )
+        logger.info(f"Opened LLM client pools (max_connections={self.limits.max_connections}, "
+                    f"keepalive={self.limits.max_keepalive_connections}, "
+                    f"expiry={self.limits.keepalive_expiry}s)")
+
+    async def close(self) -> None:
+        """Close both clients and their connection pools. Called once at shutdown."""
+        if self._embedding is not None:
+            await self._embedding.aclose()
+            self._embedding = None
+        if self._chat is not None:
+            await self._chat.close()
+            self._chat = None
+        logger.info("Closed LLM client pools")
+
+    @property
+    def embedding(self) -> httpx.AsyncClient:
+        """The pooled client for embedding endpoints."""
+        if self._embedding is None:
+            raise RuntimeError("LLM clients are not open; call open() at startup")
+        return self._embedding
+
+    @property
+    def chat(self):
+        """The pooled AsyncAzureOpenAI client for chat completions."""
+        if self._chat is None:
+            raise RuntimeError("LLM clients are not open; call open() at startup")
+        return self._chat
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": self.is_open,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+        }
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"data": [{"embedding": [0.0]}]}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def benchmark(requests: int = 200) -> Dict[str, float]:
+    """
+    Compare a client per request (the old get_response behaviour) with the
+    pooled client, against a local keep-alive server so only client overhead
+    is measured. Real endpoints add a TLS handshake to every new connection.
+
+    Returns:
+        Dict[str, float]: Mean milliseconds per request for each mode, plus
+        the cost of constructing an AzureOpenAI client.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/embeddings"
+    payload = {"input": ["întrebare"]}
+
+    try:
+        started = time.perf_counter()
+        for _ in range(requests):
+            async with httpx.AsyncClient() as client:
+                (await client.post(url, json=payload)).raise_for_status()
+        per_request = (time.perf_counter() - started) * 1000 / requests
+
+        registry = LLMClients(url, "key", "2024-02-01")
+        registry.open()
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                (await registry.embedding.post(url, json=payload)).raise_for_status()
+            pooled = (time.perf_counter() - started) * 1000 / requests
+        finally:
+            await registry.close()
+    finally:
+        server.shutdown()
+
+    from openai import AzureOpenAI
+    started = time.perf_counter()
+    for _ in range(20):
+        AzureOpenAI(api_key="key", api_version="2024-02-01", azure_endpoint=url).close()
+    construct = (time.perf_counter() - started) * 1000 / 20
+
+    return {"client_per_request_ms": per_request, "pooled_ms": pooled, "azure_client_construct_ms": construct}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pooled LLM clients")
+    parser.add_argument("--benchmark", action="store_true", help="Compare per-request and pooled clients")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, value in asyncio.run(benchmark(args.requests)).items():
+            print(f"{name}: {value:.2f}")
+    else:
+        parser.print_help()
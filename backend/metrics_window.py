@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Rolling sample windows for the servers' metrics endpoints.
+
+A window keeps the most recent samples in a bounded deque, so recording a
+sample is O(1) however large the window; percentiles are computed from it
+only when stats are read.
+"""
+from collections import deque
+from typing import Deque, Iterable
+
+
+def sample_window(size: int) -> Deque[float]:
+    """An empty window that keeps the most recent `size` samples, dropping the oldest."""
+    return deque(maxlen=size)
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """
+    Nearest-rank percentile of the samples.
+
+    Args:
+        values (Iterable[float]): The samples, e.g. a sample_window.
+        q (float): The quantile, between 0 and 1.
+
+    Returns:
+        float: The percentile, or 0.0 when there are no samples.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Run request pipelines as a dependency graph of stages.
+
+Each stage names the stages it depends on and receives their results as
+keyword arguments. Stages without a dependency between them run
+concurrently, and every stage can have its own timeout and a fallback
+value used when it times out or fails.
+
+    run_graph           asyncio, for coroutine stages (backend/ai.py)
+    run_graph_threaded  thread pool, for blocking stages (hcl_embeddings servers)
+"""
+import time
+import asyncio
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+_NO_FALLBACK = object()
+
+
+class StageTimeout(TimeoutError):
+    """Raised when a stage without a fallback exceeds its timeout."""
+
+
+class Stage:
+    """
+    One pipeline step.
+
+    Args:
+        fn (Callable): Called with the results of `deps` as keyword arguments.
+            May return a value or (for run_graph) an awaitable.
+        deps (Sequence[str]): Names of the stages this one needs.
+        timeout (Optional[float]): Seconds before the stage is abandoned.
+        fallback (Any): Result used if the stage times out or raises. Without
+            one, the error propagates to the caller.
+        propagate (Tuple[Type[BaseException], ...]): Errors that propagate to
+            the caller even when there is a fallback (e.g. RateLimitExceeded,
+            which should fail the request rather than degrade it).
+    """
+
+    def __init__(self, fn: Callable[..., Any], deps: Sequence[str] = (), timeout: Optional[float] = None,
+                 fallback: Any = _NO_FALLBACK, propagate: Tuple[Type[BaseException], ...] = ()):
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+        self.propagate = propagate
+
+    def recover(self, name: str, error: BaseException) -> Any:
+        if self.fallback is _NO_FALLBACK or isinstance(error, self.propagate):
+            if isinstance(error, (asyncio.TimeoutError, FutureTimeoutError)):
+                raise StageTimeout(f"Stage '{name}' timed out after {self.timeout}s") from error
+            raise error
+        logger.warning(f"Stage '{name}' failed ({error!r}); using fallback")
+        return self.fallback
+
+
+def _levels(stages: Dict[str, Stage]) -> List[List[str]]:
+    """Group stages into levels whose members only depend on earlier levels."""
+    for name, stage in stages.items():
+        for dep in stage.deps:
+            if dep not in stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+    levels, done = [], set()
+    while len(done) < len(stages):
+        level = [name for name, stage in stages.items() if name not in done and set(stage.deps) <= done]
+        if not level:
+            raise ValueError(f"Dependency cycle among stages: {sorted(set(stages) - done)}")
+        levels.append(level)
+        done.update(level)
+    return levels
+
+
+async def run_graph(stages: Dict[str, Stage]) -> Dict[str, Any]:
+    """
+    Run coroutine stages, each as soon as its dependencies are done.
+
+    Returns:
+        Dict[str, Any]: The result of every stage by name.
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(name: str) -> Any:
+        stage = stages[name]
+        inputs = {dep: await tasks[dep] for dep in stage.deps}
+        try:
+            result = stage.fn(**inputs)
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, stage.timeout)
+            return result
+        except Exception as e:
+            return stage.recover(name, e)
+
+    for level in _levels(stages):
+        for name in level:
+            tasks[name] = asyncio.ensure_future(run(name))
+    try:
+        results = await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return dict(zip(tasks, results))
+
+
+def run_graph_threaded(stages: Dict[str, Stage], executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+    """
+    Run blocking stages on a thread pool, one dependency level at a time.
+
+    Stages in the same level run concurrently. A stage that times out is
+    abandoned (its thread finishes in the background) and its fallback used.
+
+    Returns:
+        Dict[str, Any]: The result of every stage by name.
+    """
+    results: Dict[str, Any] = {}
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, len(stages)))
+    try:
+        for level in _levels(stages):
+            submitted = {}
+            for name in level:
+                stage = stages[name]
+                inputs = {dep: results[dep] for dep in stage.deps}
+                submitted[name] = (executor.submit(stage.fn, **inputs), time.monotonic())
+            for name, (future, started) in submitted.items():
+                stage = stages[name]
+                remaining = None if stage.timeout is None else max(0.0, stage.timeout - (time.monotonic() - started))
+                try:
+                    results[name] = future.result(timeout=remaining)
+                except Exception as e:
+                    results[name] = stage.recover(name, e)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+    return results
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def canonicalize_question(text: str) -> str:
+    """
+    Canonical form of a question used as a cache key.
+
+    Case-folds, strips diacritics (ș/ş -> s, ț/ţ -> t, ă/â -> a, î -> i) and
+    collapses runs of whitespace, so trivially different spellings of the
+    same question share one entry.
+
+    Args:
+        text (str): The question as typed.
+
+    Returns:
+        str: The canonical key text.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _WHITESPACE.sub(" ", stripped).strip()
+
+
+class TTLCache:
+    """
+    Thread-safe bounded LRU cache whose entries also expire after `ttl_seconds`.
+
+    Hit, miss, eviction and expiry counters are kept for monitoring.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries beyond max_size."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and current size, for the /cache/stats endpoints."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class EmbeddingCache(TTLCache):
+    """Query embeddings keyed on (embedding endpoint or model identity, canonical question)."""
+
+    @staticmethod
+    def key(model_id: str, question: str) -> Tuple[str, str]:
+        return model_id, canonicalize_question(question)
+
+    def get_embedding(self, model_id: str, question: str) -> Optional[Any]:
+        return self.get(self.key(model_id, question))
+
+    def put_embedding(self, model_id: str, question: str, embedding: Any) -> None:
+        self.put(self.key(model_id, question), embedding)
+
+    def get_or_compute(self, model_id: str, question: str, compute: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Return the cached embedding or compute and cache it.
+
+        A falsy result from compute (a failed embedding call) is returned but not cached.
+        """
+        embedding = self.get_embedding(model_id, question)
+        if embedding is None:
+            embedding = compute()
+            if embedding is not None and len(embedding):
+                self.put_embedding(model_id, question, embedding)
+        return embedding
+
+    async def get_or_compute_async(self, model_id: str, question: str,
+                                   compute: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """Async variant of get_or_compute for coroutine-based embedding clients."""
+        embedding = self.get_embedding(model_id, question)
+        if embedding is None:
+            embedding = await compute()
+            if embedding is not None and len(embedding):
+                self.put_embedding(model_id, question, embedding)
+        return embedding
+
+
+# Process-wide cache shared by every caller in the same server
+embedding_cache = EmbeddingCache(
+    max_size=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "86400")),
+)
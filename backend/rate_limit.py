@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+"""
+Shared scheduler for rate-limited Azure OpenAI calls.
+
+Every embedding or chat call goes through a RateLimitScheduler instead of
+retrying on its own. The scheduler admits work in priority order when
+    - the requests-per-minute and tokens-per-minute buckets have room,
+    - fewer than `concurrency_limit` calls are in flight, and
+    - no 429 cooldown is active.
+
+A 429 (from httpx, the openai SDK or a RateLimited raised by the caller)
+pauses the whole scheduler for its Retry-After and halves the concurrency
+limit; successful calls grow the limit back by about one per window (AIMD).
+Throttled work is requeued at its original position, and work that is
+still throttled after `max_retries` raises RateLimitExceeded instead of
+returning an empty result.
+
+Synchronous callers use submit() and coroutines use submit_async(); both
+share the same queue, so one scheduler can serve threads and the event loop.
+Streamed responses go through submit_stream() / submit_stream_async(),
+which hold their slot until the stream is used up or closed.
+
+Limits for a scheduler built by scheduler_from_env(name, prefix) come from
+    {prefix}_RPM              requests per minute (unset: unlimited)
+    {prefix}_TPM              tokens per minute (unset: unlimited)
+    {prefix}_MAX_CONCURRENCY  upper bound on in-flight calls (default 8)
+    {prefix}_MAX_RETRIES      attempts after a 429 (default 5)
+"""
+import os
+import time
+import heapq
+import inspect
+import random
+import asyncio
+import itertools
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_HIGH = 0      # work that finishes an in-progress answer (fusion, streaming)
+PRIORITY_NORMAL = 5    # interactive requests
+PRIORITY_LOW = 10      # background and bulk work (offline embedding)
+
+
+class RateLimited(Exception):
+    """Raised by submitted work when the endpoint answered 429."""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__(f"rate limited (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(RuntimeError):
+    """Work was still rate limited after the scheduler's retries."""
+
+    def __init__(self, name: str, attempts: int, retry_after: float):
+        super().__init__(f"{name}: still rate limited after {attempts} attempts")
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Parse retry-after-ms or Retry-After (seconds or an HTTP date) from response headers."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+def rate_limit_delay(error: BaseException) -> Optional[float]:
+    """Seconds to back off if the error is a 429 (0 if it gave no hint), otherwise None."""
+    if isinstance(error, RateLimited):
+        return error.retry_after or 0.0
+    if getattr(error, "status_code", None) == 429:
+        response = getattr(error, "response", None)
+        return (retry_after_seconds(response.headers) if response is not None else None) or 0.0
+    return None
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token count (about four characters per token) for the TPM bucket."""
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute` units per minute, up to one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (requests larger than the bucket wait for a full one)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "wake", "admitted", "cancelled")
+
+    def __init__(self, priority: int, seq: int, tokens: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.wake = wake
+        self.admitted = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RateLimitScheduler:
+    """
+    Priority queue in front of one rate-limited endpoint (or deployment).
+
+    Args:
+        name (str): Used in logs and stats.
+        requests_per_minute (Optional[float]): RPM budget; None for unlimited.
+        tokens_per_minute (Optional[float]): TPM budget; None for unlimited.
+        max_concurrency (int): Upper bound on in-flight calls.
+        min_concurrency (int): Lower bound the limit shrinks to under 429s.
+        max_retries (int): Retries after a 429 before RateLimitExceeded.
+        retry_exceptions (Tuple[Type[BaseException], ...]): Transient errors
+            (timeouts, dropped connections) retried with jittered backoff.
+        default_retry_after (float): Cooldown when a 429 has no Retry-After.
+    """
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_concurrency: int = 8,
+                 min_concurrency: int = 1, max_retries: int = 5,
+                 retry_exceptions: Tuple[Type[BaseException], ...] = (),
+                 default_retry_after: float = 10.0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.retry_exceptions = retry_exceptions
+        self.default_retry_after = default_retry_after
+
+        self._lock = threading.Lock()
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_due = 0.0
+        self.in_flight = 0
+        self.paused_until = 0.0
+
+        self.admitted = 0
+        self.throttled = 0
+        self.retried = 0
+        self.exhausted = 0
+
+    # Admission
+
+    def _admit_locked(self) -> Optional[float]:
+        """Admit queued work in priority order; return seconds until the head can run, if blocked."""
+        now = time.monotonic()
+        while self._heap:
+            waiter = self._heap[0]
+            if waiter.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            if self.in_flight >= int(self.concurrency_limit):
+                return None  # a release will dispatch again
+            wait = self.paused_until - now
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(waiter.tokens, now))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._heap)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.admitted = True
+            waiter.wake()
+        return None
+
+    def _dispatch(self) -> None:
+        with self._lock:
+            wait = self._admit_locked()
+            if wait is None:
+                return
+            due = time.monotonic() + wait
+            if self._timer is not None and self._timer.is_alive() and self._timer_due <= due:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(wait, self._dispatch)
+            self._timer.daemon = True
+            self._timer_due = due
+            self._timer.start()
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, waiter)
+        self._dispatch()
+
+    def _release(self, retry_after: Optional[float] = None, completed: bool = True) -> None:
+        """Free a slot; a 429 pauses admission and halves the limit, a success grows it."""
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if retry_after is not None:
+                self.throttled += 1
+                # Shrink once per cooldown, not once per call that was already in flight
+                if now >= self.paused_until:
+                    self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+                    logger.warning(f"{self.name}: 429, pausing {retry_after:.1f}s, "
+                                   f"concurrency limit {int(self.concurrency_limit)}")
+                self.paused_until = max(self.paused_until, now + retry_after)
+            elif completed:
+                self.concurrency_limit = min(float(self.max_concurrency),
+                                             self.concurrency_limit + 1.0 / self.concurrency_limit)
+        self._dispatch()
+
+    def _outcome(self, error: BaseException, attempt: int) -> Tuple[Optional[float], Optional[float]]:
+        """(retry_after for a 429, backoff for a transient error); both None means re-raise."""
+        delay = rate_limit_delay(error)
+        if delay is not None:
+            return (delay or self.default_retry_after), None
+        if self.retry_exceptions and isinstance(error, self.retry_exceptions) and attempt < self.max_retries:
+            return None, min(2 ** attempt, 30) * (0.5 + random.random())
+        return None, None
+
+    # Submission
+
+    def _admit(self, seq: int, tokens: int, priority: int) -> None:
+        admitted = threading.Event()
+        self._enqueue(_Waiter(priority, seq, tokens, admitted.set))
+        admitted.wait()
+
+    async def _admit_async(self, seq: int, tokens: int, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(None))
+
+        waiter = _Waiter(priority, seq, tokens, wake)
+        self._enqueue(waiter)
+        try:
+            await admitted
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                was_admitted = waiter.admitted
+            if was_admitted:
+                self._release(completed=False)
+            raise
+
+    def submit(self, fn: Callable[[], Any], tokens: int = 1, priority: int = PRIORITY_NORMAL) -> Any:
+        """
+        Run `fn()` once admitted, retrying on 429 and transient errors.
+
+        Args:
+            fn (Callable[[], Any]): One attempt of the call.
+            tokens (int): Estimated tokens it consumes (see estimate_tokens).
+            priority (int): PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW.
+
+        Returns:
+            Any: The result of fn.
+
+        Raises:
+            RateLimitExceeded: Still rate limited after max_retries.
+        """
+        seq = next(self._seq)
+        retry_after = self.default_retry_after
+        for attempt in range(self.max_retries + 1):
+            self._admit(seq, tokens, priority)
+            try:
+                result = fn()
+            except Exception as e:
+                retry_after, backoff = self._outcome(e, attempt)
+                self._release(retry_after, completed=False)
+                if retry_after is None and backoff is None:
+                    raise
+                if backoff is not None:
+                    self.retried += 1
+                    time.sleep(backoff)
+                continue
+            self._release()
+            return result
+        self.exhausted += 1
+        raise RateLimitExceeded(self.name, self.max_retries + 1, retry_after)
+
+    async def submit_async(self, fn: Callable[[], Awaitable[Any]], tokens: int = 1,
+                           priority: int = PRIORITY_NORMAL) -> Any:
+        """Coroutine variant of submit: `fn()` returns an awaitable for one attempt."""
+        seq = next(self._seq)
+        retry_after = self.default_retry_after
+        for attempt in range(self.max_retries + 1):
+            await self._admit_async(seq, tokens, priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                retry_after, backoff = self._outcome(e, attempt)
+                self._release(retry_after, completed=False)
+                if retry_after is None and backoff is None:
+                    raise
+                if backoff is not None:
+                    self.retried += 1
+                    await asyncio.sleep(backoff)
+                continue
+            except asyncio.CancelledError:
+                self._release(completed=False)
+                raise
+            self._release()
+            return result
+        self.exhausted += 1
+        raise RateLimitExceeded(self.name, self.max_retries + 1, retry_after)
+
+    def submit_stream(self, fn: Callable[[], Iterable[Any]], tokens: int = 1,
+                      priority: int = PRIORITY_NORMAL) -> Iterator[Any]:
+        """
+        Streaming variant of submit: yields the items of `fn()` and keeps the
+        call's slot until they are used up or the generator is closed.
+
+        Errors before the first item are retried like submit. Errors after it
+        cannot be retried (the caller already has part of the answer); they
+        still count as an outcome, so a 429 mid-stream pauses the scheduler,
+        and are re-raised.
+        """
+        seq = next(self._seq)
+        retry_after = self.default_retry_after
+        for attempt in range(self.max_retries + 1):
+            self._admit(seq, tokens, priority)
+            started = False
+            source = None
+            try:
+                source = fn()
+                for item in source:
+                    started = True
+                    yield item
+            except Exception as e:
+                retry_after, backoff = self._outcome(e, attempt)
+                self._release(retry_after, completed=False)
+                if started or (retry_after is None and backoff is None):
+                    raise
+                if backoff is not None:
+                    self.retried += 1
+                    time.sleep(backoff)
+                continue
+            except BaseException:
+                # GeneratorExit: the consumer stopped reading, so the response is abandoned too
+                self._release(completed=False)
+                if hasattr(source, "close"):
+                    source.close()
+                raise
+            self._release()
+            return
+        self.exhausted += 1
+        raise RateLimitExceeded(self.name, self.max_retries + 1, retry_after)
+
+    async def submit_stream_async(self, fn: Callable[[], Awaitable[AsyncIterable[Any]]], tokens: int = 1,
+                                  priority: int = PRIORITY_NORMAL) -> AsyncIterator[Any]:
+        """Coroutine variant of submit_stream: `fn()` returns an awaitable of an async iterable."""
+        seq = next(self._seq)
+        retry_after = self.default_retry_after
+        for attempt in range(self.max_retries + 1):
+            await self._admit_async(seq, tokens, priority)
+            started = False
+            source = None
+            try:
+                source = await fn()
+                async for item in source:
+                    started = True
+                    yield item
+            except Exception as e:
+                retry_after, backoff = self._outcome(e, attempt)
+                self._release(retry_after, completed=False)
+                if started or (retry_after is None and backoff is None):
+                    raise
+                if backoff is not None:
+                    self.retried += 1
+                    await asyncio.sleep(backoff)
+                continue
+            except BaseException:
+                # CancelledError, or GeneratorExit when the consumer closes the generator
+                self._release(completed=False)
+                close = getattr(source, "aclose", None) or getattr(source, "close", None)
+                if close is not None:
+                    result = close()
+                    if inspect.isawaitable(result):
+                        await result
+                raise
+            self._release()
+            return
+        self.exhausted += 1
+        raise RateLimitExceeded(self.name, self.max_retries + 1, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "in_flight": self.in_flight,
+                "queued": sum(1 for waiter in self._heap if not waiter.cancelled),
+                "concurrency_limit": int(self.concurrency_limit),
+                "paused_for": max(0.0, self.paused_until - time.monotonic()),
+                "admitted": self.admitted,
+                "throttled": self.throttled,
+                "retried": self.retried,
+                "exhausted": self.exhausted,
+            }
+
+
+def scheduler_from_env(name: str, prefix: str, **kwargs: Any) -> RateLimitScheduler:
+    """Build a scheduler whose limits come from {prefix}_RPM, _TPM, _MAX_CONCURRENCY and _MAX_RETRIES."""
+    rpm = os.getenv(f"{prefix}_RPM")
+    tpm = os.getenv(f"{prefix}_TPM")
+    return RateLimitScheduler(
+        name,
+        requests_per_minute=float(rpm) if rpm else None,
+        tokens_per_minute=float(tpm) if tpm else None,
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "8")),
+        max_retries=int(os.getenv(f"{prefix}_MAX_RETRIES", "5")),
+        **kwargs,
+    )
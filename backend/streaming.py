@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Server-sent event helpers and streaming latency metrics.
+
+Streams use three event types:
+    token  {"text": "..."}            one chunk of generated text
+    done   {...}                      end of stream with the final payload
+    error  {"detail": "..."}          the stream failed; no done event follows
+"""
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from metrics_window import percentile, sample_window
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class StreamMetrics:
+    """
+    Time-to-first-token and total stream duration, in milliseconds.
+
+    Keeps the most recent `window` samples for percentiles plus lifetime counts.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._ttft_ms = sample_window(window)
+        self._total_ms = sample_window(window)
+        self.streams = 0
+        self.failed = 0
+
+    def start(self) -> "StreamTimer":
+        return StreamTimer(self)
+
+    def record(self, ttft_ms: float, total_ms: float, failed: bool = False) -> None:
+        with self._lock:
+            self.streams += 1
+            if failed:
+                self.failed += 1
+            if ttft_ms is not None:
+                self._ttft_ms.append(ttft_ms)
+            self._total_ms.append(total_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "failed": self.failed,
+                "ttft_ms_p50": percentile(self._ttft_ms, 0.50),
+                "ttft_ms_p95": percentile(self._ttft_ms, 0.95),
+                "total_ms_p50": percentile(self._total_ms, 0.50),
+                "total_ms_p95": percentile(self._total_ms, 0.95),
+            }
+
+
+class StreamTimer:
+    """Measures one stream: call first_token() on each token and finish() at the end."""
+
+    def __init__(self, metrics: StreamMetrics):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.ttft_ms = None
+        self._finished = False
+
+    def first_token(self) -> None:
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self.started) * 1000
+
+    def finish(self, failed: bool = False) -> None:
+        if not self._finished:
+            self._finished = True
+            self.metrics.record(self.ttft_ms, (time.perf_counter() - self.started) * 1000, failed)
+
+
+def stream_text(tokens: Iterable[str], finalize: Callable[[str], Dict[str, Any]],
+                timer: "StreamTimer" = None) -> Iterator[str]:
+    """
+    Turn a blocking token iterator into SSE events, timing the stream.
+
+    Args:
+        tokens (Iterable[str]): Text chunks; work done before the first chunk counts toward TTFT.
+        finalize (Callable[[str], Dict[str, Any]]): Builds the done payload from the full text.
+        timer (StreamTimer): A timer started when the request arrived, so that
+            retrieval before the stream counts toward TTFT (defaults to a new one).
+
+    Yields:
+        str: token events, then one done event (or an error event).
+    """
+    timer = timer or stream_metrics.start()
+    parts = []
+    try:
+        for text in tokens:
+            timer.first_token()
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+        yield sse_event("done", finalize("".join(parts)))
+        timer.finish()
+    except Exception as e:
+        timer.finish(failed=True)
+        yield sse_event("error", {"detail": str(e)})
+
+
+# Process-wide metrics for the streaming endpoints of this server
+stream_metrics = StreamMetrics()
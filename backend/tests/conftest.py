@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The backend modules import each other by plain module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# utils refuses to import without an embedding endpoint configured
+os.environ.setdefault("API_KEY", "test-key")
+os.environ.setdefault("ENDPOINT_URL", "https://embeddings.invalid/embeddings")
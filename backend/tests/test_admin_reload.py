@@ -0,0 +1,45 @@
+from concurrent.futures import Future
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai
+
+
+class _Done:
+    def __init__(self, stats):
+        self._stats = stats
+
+    def stats(self):
+        return self._stats
+
+
+@pytest.fixture
+def client(monkeypatch):
+    reloads = []
+
+    def reload_corpus():
+        reloads.append(1)
+        future = Future()
+        future.set_result(_Done({"version": len(reloads)}))
+        return future
+
+    monkeypatch.setattr(ai.csv_data, "reload_corpus", reload_corpus)
+    yield TestClient(ai.app), reloads
+
+
+def test_reload_is_disabled_without_admin_token(client, monkeypatch):
+    http, reloads = client
+    monkeypatch.setattr(ai, "ADMIN_TOKEN", None)
+    assert http.post("/admin/reload", headers={"X-Admin-Token": "anything"}).status_code == 403
+    assert reloads == []
+
+
+def test_reload_requires_matching_token(client, monkeypatch):
+    http, reloads = client
+    monkeypatch.setattr(ai, "ADMIN_TOKEN", "s3cret")
+    assert http.post("/admin/reload").status_code == 401
+    assert http.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert reloads == []
+    response = http.post("/admin/reload", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200 and response.json() == {"version": 1}
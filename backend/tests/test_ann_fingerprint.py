@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+
+from ann_index import IVFIndex, ann_path, load_ann, rebuild_ann, save_ann
+from vector_index import normalize_rows
+
+
+def _matrix(seed, rows=64, dim=8):
+    return normalize_rows(np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32))
+
+
+def test_rewritten_matrix_with_same_rows_is_stale(tmp_path):
+    stem = str(tmp_path / "store")
+    np.save(f"{stem}.npy", _matrix(0))
+    save_ann(IVFIndex.build(_matrix(0)), stem)
+    assert load_ann(stem, 8, 64) is not None
+
+    # Same shape, different contents: the row count alone cannot tell
+    np.save(f"{stem}.npy", _matrix(1))
+    os.utime(f"{stem}.npy", ns=(0, 0))
+    assert load_ann(stem, 8, 64) is None
+
+    rebuild_ann(stem, _matrix(1))
+    assert load_ann(stem, 8, 64) is not None
+
+
+def test_index_without_fingerprint_is_ignored(tmp_path):
+    stem = str(tmp_path / "store")
+    np.save(f"{stem}.npy", _matrix(0))
+    IVFIndex.build(_matrix(0)).save(ann_path(stem, "ivf"))
+    assert load_ann(stem, 8, 64) is None
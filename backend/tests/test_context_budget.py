@@ -0,0 +1,18 @@
+from context_builder import ContextDocument, build_context, count_tokens
+
+
+def test_first_sentence_over_budget_is_cut_between_words():
+    long_sentence = " ".join(f"cuvant{i}" for i in range(200)) + "."
+    doc = ContextDocument("1", "HCL 1\nText: ", long_sentence + " Al doilea paragraf scurt.")
+    budget = doc.header_tokens + 40
+
+    result = build_context([[doc]], budget)
+
+    assert result.documents == ["1"]
+    assert result.truncated == 1 and result.dropped == 0
+    assert result.tokens <= budget
+    body = result.text[len(doc.header):].strip()
+    assert body and long_sentence.startswith(body)
+    # Cut at a word boundary, never inside a word
+    assert long_sentence[len(body)] == " "
+    assert count_tokens(body) + 1 <= 40
@@ -0,0 +1,18 @@
+import numpy as np
+
+from csv_data import FilterColumn
+
+
+def _days(iso):
+    return float(np.datetime64(iso, "D").astype(np.int64))
+
+
+def test_iso_and_day_first_dates_in_one_column():
+    docs = [{"adopted": "2021-03-04"}, {"adopted": "04/03/2021"}, {"adopted": "15/03/2021"},
+            {"adopted": "2021-03-15T10:30:00"}, {"adopted": "not a date"}, {}]
+    values = FilterColumn(docs, "adopted", "date").values
+    assert values[0] == _days("2021-03-04")
+    assert values[1] == _days("2021-03-04")
+    assert values[2] == _days("2021-03-15")
+    assert np.floor(values[3]) == _days("2021-03-15")
+    assert np.isnan(values[4]) and np.isnan(values[5])
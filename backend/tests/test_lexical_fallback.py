@@ -0,0 +1,23 @@
+import asyncio
+
+import httpx
+
+import ai
+
+
+def test_embedding_error_falls_back_to_bm25(monkeypatch):
+    async def embed_query(query, collection_name):
+        raise httpx.ConnectTimeout("embedding endpoint timed out")
+
+    calls = []
+
+    def hybrid_search(collection_type, query_embedding, query, top_k, **kwargs):
+        calls.append(query_embedding)
+        return [3, 1]
+
+    monkeypatch.setattr(ai, "HYBRID_SEARCH", True)
+    monkeypatch.setattr(ai, "embed_query", embed_query)
+    monkeypatch.setattr(ai, "hybrid_search", hybrid_search)
+    rows = asyncio.run(ai.answer_query_with_cosine("taxa teren", ai.HCL_COLLECTION, corpus=object()))
+    assert rows == [3, 1]
+    assert calls == [None]
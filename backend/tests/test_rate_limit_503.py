@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import ai
+from rate_limit import RateLimited, RateLimitScheduler
+
+
+class LimitedBatcher:
+    """Embeds through a scheduler whose endpoint always answers 429."""
+
+    def __init__(self):
+        self.scheduler = RateLimitScheduler("test", max_retries=0, default_retry_after=0.01)
+
+    async def submit(self, query):
+        async def attempt():
+            raise RateLimited(0.01)
+        return await self.scheduler.submit_async(attempt)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def get_corpus():
+        return object()
+
+    monkeypatch.setattr(ai, "get_corpus", get_corpus)
+    monkeypatch.setattr(ai, "get_embedding_batcher", lambda endpoint, api_key: LimitedBatcher())
+    ai.embedding_cache.clear()
+    return TestClient(ai.app)
+
+
+def test_question_embedding_rate_limited_is_503(client):
+    response = client.get("/askCombined", params={"question": "Ce taxe se platesc pentru terenuri?"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_retrieval_stage_rate_limited_is_503(client):
+    # A filter skips the answer cache, so the first embedding happens inside the retrieval stages
+    response = client.get("/askCombined", params={"question": "Ce taxe se platesc pentru cladiri?",
+                                                  "adopted_after": "2020-01-01"})
+    assert response.status_code == 503
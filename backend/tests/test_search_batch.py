@@ -0,0 +1,26 @@
+import numpy as np
+
+from vector_index import EmbeddingMatrix
+
+
+class _ShortANN:
+    """An ANN index that finds fewer neighbours than asked for some queries."""
+
+    kind = "fake"
+
+    def search(self, matrix, query, top_k):
+        found = 1 if query[0] > 0 else top_k
+        rows = np.arange(found)
+        return rows, (matrix[rows] @ query).astype(np.float32)
+
+
+def test_ann_batch_pads_short_results():
+    matrix = np.eye(4, dtype=np.float32)
+    index = EmbeddingMatrix(matrix, np.arange(4))
+    index.ann = _ShortANN()
+
+    positions, scores = index.search_batch(np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float32), top_k=3)
+
+    assert positions.shape == scores.shape == (2, 3)
+    assert positions[0].tolist() == [0, -1, -1] and np.isnan(scores[0, 1:]).all()
+    assert positions[1].tolist() == [0, 1, 2] and not np.isnan(scores[1]).any()
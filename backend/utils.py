@@ -14,6 +14,8 @@ import pandas as pd
 from tqdm.auto import tqdm
 from dotenv import load_dotenv
 
+from rate_limit import PRIORITY_NORMAL, RateLimited, estimate_tokens, retry_after_seconds
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -41,6 +43,14 @@ def allow_self_signed_https(allow: bool) -> None:
 
 allow_self_signed_https(True)
 
+def https_verify() -> bool:
+    """
+    TLS verification for the httpx clients of the embedding endpoints. On by
+    default; set EMBEDDING_ALLOW_SELF_SIGNED=1 to accept a self-signed
+    embedding endpoint. The chat endpoint is always verified.
+    """
+    return os.environ.get('EMBEDDING_ALLOW_SELF_SIGNED', '').lower() not in ('1', 'true', 'yes')
+
 # Utility function to calculate cosine similarity between two vectors
 
 def cosine_similarity(vec1, vec2):
@@ -93,3 +103,32 @@ def get_embeddings(texts, endpoint_url, api_key, max_retries=5):
                 return []
     logging.error("Maximum retries reached. Failed to obtain embeddings.")
     return []
+
+
+# Async variant of get_embeddings for use inside the event loop
+
+async def get_embeddings_async(texts, endpoint_url, api_key, client, scheduler, priority=PRIORITY_NORMAL):
+    """
+    Sends a request to the embeddings endpoint for a list of texts and returns a list of embedding vectors.
+    Uses a shared httpx.AsyncClient (pooled keep-alive connections, client-level timeouts).
+    The call is admitted by the endpoint's RateLimitScheduler, which handles 429/Retry-After
+    and transient connection errors for all requests together. Raises RateLimitExceeded if the
+    endpoint is still throttling after the scheduler's retries; returns [] on other HTTP errors.
+    """
+    data = {"input": texts}
+    headers = {
+        "Content-Type": "application/json",
+        "api-key": api_key
+    }
+
+    async def attempt():
+        response = await client.post(endpoint_url, json=data, headers=headers)
+        if response.status_code == 429:
+            raise RateLimited(retry_after_seconds(response.headers))
+        if response.is_error:
+            logging.error("Request failed with status code: %s", response.status_code)
+            logging.error("Error response: %s", response.text)
+            return []
+        return [item["embedding"] for item in response.json()["data"]]
+
+    return await scheduler.submit_async(attempt, tokens=estimate_tokens(*texts), priority=priority)
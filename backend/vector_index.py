@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Name of the embedding column in the CSV exports (spelling kept from the data files)
+EMBEDDING_FIELD = "embedings"
+
+# Supported quantized storage modes, and rows decoded per block when scanning codes
+# (small blocks keep the float32 decode buffer in cache)
+QUANTIZATION_MODES = ("int8", "float16")
+QUANTIZED_SCAN_CHUNK = 256
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize a matrix row-wise, leaving all-zero rows untouched.
+
+    Args:
+        matrix (np.ndarray): A 2D array of vectors.
+
+    Returns:
+        np.ndarray: A C-contiguous float32 array with unit-length rows.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the k highest scores, best first.
+
+    Uses argpartition so only the k selected scores are sorted.
+
+    Args:
+        scores (np.ndarray): A 1D array of scores.
+        k (int): The number of indices to return.
+
+    Returns:
+        np.ndarray: Indices into scores, sorted by descending score.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(scores, n - k)[n - k:]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def top_k_indices_batch(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row-wise top-k for a 2D score matrix, best first in every row.
+
+    Args:
+        scores (np.ndarray): A (queries, documents) array of scores.
+        k (int): The number of indices to return per row.
+
+    Returns:
+        np.ndarray: A (queries, k) array of column indices.
+    """
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(np.take_along_axis(scores, candidates, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def quantize_rows(matrix: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Quantize a normalized matrix row by row.
+
+    int8 codes carry a per-row scale (max |value| / 127), so that
+    row ~= codes * scale. float16 codes need no scale.
+
+    Args:
+        matrix (np.ndarray): The normalized (rows, dim) matrix.
+        mode (str): 'int8' or 'float16'.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The codes and the per-row scales
+        (None for float16).
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if mode == "float16":
+        return np.ascontiguousarray(matrix, dtype=np.float16), None
+
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], 4096):
+        block = np.asarray(matrix[start:start + 4096], dtype=np.float32)
+        block_scales = np.abs(block).max(axis=1) / 127.0
+        block_scales[block_scales == 0] = 1.0
+        codes[start:start + len(block)] = np.rint(block / block_scales[:, None])
+        scales[start:start + len(block)] = block_scales
+    return codes, scales
+
+
+class EmbeddingMatrix:
+    """
+    A pre-normalized, contiguous float32 embedding matrix for one collection.
+
+    Row i of `matrix` holds the embedding of document `row_ids[i]`, where
+    row_ids are positions in the document list the matrix was built from.
+    """
+
+    def __init__(self, matrix: np.ndarray, row_ids: np.ndarray, doc_ids: Optional[List[str]] = None,
+                 normalized: bool = False):
+        # Already-normalized float32 input (e.g. a memory-mapped store) is used as-is, without a copy
+        if normalized and matrix.dtype == np.float32 and matrix.flags['C_CONTIGUOUS']:
+            self.matrix = matrix
+        else:
+            self.matrix = normalize_rows(matrix)
+        self.row_ids = np.asarray(row_ids, dtype=np.int64)
+        self.doc_ids = doc_ids if doc_ids is not None else [str(i) for i in self.row_ids]
+        # Optional approximate index (see ann_index.py); exact scan when None
+        self.ann = None
+        # Optional quantized codes (see quantize); scanned instead of the full matrix when set
+        self.codes = None
+        self.scales = None
+        self.rescore_factor = 10
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def quantize(self, mode: str, rescore_factor: int = 10) -> None:
+        """
+        Keep int8 or float16 codes and scan those instead of the full matrix.
+
+        Search scores every row on the codes, then rescores a shortlist of
+        top_k * rescore_factor rows against the full-precision matrix. When the
+        full matrix is memory-mapped (a binary store), only the shortlisted rows
+        are ever read from it, so resident memory is the codes: 1/4 (int8) or
+        1/2 (float16) of the float32 matrix. int8 scans at about float32 speed;
+        float16 decoding is slow in NumPy, so prefer it only for memory.
+
+        Args:
+            mode (str): 'int8' or 'float16'.
+            rescore_factor (int): Shortlist size as a multiple of top_k.
+        """
+        self.codes, self.scales = quantize_rows(self.matrix, mode)
+        self.rescore_factor = rescore_factor
+
+    def _quantized_scores(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate scores for every row (or only `rows`), computed on the codes block by block."""
+        n = len(self) if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        buffer = np.empty((QUANTIZED_SCAN_CHUNK, self.dim), dtype=np.float32)
+        for start in range(0, n, QUANTIZED_SCAN_CHUNK):
+            if rows is None:
+                block = self.codes[start:start + QUANTIZED_SCAN_CHUNK]
+            else:
+                block = self.codes[rows[start:start + QUANTIZED_SCAN_CHUNK]]
+            decoded = buffer[:len(block)]
+            np.copyto(decoded, block, casting='unsafe')
+            scores[start:start + len(block)] = decoded @ q
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    @classmethod
+    def from_documents(cls, docs: Sequence[Dict[str, Any]], field: str = EMBEDDING_FIELD) -> "EmbeddingMatrix":
+        """
+        Build a matrix from a list of document dicts.
+
+        Documents with a missing embedding, or one whose dimension differs
+        from the first valid embedding, are skipped with a warning.
+
+        Args:
+            docs (Sequence[Dict[str, Any]]): Documents carrying an embedding list.
+            field (str): The name of the embedding field.
+
+        Returns:
+            EmbeddingMatrix: The collection matrix.
+        """
+        vectors = []
+        row_ids = []
+        doc_ids = []
+        dim = None
+        for i, doc in enumerate(docs):
+            embedding = doc.get(field)
+            if embedding is None or isinstance(embedding, float) or len(embedding) == 0:
+                logger.warning(f"Skipping document {doc.get('_id')}: no embedding")
+                continue
+            if dim is None:
+                dim = len(embedding)
+            elif len(embedding) != dim:
+                logger.warning(f"Skipping document {doc.get('_id')}: embedding dimension {len(embedding)}, expected {dim}")
+                continue
+            vectors.append(embedding)
+            row_ids.append(i)
+            doc_ids.append(str(doc.get('_id', i)))
+
+        if not vectors:
+            return cls(np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64), [])
+        return cls(np.asarray(vectors, dtype=np.float32), np.asarray(row_ids), doc_ids)
+
+    def search(self, query: Sequence[float], top_k: int = 5, exact: bool = False,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine-similarity search against the matrix.
+
+        Args:
+            query (Sequence[float]): The query embedding.
+            top_k (int): The number of results to return.
+            exact (bool): Scan every row even if an ANN index is attached.
+            mask (Optional[np.ndarray]): Boolean array over the matrix rows; only
+                rows set in it are scored (exactly, bypassing any ANN index, which
+                could not return a full top_k from a filtered subset).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Document positions (row_ids) and their
+            similarity scores, best first.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        if q.shape[0] != self.dim:
+            raise ValueError(f"Query dimension {q.shape[0]} does not match index dimension {self.dim}.")
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        q = q / norm
+        if mask is not None:
+            return self._search_rows(q, np.flatnonzero(mask), top_k)
+        if self.ann is not None and not exact:
+            rows, scores = self.ann.search(self.matrix, q, top_k)
+            return self.row_ids[rows], scores
+        if self.codes is not None and not exact:
+            shortlist = top_k_indices(self._quantized_scores(q), top_k * self.rescore_factor)
+            # Rescore the shortlist at full precision; sorted reads are friendlier to a memory map
+            shortlist.sort()
+            scores = np.asarray(self.matrix[shortlist], dtype=np.float32) @ q
+            best = top_k_indices(scores, top_k)
+            return self.row_ids[shortlist[best]], scores[best]
+        scores = self.matrix @ q
+        rows = top_k_indices(scores, top_k)
+        return self.row_ids[rows], scores[rows]
+
+    def _search_rows(self, q: np.ndarray, rows: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k among the given matrix rows only (a normalized query)."""
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self.codes is not None and len(rows) > top_k * self.rescore_factor:
+            rows = rows[top_k_indices(self._quantized_scores(q, rows), top_k * self.rescore_factor)]
+            rows.sort()
+        scores = np.asarray(self.matrix[rows], dtype=np.float32) @ q
+        best = top_k_indices(scores, top_k)
+        return self.row_ids[rows[best]], scores[best]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine-similarity search for several queries in one matrix-matrix product.
+
+        Args:
+            queries (np.ndarray): A (queries, dim) array of query embeddings.
+            top_k (int): The number of results to return per query.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (queries, k) arrays of document positions
+            and similarity scores, best first in every row. A query with fewer
+            results (from an ANN index, or a zero query) is padded with -1 and NaN.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self) == 0:
+            empty = (queries.shape[0], 0)
+            return np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query dimension {queries.shape[1]} does not match index dimension {self.dim}.")
+        if self.ann is not None or self.codes is not None:
+            k = min(top_k, len(self))
+            positions = np.full((queries.shape[0], k), -1, dtype=np.int64)
+            similarities = np.full((queries.shape[0], k), np.nan, dtype=np.float32)
+            for i, q in enumerate(queries):
+                found, scores = self.search(q, top_k)
+                positions[i, :len(found)] = found
+                similarities[i, :len(scores)] = scores
+            return positions, similarities
+        scores = normalize_rows(queries) @ self.matrix.T
+        cols = top_k_indices_batch(scores, top_k)
+        return self.row_ids[cols], np.take_along_axis(scores, cols, axis=1)
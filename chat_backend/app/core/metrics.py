@@ -0,0 +1,47 @@
+import time
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional
+
+
+def _percentile(values: Iterable[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StreamMetrics:
+    """Time-to-first-token and total duration (ms) of streamed chat answers, over the last `window` streams."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.ttft_ms: Deque[float] = deque(maxlen=window)
+        self.total_ms: Deque[float] = deque(maxlen=window)
+        self.streams = 0
+        self.failed = 0
+
+    def record(self, started: float, first_token_at: Optional[float], failed: bool = False):
+        now = time.perf_counter()
+        with self._lock:
+            self.streams += 1
+            if failed:
+                self.failed += 1
+            if first_token_at is not None:
+                self.ttft_ms.append((first_token_at - started) * 1000)
+            self.total_ms.append((now - started) * 1000)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "failed": self.failed,
+                "ttft_ms_p50": _percentile(self.ttft_ms, 0.50),
+                "ttft_ms_p95": _percentile(self.ttft_ms, 0.95),
+                "total_ms_p50": _percentile(self.total_ms, 0.50),
+                "total_ms_p95": _percentile(self.total_ms, 0.95),
+            }
+
+
+chat_stream_metrics = StreamMetrics()
@@ -0,0 +1,97 @@
+"""
+Count the MongoDB round trips of persisting chat turns, before and after
+commit_chat_turn, against the configured database (MONGO_URI, MONGO_DB_NAME):
+
+    python -m app.db.bench_turn [turns]
+
+Each strategy saves `turns` turns into a new conversation as a throwaway
+user, whose data is deleted afterwards.
+"""
+import sys
+import time
+import uuid
+import asyncio
+from collections import Counter
+
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the server, by name."""
+
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Listeners only apply to clients created after registration, so before importing database
+counter = CommandCounter()
+monitoring.register(counter)
+
+from .database import (  # noqa: E402
+    DEFAULT_TITLE,
+    client,
+    commit_chat_turn,
+    conversations_collection,
+    messages_collection,
+    create_conversation,
+    get_conversation,
+    update_conversation,
+    add_messages_to_conversation,
+)
+
+
+def _turn(i: int):
+    return [
+        {"id": str(uuid.uuid4()), "role": "user", "content": f"question {i}", "feedback": None},
+        {"id": str(uuid.uuid4()), "role": "assistant", "content": f"answer {i}", "feedback": None},
+    ]
+
+
+async def save_turn_separately(conversation_id, user_id, title, messages):
+    """The previous /chat persistence: read, maybe retitle, then append."""
+    if conversation_id:
+        conversation = await get_conversation(conversation_id, user_id)
+        if conversation:
+            if conversation.title == DEFAULT_TITLE:
+                await update_conversation(conversation_id, {"title": title}, user_id)
+            await add_messages_to_conversation(conversation_id, messages, user_id)
+            return conversation_id
+    conversation = await create_conversation(user_id=user_id, title=title, messages=[])
+    await add_messages_to_conversation(conversation.id, messages, user_id)
+    return conversation.id
+
+
+async def run(strategy, turns: int):
+    user_id = f"bench-{uuid.uuid4()}"
+    conversation_id = None
+    counter.commands.clear()
+    started = time.perf_counter()
+    for i in range(turns):
+        conversation_id = await strategy(conversation_id, user_id, f"question {i}", _turn(i))
+    elapsed = time.perf_counter() - started
+    commands = dict(counter.commands)
+    await conversations_collection.delete_many({"user_id": user_id})
+    await messages_collection.delete_many({"user_id": user_id})
+    return commands, elapsed
+
+
+async def main(turns: int):
+    for name, strategy in [("separate calls", save_turn_separately), ("commit_chat_turn", commit_chat_turn)]:
+        commands, elapsed = await run(strategy, turns)
+        total = sum(commands.values())
+        print(f"{name:>16}: {total / turns:.1f} round trips per turn, "
+              f"{elapsed / turns * 1000:.1f} ms per turn  {commands}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -1,11 +1,16 @@
 import os
 import motor.motor_asyncio
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import asyncio
+import base64
+import json
 import uuid
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
-from ..models.models import User, UserInDB, Conversation, Message
+from ..models.models import User, UserInDB, Conversation, ConversationSummary, Message
+from .indexes import bootstrap_indexes
 
 MONGO_URI = os.getenv("MONGO_URI") or "mongodb://localhost:27017"
 DB_NAME = os.getenv("MONGO_DB_NAME") or "chat_app"
@@ -17,8 +22,14 @@ db = client[DB_NAME]
 # Collections
 users_collection = db["users"]
 conversations_collection = db["conversations"]
+messages_collection = db["messages"]
 
-# Async function to test MongoDB connection; call this in your FastAPI startup event
+# Messages per page of GET /conversations/{id}/messages
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE") or 50)
+# Conversations per page of GET /conversations/summaries
+CONVERSATION_PAGE_SIZE = int(os.getenv("CONVERSATION_PAGE_SIZE") or 30)
+
+# Test the MongoDB connection and make sure every query shape has an index; called at startup
 async def connect_to_mongo():
     try:
         await client.admin.command('ping')
@@ -26,6 +37,19 @@ async def connect_to_mongo():
     except Exception as e:
         print(f"MongoDB connection error: {e}")
         # Optionally, handle fallback to a local instance if needed
+        return
+    try:
+        await bootstrap_indexes(db)
+    except Exception as e:
+        print(f"MongoDB index bootstrap failed: {e}")
+    # Conversations still holding an embedded messages array are also migrated when first read
+    asyncio.create_task(_migrate_in_background())
+
+async def _migrate_in_background():
+    try:
+        await migrate_embedded_messages()
+    except Exception as e:
+        print(f"Message migration failed: {e}")
 
 # User database operations
 import asyncio
@@ -94,6 +118,137 @@ async def get_all_users() -> List[User]:
 
 
 # Conversation database operations
+#
+# Messages live in their own collection, one document per message keyed by
+# (conversation_id, seq), instead of in an ever-growing array on the
+# conversation. The conversation keeps a message_count, which also hands out
+# sequence numbers. Conversations written before the split still carry an
+# embedded "messages" array; they are moved over on first access and by
+# migrate_embedded_messages(), with embedded message i becoming seq i.
+
+def _message_doc(conversation_id: str, user_id: str, seq: int, message: Dict, created_at: str) -> Dict:
+    return {
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "seq": seq,
+        "id": message["id"],
+        "role": message["role"],
+        "content": message["content"],
+        "feedback": message.get("feedback"),
+        "created_at": created_at,
+    }
+
+def _to_message(doc: Dict) -> Message:
+    return Message(
+        id=doc["id"],
+        role=doc["role"],
+        content=doc["content"],
+        feedback=doc.get("feedback"),
+        seq=doc.get("seq")
+    )
+
+def _to_conversation(doc: Dict, messages: List[Message]) -> Conversation:
+    return Conversation(
+        id=doc["id"],
+        title=doc["title"],
+        messages=messages,
+        message_count=doc.get("message_count", len(messages)),
+        created_at=datetime.fromisoformat(doc["created_at"]),
+        updated_at=datetime.fromisoformat(doc["updated_at"]),
+        user_id=doc["user_id"]
+    )
+
+# Message count of a conversation, counting a legacy embedded array that has not been migrated yet
+_CURRENT_MESSAGE_COUNT = {"$ifNull": ["$message_count", {"$size": {"$ifNull": ["$messages", []]}}]}
+
+async def migrate_conversation(doc: Dict) -> None:
+    """
+    Move a conversation's embedded messages into the messages collection.
+    Safe to run concurrently: messages are upserted on (conversation_id, seq).
+    """
+    legacy = doc.get("messages") or []
+    if legacy:
+        operations = [
+            UpdateOne(
+                {"conversation_id": doc["id"], "seq": seq},
+                {"$setOnInsert": _message_doc(doc["id"], doc["user_id"], seq, message, doc["updated_at"])},
+                upsert=True
+            )
+            for seq, message in enumerate(legacy)
+        ]
+        try:
+            await messages_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A concurrent migration of the same conversation inserted these first
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    await conversations_collection.update_one(
+        {"id": doc["id"], "messages": {"$exists": True}},
+        [
+            {"$set": {"message_count": _CURRENT_MESSAGE_COUNT}},
+            {"$unset": "messages"}
+        ]
+    )
+    doc.pop("messages", None)
+    doc["message_count"] = max(doc.get("message_count", 0), len(legacy))
+
+async def migrate_embedded_messages() -> int:
+    """Migrate every conversation that still has an embedded messages array. Returns how many were migrated."""
+    migrated = 0
+    cursor = conversations_collection.find({"messages": {"$exists": True}}, {"_id": 0})
+    async for doc in cursor:
+        await migrate_conversation(doc)
+        migrated += 1
+    if migrated:
+        print(f"Migrated the messages of {migrated} conversations to the messages collection")
+    return migrated
+
+async def _find_conversation_doc(query: Dict) -> Optional[Dict]:
+    doc = await conversations_collection.find_one(query, {"_id": 0})
+    if doc and "messages" in doc:
+        await migrate_conversation(doc)
+    return doc
+
+async def get_messages(conversation_id: str, before: Optional[int] = None,
+                       limit: Optional[int] = None) -> Tuple[List[Message], Optional[int]]:
+    """
+    Read a conversation's messages newest first, by keyset on seq.
+
+    Returns the messages in chronological order, and the cursor (a seq) to
+    pass as `before` for the previous page, or None when there is none.
+    """
+    query: Dict[str, Any] = {"conversation_id": conversation_id}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+    cursor = messages_collection.find(query, {"_id": 0}).sort("seq", -1)
+    if limit is not None:
+        # One extra message tells whether an older page exists
+        cursor = cursor.limit(limit + 1)
+    docs = await cursor.to_list(length=None)
+    next_cursor = None
+    if limit is not None and len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = docs[-1]["seq"]
+    docs.reverse()
+    return [_to_message(doc) for doc in docs], next_cursor
+
+async def _messages_by_conversation(conversation_ids: List[str]) -> Dict[str, List[Message]]:
+    """All messages of several conversations in one query."""
+    grouped: Dict[str, List[Message]] = {conversation_id: [] for conversation_id in conversation_ids}
+    cursor = messages_collection.find(
+        {"conversation_id": {"$in": conversation_ids}}, {"_id": 0}
+    ).sort([("conversation_id", 1), ("seq", 1)])
+    async for doc in cursor:
+        grouped[doc["conversation_id"]].append(_to_message(doc))
+    return grouped
+
+async def _insert_messages(conversation_id: str, user_id: str, first_seq: int, messages: List[Dict], now: str) -> None:
+    if messages:
+        await messages_collection.insert_many([
+            _message_doc(conversation_id, user_id, first_seq + i, message, now)
+            for i, message in enumerate(messages)
+        ])
+
 async def create_conversation(user_id: str, title: str, messages: List[Dict] = None) -> Conversation:
     if messages is None:
         messages = []
@@ -104,84 +259,131 @@ async def create_conversation(user_id: str, title: str, messages: List[Dict] = N
     conversation_doc = {
         "id": conversation_id,
         "title": title,
-        "messages": messages,
+        "message_count": len(messages),
         "created_at": now.isoformat(),
         "updated_at": now.isoformat(),
         "user_id": user_id
     }
     
     await conversations_collection.insert_one(conversation_doc)
+    await _insert_messages(conversation_id, user_id, 0, messages, now.isoformat())
     
     return Conversation(
         id=conversation_id,
         title=title,
-        messages=[Message(**m) for m in messages],
+        messages=[Message(**{**m, "seq": seq}) for seq, m in enumerate(messages)],
+        message_count=len(messages),
         created_at=now,
         updated_at=now,
         user_id=user_id
     )
 
-async def get_conversation(conversation_id: str, user_id: Optional[str] = None) -> Optional[Conversation]:
+async def get_conversation(conversation_id: str, user_id: Optional[str] = None,
+                           message_limit: Optional[int] = None) -> Optional[Conversation]:
+    """Read a conversation with its latest `message_limit` messages (all of them by default)."""
     query = {"id": conversation_id}
     if user_id:
         query["user_id"] = user_id
     
-    doc = await conversations_collection.find_one(query)
+    doc = await _find_conversation_doc(query)
     if not doc:
         return None
     
-    return Conversation(
-        id=doc["id"],
-        title=doc["title"],
-        messages=[Message(**m) for m in doc["messages"]],
-        created_at=datetime.fromisoformat(doc["created_at"]),
-        updated_at=datetime.fromisoformat(doc["updated_at"]),
-        user_id=doc["user_id"]
-    )
+    messages, _ = await get_messages(conversation_id, limit=message_limit)
+    return _to_conversation(doc, messages)
+
+async def get_message_page(conversation_id: str, user_id: Optional[str] = None, before: Optional[int] = None,
+                           limit: int = MESSAGE_PAGE_SIZE) -> Optional[Tuple[List[Message], Optional[int]]]:
+    """One page of a conversation's messages (see get_messages), or None if the conversation is not found."""
+    query = {"id": conversation_id}
+    if user_id:
+        query["user_id"] = user_id
+    if not await _find_conversation_doc(query):
+        return None
+    return await get_messages(conversation_id, before=before, limit=limit)
+
+async def _conversations_with_messages(query: Dict) -> List[Conversation]:
+    docs = []
+    async for doc in conversations_collection.find(query, {"_id": 0}):
+        if "messages" in doc:
+            await migrate_conversation(doc)
+        docs.append(doc)
+    messages = await _messages_by_conversation([doc["id"] for doc in docs])
+    return [_to_conversation(doc, messages[doc["id"]]) for doc in docs]
 
 async def get_user_conversations(user_id: str) -> List[Conversation]:
-    cursor = conversations_collection.find({"user_id": user_id})
-    conversations = []
-    
-    async for doc in cursor:
-        conversations.append(Conversation(
+    return await _conversations_with_messages({"user_id": user_id})
+
+def _encode_cursor(doc: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([doc["updated_at"], doc["id"]]).encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(updated_at, str) or not isinstance(conversation_id, str):
+        raise ValueError("Invalid cursor")
+    return updated_at, conversation_id
+
+async def get_user_conversation_summaries(user_id: str, cursor: Optional[str] = None,
+                                          limit: int = CONVERSATION_PAGE_SIZE) -> Tuple[List[ConversationSummary], Optional[str]]:
+    """
+    A page of a user's conversations, most recently updated first, without their messages.
+
+    Keyset pagination on (updated_at, id), served by the user_id_updated_at_id
+    index, so every page costs the same however long the history is.
+    Raises ValueError for a cursor that was not returned by this function.
+
+    Returns the summaries and the cursor of the next page (None on the last page).
+    """
+    query: Dict[str, Any] = {"user_id": user_id}
+    if cursor:
+        updated_at, conversation_id = _decode_cursor(cursor)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "id": {"$lt": conversation_id}}
+        ]
+    projection = {"_id": 0, "id": 1, "title": 1, "updated_at": 1, "message_count": _CURRENT_MESSAGE_COUNT}
+    docs = await conversations_collection.find(query, projection).sort(
+        [("updated_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(length=None)
+    next_cursor = _encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    summaries = [
+        ConversationSummary(
             id=doc["id"],
             title=doc["title"],
-            messages=[Message(**m) for m in doc["messages"]],
-            created_at=datetime.fromisoformat(doc["created_at"]),
             updated_at=datetime.fromisoformat(doc["updated_at"]),
-            user_id=doc["user_id"]
-        ))
-    
-    return conversations
+            message_count=doc["message_count"]
+        )
+        for doc in docs[:limit]
+    ]
+    return summaries, next_cursor
 
 async def get_all_conversations() -> List[Conversation]:
-    cursor = conversations_collection.find({})
-    conversations = []
-    
-    async for doc in cursor:
-        conversations.append(Conversation(
-            id=doc["id"],
-            title=doc["title"],
-            messages=[Message(**m) for m in doc["messages"]],
-            created_at=datetime.fromisoformat(doc["created_at"]),
-            updated_at=datetime.fromisoformat(doc["updated_at"]),
-            user_id=doc["user_id"]
-        ))
-    
-    return conversations
+    return await _conversations_with_messages({})
 
 async def update_conversation(conversation_id: str, update_data: Dict[str, Any], user_id: Optional[str] = None) -> Optional[Conversation]:
     query = {"id": conversation_id}
     if user_id:
         query["user_id"] = user_id
     
-    update_data["updated_at"] = datetime.utcnow().isoformat()
+    now = datetime.utcnow().isoformat()
+    update_data["updated_at"] = now
     
-    await conversations_collection.update_one(
+    # Replacing the messages rewrites the conversation's message documents
+    messages = update_data.pop("messages", None)
+    if messages is not None:
+        update_data["message_count"] = len(messages)
+    
+    result = await conversations_collection.update_one(
         query,
-        {"$set": update_data}
+        {"$set": update_data, "$unset": {"messages": ""}} if messages is not None else {"$set": update_data}
     )
+    if messages is not None and result.matched_count:
+        await messages_collection.delete_many({"conversation_id": conversation_id})
+        doc = await conversations_collection.find_one(query, {"_id": 0, "user_id": 1})
+        await _insert_messages(conversation_id, doc["user_id"], 0, messages, now)
     
     return await get_conversation(conversation_id, user_id)
 
@@ -191,6 +393,8 @@ async def delete_conversation(conversation_id: str, user_id: Optional[str] = Non
         query["user_id"] = user_id
     
     result = await conversations_collection.delete_one(query)
+    if result.deleted_count > 0:
+        await messages_collection.delete_many({"conversation_id": conversation_id})
     return result.deleted_count > 0
 
 async def add_messages_to_conversation(conversation_id: str, messages: List[Dict], user_id: Optional[str] = None) -> Optional[Conversation]:
@@ -198,50 +402,111 @@ async def add_messages_to_conversation(conversation_id: str, messages: List[Dict
     if user_id:
         query["user_id"] = user_id
     
-    await conversations_collection.update_one(
+    now = datetime.utcnow().isoformat()
+    
+    # Reserve sequence numbers by bumping the count; a legacy conversation continues after its embedded messages
+    doc = await conversations_collection.find_one_and_update(
         query,
-        {
-            "$push": {
-                "messages": {"$each": messages}
-            },
-            "$set": {"updated_at": datetime.utcnow().isoformat()}
-        }
+        [{"$set": {
+            "message_count": {"$add": [_CURRENT_MESSAGE_COUNT, len(messages)]},
+            "updated_at": now
+        }}],
+        projection={"_id": 0, "message_count": 1, "user_id": 1},
+        return_document=ReturnDocument.AFTER
     )
+    if not doc:
+        return None
+    await _insert_messages(conversation_id, doc["user_id"], doc["message_count"] - len(messages), messages, now)
     
     return await get_conversation(conversation_id, user_id)
 
+# Title of a conversation created without one; the first chat turn replaces it
+DEFAULT_TITLE = "New Conversation"
+
+async def commit_chat_turn(conversation_id: Optional[str], user_id: str, title: str, messages: List[Dict]) -> str:
+    """
+    Persist one chat turn: one conditional update of the conversation, then
+    one insert of the messages. That is two round trips, or three when
+    conversation_id is given but is not one of the user's conversations (the
+    failed update, then an upsert creating a new conversation).
+
+    The update checks ownership, replaces a default title with `title` and
+    reserves the messages' sequence numbers. If the insert fails, the
+    messages it did write are deleted and the reservation is given back,
+    unless a later turn has already reserved after it; then the reserved
+    numbers stay unused, which leaves a gap in seq (pagination does not rely
+    on seq being contiguous) and message_count above the stored messages.
+
+    Returns:
+        str: The id of the conversation the messages were added to.
+    """
+    now = datetime.utcnow().isoformat()
+    turn = [{"$set": {
+        "title": {"$cond": [
+            {"$eq": [{"$ifNull": ["$title", DEFAULT_TITLE]}, DEFAULT_TITLE]}, title, "$title"
+        ]},
+        "message_count": {"$add": [_CURRENT_MESSAGE_COUNT, len(messages)]},
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": now
+    }}]
+    projection = {"_id": 0, "message_count": 1}
+    
+    doc = None
+    if conversation_id:
+        doc = await conversations_collection.find_one_and_update(
+            {"id": conversation_id, "user_id": user_id}, turn,
+            projection=projection, return_document=ReturnDocument.AFTER
+        )
+    if not doc:
+        # Upserted fields from the filter (id, user_id) are set on the new document
+        conversation_id = str(uuid.uuid4())
+        doc = await conversations_collection.find_one_and_update(
+            {"id": conversation_id, "user_id": user_id}, turn,
+            projection=projection, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    
+    try:
+        await _insert_messages(conversation_id, user_id, doc["message_count"] - len(messages), messages, now)
+    except Exception:
+        await messages_collection.delete_many(
+            {"conversation_id": conversation_id, "id": {"$in": [message["id"] for message in messages]}}
+        )
+        await conversations_collection.update_one(
+            {"id": conversation_id, "message_count": doc["message_count"]},
+            {"$inc": {"message_count": -len(messages)}}
+        )
+        raise
+    return conversation_id
+
 async def update_message_feedback(conversation_id: str, message_id: str, feedback: Dict, user_id: Optional[str] = None) -> bool:
-    query = {"id": conversation_id}
+    """
+    Set the feedback of one message with a single update of its document.
+    Message documents carry the owner's user_id, so the ownership check is part
+    of the same filter. Ratings of different messages never touch the same
+    document, and two ratings of the same message resolve to the last one.
+    """
+    query = {"conversation_id": conversation_id, "id": message_id}
     if user_id:
         query["user_id"] = user_id
     
-    conversation = await get_conversation(conversation_id, user_id)
-    if not conversation:
-        return False
-    
-    messages = [m.dict() for m in conversation.messages]
-    message_found = False
-    
-    for msg in messages:
-        if msg["id"] == message_id:
-            msg["feedback"] = feedback
-            message_found = True
-            break
-    
-    if not message_found:
-        return False
+    result = await messages_collection.update_one(query, {"$set": {"feedback": feedback}})
+    if result.matched_count:
+        return True
     
-    await conversations_collection.update_one(
-        query,
-        {
-            "$set": {
-                "messages": messages,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-        }
+    # Not found: the conversation may not be migrated yet. Migrating it once
+    # (rather than patching the embedded array) keeps a rating from being
+    # lost to a migration copying the array at the same time.
+    conversation_query = {"id": conversation_id}
+    if user_id:
+        conversation_query["user_id"] = user_id
+    doc = await conversations_collection.find_one(
+        {**conversation_query, "messages": {"$exists": True}}, {"_id": 0}
     )
-    
-    return True
+    if not doc:
+        return False
+    await migrate_conversation(doc)
+    result = await messages_collection.update_one(query, {"$set": {"feedback": feedback}})
+    return result.matched_count > 0
 
 # Admin statistics operations
 async def get_user_statistics() -> List[Dict]:
@@ -264,9 +529,11 @@ async def get_user_statistics() -> List[Dict]:
                 "conversation_count": {"$size": "$conversations"},
                 "message_count": {
                     "$reduce": {
-                        "input": "$conversations.messages",
+                        "input": "$conversations",
                         "initialValue": 0,
-                        "in": {"$add": ["$$value", {"$size": "$$this"}]}
+                        "in": {"$add": ["$$value", {"$ifNull": [
+                            "$$this.message_count", {"$size": {"$ifNull": ["$$this.messages", []]}}
+                        ]}]}
                     }
                 }
             }
@@ -283,14 +550,26 @@ async def get_user_statistics() -> List[Dict]:
 
 async def get_feedback_statistics() -> Dict:
     pipeline = [
-        {"$unwind": "$messages"},
-        {"$match": {"messages.feedback": {"$ne": None}}},
+        {"$match": {"feedback": {"$ne": None}}},
+        {"$project": {"_id": 0, "feedback": 1}},
+        # Feedback on messages of conversations that are not migrated yet
+        {
+            "$unionWith": {
+                "coll": "conversations",
+                "pipeline": [
+                    {"$match": {"messages": {"$exists": True}}},
+                    {"$unwind": "$messages"},
+                    {"$match": {"messages.feedback": {"$ne": None}}},
+                    {"$project": {"_id": 0, "feedback": "$messages.feedback"}}
+                ]
+            }
+        },
         {
             "$group": {
                 "_id": None,
                 "total_count": {"$sum": 1},
-                "average_rating": {"$avg": "$messages.feedback.rating"},
-                "ratings": {"$push": "$messages.feedback.rating"}
+                "average_rating": {"$avg": "$feedback.rating"},
+                "ratings": {"$push": "$feedback.rating"}
             }
         },
         {
@@ -303,7 +582,7 @@ async def get_feedback_statistics() -> Dict:
         }
     ]
     
-    cursor = conversations_collection.aggregate(pipeline)
+    cursor = messages_collection.aggregate(pipeline)
     result = await cursor.to_list(length=1)
     
     if not result:
@@ -0,0 +1,150 @@
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# Indexes for every query shape in database.py. Names are fixed so that
+# re-running the bootstrap is a no-op rather than a duplicate index.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # get_user_by_username (every login)
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # get_user_by_id (every authenticated request, via get_current_user)
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "conversations": [
+        # get/update/delete_conversation by id, with or without user_id: the
+        # unique id matches at most one document, so user_id is checked on it
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # get_user_conversation_summaries pages (id breaks updated_at ties),
+        # get_user_conversations and the user statistics $lookup
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)], name="user_id_updated_at_id"),
+    ],
+    "messages": [
+        # get_messages pages, the $in load of several conversations, and the
+        # migration upserts; unique so a message position is never taken twice
+        IndexModel([("conversation_id", ASCENDING), ("seq", ASCENDING)], name="conversation_id_seq_unique", unique=True),
+        # update_message_feedback (user_id is checked on the matched document);
+        # not unique, legacy conversations may repeat message ids
+        IndexModel([("conversation_id", ASCENDING), ("id", ASCENDING)], name="conversation_id_id"),
+    ],
+}
+
+# One representative filter per query shape in database.py, for explain()
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"name": "get_user_by_username", "collection": "users", "filter": {"username": ""}},
+    {"name": "get_user_by_id", "collection": "users", "filter": {"id": ""}},
+    {"name": "get_conversation", "collection": "conversations", "filter": {"id": ""}},
+    {"name": "get_conversation (owner)", "collection": "conversations", "filter": {"id": "", "user_id": ""}},
+    {"name": "get_user_conversations", "collection": "conversations", "filter": {"user_id": ""}},
+    {"name": "get_user_conversation_summaries", "collection": "conversations",
+     "filter": {"user_id": "", "$or": [{"updated_at": {"$lt": ""}}, {"updated_at": "", "id": {"$lt": ""}}]},
+     "sort": {"updated_at": -1, "id": -1}},
+    {"name": "get_messages", "collection": "messages", "filter": {"conversation_id": "", "seq": {"$lt": 0}}},
+    {"name": "update_message_feedback", "collection": "messages", "filter": {"conversation_id": "", "id": "", "user_id": ""}},
+]
+
+# Server error codes for an index that exists with other options or keys under the same name
+INDEX_CONFLICT_CODES = (85, 86)
+DUPLICATE_KEY_CODE = 11000
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create the indexes in INDEXES. Idempotent: existing identical indexes are
+    left alone. A conflicting index, or duplicates that prevent a unique
+    index, is reported and skipped so the app still starts.
+
+    Returns:
+        Dict[str, List[str]]: Index names that are in place, per collection.
+    """
+    created = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        names = []
+        for model in models:
+            name = model.document["name"]
+            try:
+                await collection.create_indexes([model])
+                names.append(name)
+            except OperationFailure as e:
+                if e.code in INDEX_CONFLICT_CODES:
+                    print(f"Index {collection_name}.{name} conflicts with an existing index, left as is: {e}")
+                elif e.code == DUPLICATE_KEY_CODE:
+                    print(f"Cannot create unique index {collection_name}.{name}: duplicate values exist ({e})")
+                else:
+                    raise
+        created[collection_name] = names
+    return created
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Stage names of a query plan tree, outermost first."""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def _index_name(plan: Dict[str, Any]) -> Optional[str]:
+    """Name of the first index a query plan tree reads, if any."""
+    if "indexName" in plan:
+        return plan["indexName"]
+    for child in [plan.get("queryPlan"), plan.get("inputStage"), *plan.get("inputStages", [])]:
+        if child:
+            name = _index_name(child)
+            if name:
+                return name
+    return None
+
+
+async def explain_query_shapes(db) -> List[Dict[str, Any]]:
+    """
+    Ask the query planner how each shape in QUERY_SHAPES would run.
+
+    Returns:
+        List[Dict[str, Any]]: One entry per shape with its winning plan's
+        stages, the index used and whether it falls back to a collection scan
+        or an in-memory sort.
+    """
+    report = []
+    for shape in QUERY_SHAPES:
+        explain = await db.command({
+            "explain": {"find": shape["collection"], "filter": shape["filter"], "sort": shape.get("sort", {})},
+            "verbosity": "queryPlanner",
+        })
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(winning_plan)
+        report.append({
+            "name": shape["name"],
+            "collection": shape["collection"],
+            "filter": sorted(shape["filter"]),
+            "stages": stages,
+            "index": _index_name(winning_plan),
+            "collscan": "COLLSCAN" in stages,
+            # The sort is not served by the index
+            "in_memory_sort": "SORT" in stages,
+        })
+    return report
+
+
+async def bootstrap_indexes(db) -> List[Dict[str, Any]]:
+    """
+    Create the indexes, then check every query shape against the planner and
+    print the ones that would still scan the whole collection.
+
+    Returns:
+        List[Dict[str, Any]]: The explain report (see explain_query_shapes).
+    """
+    created = await ensure_indexes(db)
+    print(f"MongoDB indexes in place: {created}")
+    report = await explain_query_shapes(db)
+    for shape in report:
+        if shape["collscan"]:
+            print(f"Query shape {shape['name']} on {shape['collection']} {shape['filter']} uses a COLLECTION SCAN")
+        if shape["in_memory_sort"]:
+            print(f"Query shape {shape['name']} on {shape['collection']} {shape['filter']} sorts in memory")
+    return report
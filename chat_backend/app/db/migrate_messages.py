@@ -0,0 +1,24 @@
+"""
+Move the embedded messages of existing conversations into the messages collection.
+
+The server also does this in the background at startup and for each
+conversation on first read; run it by hand to finish a migration up front:
+
+    python -m app.db.migrate_messages
+"""
+import asyncio
+
+from .database import client, db, migrate_embedded_messages
+from .indexes import ensure_indexes
+
+
+async def main():
+    # The (conversation_id, seq) index keeps concurrent migrations from duplicating messages
+    await ensure_indexes(db)
+    migrated = await migrate_embedded_messages()
+    print(f"{migrated} conversations migrated")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
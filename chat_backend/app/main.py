@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routes import auth, chat, admin
+from .db.database import connect_to_mongo
 
 # Create FastAPI app
 app = FastAPI(
@@ -25,6 +26,11 @@ app.include_router(auth.router)
 app.include_router(chat.router)
 app.include_router(admin.router)
 
+@app.on_event("startup")
+async def startup_event():
+    # Ping MongoDB and create the indexes every query relies on (idempotent)
+    await connect_to_mongo()
+
 @app.get("/")
 async def root():
     return {
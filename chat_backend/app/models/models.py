@@ -38,16 +38,35 @@ class Message(BaseModel):
     role: str
     content: str
     feedback: Optional[Feedback] = None
+    # Position in the conversation, starting at 0
+    seq: Optional[int] = None
+
+class MessagePage(BaseModel):
+    messages: List[Message]
+    # Pass as `before` to get the previous (older) page; None on the first message
+    next_cursor: Optional[int] = None
 
 # Conversation models
 class Conversation(BaseModel):
     id: str
     title: str
     messages: List[Message]
+    message_count: int = 0
     created_at: datetime
     updated_at: datetime
     user_id: str
 
+class ConversationSummary(BaseModel):
+    id: str
+    title: str
+    updated_at: datetime
+    message_count: int
+
+class ConversationSummaryPage(BaseModel):
+    conversations: List[ConversationSummary]
+    # Opaque; pass as `cursor` to get the next (older) page, None on the last page
+    next_cursor: Optional[str] = None
+
 class ConversationCreate(BaseModel):
     title: str = "New Conversation"
     messages: List[Message] = []
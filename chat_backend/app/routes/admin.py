@@ -3,12 +3,15 @@ from typing import List, Dict
 
 from ..models.models import User, Conversation, UserStats, FeedbackStats
 from ..core.auth import get_admin_user
+from ..core.metrics import chat_stream_metrics
 from ..db.database import (
     get_all_users,
     get_all_conversations,
     get_user_statistics,
-    get_feedback_statistics
+    get_feedback_statistics,
+    db,
 )
+from ..db.indexes import explain_query_shapes
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -47,6 +50,22 @@ async def get_feedback_stats(current_user: User = Depends(get_admin_user)):
     """
     return await get_feedback_statistics()
 
+@router.get("/stats/streaming", response_model=Dict)
+async def get_streaming_stats(current_user: User = Depends(get_admin_user)):
+    """
+    Get time-to-first-token and duration percentiles of streamed chat answers.
+    Only accessible to admin users.
+    """
+    return chat_stream_metrics.stats()
+
+@router.get("/stats/indexes", response_model=List[Dict])
+async def get_index_stats(current_user: User = Depends(get_admin_user)):
+    """
+    Get the query plan of every database query shape, flagging collection scans.
+    Only accessible to admin users.
+    """
+    return await explain_query_shapes(db)
+
 # Admin dashboard data
 @router.get("/dashboard")
 async def get_dashboard_data(current_user: User = Depends(get_admin_user)):
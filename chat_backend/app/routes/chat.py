@@ -172,8 +172,13 @@
     
 #     return None
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, AsyncIterator, Optional, Tuple
+import os
+import json
+import asyncio
+import time
 import uuid
 
 from datetime import datetime
@@ -181,25 +186,35 @@ from datetime import datetime
 from ..models.models import (
     User,
     Conversation,
+    ConversationSummaryPage,
     ConversationCreate,
     ConversationUpdate,
+    MessagePage,
     ChatRequest,
     ChatResponse,
     FeedbackRequest
 )
 from ..core.auth import get_current_active_user
+from ..core.metrics import chat_stream_metrics
 from ..db.database import (
+    CONVERSATION_PAGE_SIZE,
+    MESSAGE_PAGE_SIZE,
     create_conversation,
     get_conversation,
+    get_message_page,
     get_user_conversations,
+    get_user_conversation_summaries,
     update_conversation,
     delete_conversation,
-    add_messages_to_conversation,
+    commit_chat_turn,
     update_message_feedback
 )
 
 import httpx
 
+# Base URL of the AI service that serves /provide_response
+AI_SERVICE_URL = os.getenv("AI_SERVICE_URL") or "http://localhost:8001"
+
 router = APIRouter()
 
 ############################
@@ -221,6 +236,22 @@ async def create_new_conversation(
 async def read_conversations(current_user: User = Depends(get_current_active_user)):
     return await get_user_conversations(current_user.id)
 
+@router.get("/conversations/summaries", response_model=ConversationSummaryPage)
+async def read_conversation_summaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(CONVERSATION_PAGE_SIZE, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    The sidebar listing: id, title, updated_at and message count, most recent first.
+    Follow next_cursor for older conversations.
+    """
+    try:
+        conversations, next_cursor = await get_user_conversation_summaries(current_user.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ConversationSummaryPage(conversations=conversations, next_cursor=next_cursor)
+
 @router.get("/conversations/{conversation_id}", response_model=Conversation)
 async def read_conversation(
     conversation_id: str,
@@ -231,6 +262,23 @@ async def read_conversation(
         raise HTTPException(status_code=404, detail="Conversation not found")
     return conversation
 
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def read_conversation_messages(
+    conversation_id: str,
+    before: Optional[int] = Query(None, ge=0),
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=200),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    The latest `limit` messages, or those before the `before` cursor, oldest first.
+    Follow next_cursor to page back through the history.
+    """
+    page = await get_message_page(conversation_id, current_user.id, before=before, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    messages, next_cursor = page
+    return MessagePage(messages=messages, next_cursor=next_cursor)
+
 @router.put("/conversations/{conversation_id}", response_model=Conversation)
 async def update_existing_conversation(
     conversation_id: str,
@@ -294,7 +342,7 @@ async def chat(
     async with httpx.AsyncClient() as client:
         try:
             response = await client.get(
-                "http://localhost:8001/provide_response",
+                f"{AI_SERVICE_URL}/provide_response",
                 params={"question": request.message}
             )
             response.raise_for_status()
@@ -312,48 +360,123 @@ async def chat(
         "feedback": None
     }
 
-    # If conversation_id is provided, try to update existing conversation
-    if request.conversation_id:
-        conversation = await get_conversation(request.conversation_id, current_user.id)
-        if conversation:
-            # If the conversation title is the default, update it with the text of the first message
-            if conversation.title == "New Conversation":
-                new_title = request.message[:30] + "..." if len(request.message) > 30 else request.message
-                await update_conversation(
-                    conversation_id=request.conversation_id,
-                    update_data={"title": new_title},
-                    user_id=current_user.id
-                )
-            # Add messages to existing conversation
-            await add_messages_to_conversation(
-                conversation_id=request.conversation_id,
-                messages=[user_message, ai_message],
-                user_id=current_user.id
-            )
-            return ChatResponse(
-                message=response_text,
-                conversation_id=request.conversation_id
-            )
+    conversation_id = await save_chat_turn(request, current_user, user_message, ai_message)
+
+    return ChatResponse(
+        message=response_text,
+        conversation_id=conversation_id
+    )
 
-    # Create a new conversation with the first message as the title
+async def save_chat_turn(request: ChatRequest, current_user: User, user_message: Dict, ai_message: Dict) -> str:
+    """
+    Persist a user message and the assistant's answer.
+    If request.conversation_id exists for this user the messages are appended to it;
+    otherwise a new conversation is created. Returns the conversation id.
+    """
+    # The first message becomes the title of a new (or still untitled) conversation
     title = request.message[:30] + "..." if len(request.message) > 30 else request.message
-    conversation = await create_conversation(
+    return await commit_chat_turn(
+        conversation_id=request.conversation_id,
         user_id=current_user.id,
         title=title,
-        messages=[]
+        messages=[user_message, ai_message]
     )
 
-    # Add messages to the new conversation
-    await add_messages_to_conversation(
-        conversation_id=conversation.id,
-        messages=[user_message, ai_message],
-        user_id=current_user.id
-    )
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[str, Dict]]:
+    """Parse (event, data) pairs from a server-sent event stream."""
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Streaming variant of /chat. Relays the AI service's tokens as server-sent
+    events (token events), then persists the turn and sends a done event with
+    the conversation and message ids. If the client disconnects mid-stream the
+    turn is still persisted, with the part of the answer received so far.
+    """
+    user_message = {
+        "id": str(uuid.uuid4()),
+        "role": "user",
+        "content": request.message,
+        "feedback": None
+    }
 
-    return ChatResponse(
-        message=response_text,
-        conversation_id=conversation.id
-    )
+    async def events():
+        started = time.perf_counter()
+        first_token_at = None
+        parts = []
+        failed = False
+        saving = False
+        try:
+            try:
+                async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+                    async with client.stream(
+                        "GET",
+                        f"{AI_SERVICE_URL}/provide_response/stream",
+                        params={"question": request.message}
+                    ) as response:
+                        response.raise_for_status()
+                        async for event, data in iter_sse(response):
+                            if event == "token":
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                parts.append(data["text"])
+                                yield sse_event("token", {"text": data["text"]})
+                            elif event == "error":
+                                raise RuntimeError(data.get("detail", "stream failed"))
+                response_text = "".join(parts) or "I'm sorry, no response available."
+            except Exception as e:
+                # In case of error, persist and return a fallback like /chat does
+                failed = True
+                response_text = f"AI service error: {str(e)}"
+                yield sse_event("error", {"detail": response_text})
+
+            ai_message = {
+                "id": str(uuid.uuid4()),
+                "role": "assistant",
+                "content": response_text,
+                "feedback": None
+            }
+            chat_stream_metrics.record(started, first_token_at, failed)
+            saving = True
+            # Shielded: a disconnect during the save must not cancel it between its writes
+            conversation_id = await asyncio.shield(save_chat_turn(request, current_user, user_message, ai_message))
+
+            yield sse_event("done", {
+                "message": response_text,
+                "conversation_id": conversation_id,
+                "user_message_id": user_message["id"],
+                "message_id": ai_message["id"],
+            })
+        finally:
+            if not saving:
+                # The client disconnected mid-stream (GeneratorExit or CancelledError at a yield):
+                # keep the question, and the part of the answer that arrived, like /chat would
+                chat_stream_metrics.record(started, first_token_at, failed=True)
+                ai_message = {
+                    "id": str(uuid.uuid4()),
+                    "role": "assistant",
+                    "content": "".join(parts) or "I'm sorry, no response available.",
+                    "feedback": None
+                }
+                await asyncio.shield(save_chat_turn(request, current_user, user_message, ai_message))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 ####################
 # Feedback endpoint#
@@ -1,11 +1,12 @@
 import "../styles/conversation.css";
-import { Conversation } from "../types";
+import { ConversationSummary } from "../types";
 
 interface ConversationListProps {
-  conversations: Conversation[];
+  conversations: ConversationSummary[];
   activeConversationId: string | null;
   onSelectConversation: (conversationId: string) => void;
   onNewConversation: () => void;
+  onLoadMore?: () => void;
 }
 
 export default function ConversationList({
@@ -13,6 +14,7 @@ export default function ConversationList({
   activeConversationId,
   onSelectConversation,
   onNewConversation,
+  onLoadMore,
 }: ConversationListProps) {
   return (
     <div className="conversation-sidebar">
@@ -40,10 +42,8 @@ export default function ConversationList({
             >
               <div className="conversation-title">{conversation.title}</div>
               <div className="conversation-date">
-                {conversation.updatedAt
-                  ? formatDate(typeof conversation.updatedAt === 'string'
-                      ? new Date(conversation.updatedAt)
-                      : conversation.updatedAt)
+                {conversation.updated_at
+                  ? formatDate(new Date(conversation.updated_at))
                   : "No date"}
               </div>
               <div className="conversation-preview">
@@ -52,6 +52,11 @@ export default function ConversationList({
             </div>
           ))
         )}
+        {onLoadMore && (
+          <button className="load-more-button" onClick={onLoadMore}>
+            Load older conversations
+          </button>
+        )}
       </div>
     </div>
   );
@@ -80,17 +85,9 @@ function formatDate(date: Date): string {
 }
 
 // Helper function to get a preview of the conversation
-function getConversationPreview(conversation: Conversation): string {
-  const lastMessage = conversation.messages[conversation.messages.length - 1];
-  if (!lastMessage) return "No messages";
-
-  // Truncate the message if it's too long
-  const maxLength = 30;
-  const content = lastMessage.content;
-
-  if (content.length <= maxLength) {
-    return content;
-  }
-
-  return content.substring(0, maxLength) + "...";
+function getConversationPreview(conversation: ConversationSummary): string {
+  if (conversation.message_count === 0) return "No messages";
+  return conversation.message_count === 1
+    ? "1 message"
+    : `${conversation.message_count} messages`;
 }
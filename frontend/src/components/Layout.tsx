@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { User, Conversation, Message } from '../types';
+import { User, Conversation, ConversationSummary, Message } from '../types';
 import Login from './Login';
 import Signup from './Signup';
 import Chat from './chat';
@@ -13,13 +13,23 @@ export default function Layout() {
   const [isAuthenticated, setIsAuthenticated] = useState(false);
   const [showSignup, setShowSignup] = useState(false);
   const [user, setUser] = useState<User | null>(null);
-  const [conversations, setConversations] = useState<Conversation[]>([]);
+  const [conversations, setConversations] = useState<ConversationSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [activeConversationId, setActiveConversationId] = useState<string | null>(null);
+  const [activeConversation, setActiveConversation] = useState<Conversation | null>(null);
   const [isMobileMenuOpen, setIsMobileMenuOpen] = useState(false);
   const [isLoading, setIsLoading] = useState(true);
   const [isAdmin, setIsAdmin] = useState(false);
   const [showAdminDashboard, setShowAdminDashboard] = useState(false);
 
+  // Load the first page of the sidebar; returns the conversations loaded
+  const loadConversations = async (): Promise<ConversationSummary[]> => {
+    const page = await conversationApi.getConversationSummaries();
+    setConversations(page.conversations);
+    setNextCursor(page.next_cursor);
+    return page.conversations;
+  };
+
   // Check authentication status and load user data on mount
   useEffect(() => {
     const checkAuth = async () => {
@@ -34,11 +44,10 @@ export default function Layout() {
           setIsAdmin(adminStatus);
           
           // Load conversations
-          const conversationsData = await conversationApi.getConversations();
-          setConversations(conversationsData);
+          const conversationsData = await loadConversations();
           
           // Set the first conversation as active if there is one
-          if (conversationsData.length > 0 && !activeConversationId) {
+          if (conversationsData.length > 0) {
             setActiveConversationId(conversationsData[0].id);
           }
         }
@@ -52,6 +61,24 @@ export default function Layout() {
     };
     
     checkAuth();
+  }, []);
+
+  // Load the messages of the selected conversation only
+  useEffect(() => {
+    if (!activeConversationId) {
+      setActiveConversation(null);
+      return;
+    }
+    if (activeConversation && activeConversation.id === activeConversationId) return;
+    let cancelled = false;
+    conversationApi.getConversation(activeConversationId)
+      .then((conversation) => {
+        if (!cancelled) setActiveConversation(conversation);
+      })
+      .catch((error) => console.error('Failed to load conversation:', error));
+    return () => {
+      cancelled = true;
+    };
   }, [activeConversationId]);
 
   // Handle login
@@ -62,8 +89,7 @@ export default function Layout() {
       setIsAuthenticated(true);
       
       // Load conversations
-      const conversationsData = await conversationApi.getConversations();
-      setConversations(conversationsData);
+      const conversationsData = await loadConversations();
       
       // Set the first conversation as active if there is one
       if (conversationsData.length > 0) {
@@ -91,14 +117,25 @@ export default function Layout() {
     setIsAuthenticated(false);
     setUser(null);
     setConversations([]);
+    setNextCursor(null);
     setActiveConversationId(null);
+    setActiveConversation(null);
   };
 
   // Handle creating a new conversation
   const handleNewConversation = async () => {
     try {
       const newConversation = await conversationApi.createConversation();
-      setConversations([newConversation, ...conversations]);
+      setConversations([
+        {
+          id: newConversation.id,
+          title: newConversation.title,
+          updated_at: new Date().toISOString(),
+          message_count: 0,
+        },
+        ...conversations,
+      ]);
+      setActiveConversation(newConversation);
       setActiveConversationId(newConversation.id);
       setIsMobileMenuOpen(false); // Close mobile menu when starting new conversation
     } catch (error) {
@@ -106,6 +143,18 @@ export default function Layout() {
     }
   };
 
+  // Load the next page of older conversations
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      const page = await conversationApi.getConversationSummaries(nextCursor);
+      setConversations([...conversations, ...page.conversations]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error('Failed to load conversations:', error);
+    }
+  };
+
   // Handle selecting a conversation
   const handleSelectConversation = (conversationId: string) => {
     setActiveConversationId(conversationId);
@@ -120,8 +169,7 @@ export default function Layout() {
       await conversationApi.updateConversation(activeConversationId, { messages });
       
       // Refresh conversations list
-      const conversationsData = await conversationApi.getConversations();
-      setConversations(conversationsData);
+      await loadConversations();
     } catch (error) {
       console.error('Failed to save conversation:', error);
     }
@@ -154,9 +202,6 @@ export default function Layout() {
     return <AdminDashboard />;
   }
 
-  // Get the active conversation
-  const activeConversation = conversations.find(c => c.id === activeConversationId);
-
   return (
     <div className="layout-container">
       {/* Header */}
@@ -196,12 +241,13 @@ export default function Layout() {
             activeConversationId={activeConversationId}
             onSelectConversation={handleSelectConversation}
             onNewConversation={handleNewConversation}
+            onLoadMore={nextCursor ? handleLoadMore : undefined}
           />
         </div>
 
         {/* Chat area */}
         <div className="layout-chat">
-          {activeConversation ? (
+          {activeConversation && activeConversation.id === activeConversationId ? (
             <Chat
               conversationId={activeConversation.id}
               initialMessages={activeConversation.messages}
@@ -48,19 +48,38 @@ export default function Chat({
     setInput("");
     setIsLoading(true);
 
+    // 2. Add an empty assistant message that is filled in as tokens arrive
+    const placeholderId = `${Date.now()}-assistant`;
+    setMessages((prev) => [
+      ...prev,
+      { id: placeholderId, role: "assistant", content: "", feedback: null },
+    ]);
+
     try {
-      // 2. Send message to API
-      const response = await chatApi.sendMessage(input, conversationId);
+      // 3. Stream the answer from the API
+      const response = await chatApi.sendMessageStream(
+        input,
+        (text) => {
+          setMessages((prev) =>
+            prev.map((msg) =>
+              msg.id === placeholderId ? { ...msg, content: msg.content + text } : msg
+            )
+          );
+        },
+        conversationId
+      );
 
-      // 3. Add the AI's response to the chat list
-      const aiMessage: Message = {
-        id: `${Date.now()}-assistant`,
-        role: "assistant",
-        content: response.message,
-        feedback: null,
-      };
+      // 4. Replace the placeholder with the saved message ids and final text
       setMessages((prev) => {
-         const updatedMessages = [...prev, aiMessage];
+         const updatedMessages = prev.map((msg) => {
+           if (msg.id === placeholderId) {
+             return { ...msg, id: response.message_id, content: response.message };
+           }
+           if (msg.id === userMessage.id) {
+             return { ...msg, id: response.user_message_id };
+           }
+           return msg;
+         });
          if (onSaveConversation) {
             onSaveConversation(updatedMessages);
          }
@@ -69,6 +88,10 @@ export default function Chat({
 
     } catch (error) {
       console.error("Error fetching AI response:", error);
+      // Drop the placeholder if nothing was streamed into it
+      setMessages((prev) =>
+        prev.filter((msg) => msg.id !== placeholderId || msg.content !== "")
+      );
       // Optionally add an error message to the chat
     } finally {
       setIsLoading(false);
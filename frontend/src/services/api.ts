@@ -1,4 +1,4 @@
-import { User, Conversation, Message } from '../types';
+import { User, Conversation, ConversationSummaryPage, Message } from '../types';
 
 // API base URL
 const API_URL = 'http://localhost:8000';
@@ -115,6 +115,23 @@ export const conversationApi = {
     return handleResponse<Conversation[]>(response);
   },
   
+  // Get a page of conversation summaries (no messages), most recent first
+  async getConversationSummaries(cursor?: string | null): Promise<ConversationSummaryPage> {
+    const token = getToken();
+    if (!token) {
+      throw new Error('Not authenticated');
+    }
+    
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`${API_URL}/conversations/summaries${query}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+    
+    return handleResponse<ConversationSummaryPage>(response);
+  },
+  
   // Get a specific conversation
   async getConversation(id: string): Promise<Conversation> {
     const token = getToken();
@@ -207,6 +224,69 @@ export const chatApi = {
     
     return handleResponse<{ message: string, conversation_id: string }>(response);
   },
+
+  // Send a message and receive the response as it is generated.
+  // onToken is called with each chunk of text; resolves with the saved ids once the stream is done.
+  async sendMessageStream(
+    message: string,
+    onToken: (text: string) => void,
+    conversationId?: string
+  ): Promise<{ message: string, conversation_id: string, user_message_id: string, message_id: string }> {
+    const token = getToken();
+    if (!token) {
+      throw new Error('Not authenticated');
+    }
+
+    const response = await fetch(`${API_URL}/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message, conversation_id: conversationId }),
+    });
+
+    if (!response.ok || !response.body) {
+      await handleResponse<void>(response);
+      throw new Error('Streaming is not supported');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let done: { message: string, conversation_id: string, user_message_id: string, message_id: string } | null = null;
+
+    // Server-sent events are separated by a blank line
+    while (true) {
+      const { value, done: finished } = await reader.read();
+      if (finished) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        const dataLines: string[] = [];
+        for (const line of raw.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+        }
+        if (dataLines.length === 0) continue;
+        const data = JSON.parse(dataLines.join('\n'));
+
+        if (event === 'token') onToken(data.text);
+        else if (event === 'done') done = data;
+      }
+    }
+
+    if (!done) {
+      throw new Error('The response stream ended unexpectedly');
+    }
+    return done;
+  },
 };
 
 // Feedback API calls
@@ -21,6 +21,18 @@ export interface Conversation {
   user_id?: string;
 }
 
+export interface ConversationSummary {
+  id: string;
+  title: string;
+  updated_at: string;
+  message_count: number;
+}
+
+export interface ConversationSummaryPage {
+  conversations: ConversationSummary[];
+  next_cursor: string | null;
+}
+
 export interface User {
   id: string;
   username: string;
@@ -1,11 +1,16 @@
 from fastapi import FastAPI, Query
+from fastapi.responses import StreamingResponse
 from sentence_transformers import SentenceTransformer
 import torch
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+from threading import Thread
 import os
 from dotenv import load_dotenv
+from retrieval import (
+    load_text_index, make_encode_batcher, encode_questions, retrieve_contexts,
+    embedding_cache, answer_cache, file_fingerprint, stream_text, stream_metrics,
+)
 from openai import AzureOpenAI
 
 # Load environment variables from .env file
@@ -49,25 +54,18 @@ device_emb = "cuda:0" if torch.cuda.is_available() else "cpu"
 device_llm = "cuda:1" if torch.cuda.is_available() else "cpu"
 
 # Load the sentence transformer model for similarity computations
-sim_model = SentenceTransformer("Alibaba-NLP/gte-Qwen2-7B-instruct", trust_remote_code=True).to(device_emb)
+SIM_MODEL_NAME = "Alibaba-NLP/gte-Qwen2-7B-instruct"
+sim_model = SentenceTransformer(SIM_MODEL_NAME, trust_remote_code=True).to(device_emb)
+# Concurrent requests share sim_model.encode calls
+encode_batcher = make_encode_batcher(sim_model, device_emb)
 
-# Load precomputed embeddings and texts from .npy files
-hcl_embeddings_matrix = np.load('hcl_embeddings.npy')
-hcl_texts = np.load('hcl_texts.npy', allow_pickle=True)
-servicii_embeddings_matrix = np.load('servicii_embeddings.npy')
-servicii_texts = np.load('servicii_texts.npy', allow_pickle=True)
+# Load precomputed embeddings and texts from .npy files (rows are normalized once at load)
+hcl_index = load_text_index('hcl_embeddings.npy', 'hcl_texts.npy')
+servicii_index = load_text_index('servicii_embeddings.npy', 'servicii_texts.npy')
+CORPUS_VERSION = file_fingerprint('hcl_embeddings.npy', 'hcl_texts.npy', 'servicii_embeddings.npy', 'servicii_texts.npy')
 
 print("NPY embeddings and texts loaded successfully.")
 
-def normalize(embeddings):
-    """Normalize embeddings row-wise."""
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    return embeddings / norms
-
-# Normalize embeddings (if not already normalized)
-hcl_embeddings_norm = normalize(hcl_embeddings_matrix).astype('float32')
-servicii_embeddings_norm = normalize(servicii_embeddings_matrix).astype('float32')
-
 # Set the model identifier to the correct Hugging Face repo
 GEN_MODEL_NAME = "deepseek-ai/DeepSeek-R1-Distill-Qwen-14B"
 tokenizer = AutoTokenizer.from_pretrained(GEN_MODEL_NAME)
@@ -147,24 +145,49 @@ def generate_text(prompt: str, max_new_tokens: int = 512) -> str:
     generated_text = tokenizer.decode(outputs[0][input_length:], skip_special_tokens=True)
     return generated_text.strip()
 
+def generate_text_stream(prompt: str, max_new_tokens: int = 512):
+    """Like generate_text, but yields the decoded text piece by piece while the model generates."""
+    inputs = tokenizer(prompt, return_tensors="pt").to(device_llm)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generation = Thread(target=gen_model.generate, kwargs=dict(
+        **inputs,
+        streamer=streamer,
+        max_new_tokens=max_new_tokens,
+        temperature=0.6,
+        top_p=0.95,
+        do_sample=True,
+        num_return_sequences=1,
+    ))
+    generation.start()
+    for text in streamer:
+        if text:
+            yield text
+    generation.join()
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "encode_batches": encode_batcher.metrics.stats(),
+    }
 
 @app.get("/provide_response")
 def provide_response(question: str = Query(..., description="Întrebarea pentru care se dorește răspunsul bazat pe context.")):
-    # Compute the embedding for the input question using the similarity model
-    question_embedding = sim_model.encode([question], convert_to_numpy=True, device=device_emb)
-    question_embedding_norm = normalize(question_embedding).astype('float32')
+    # Compute the normalized embedding for the input question
+    question_embedding_norm = encode_questions(encode_batcher, [question], SIM_MODEL_NAME)
     
-    # Compute cosine similarities for both HCLS and Servicii embeddings
-    hcl_similarities = cosine_similarity(question_embedding_norm, hcl_embeddings_norm)[0]
-    servicii_similarities = cosine_similarity(question_embedding_norm, servicii_embeddings_norm)[0]
+    # A near-duplicate of an already answered question gets the cached answer
+    cached = answer_cache.lookup(question_embedding_norm[0], CORPUS_VERSION)
+    if cached:
+        return {"question": question, **cached["response"]}
     
-    # Get the top-K indices for both sources
-    hcl_top_indices = np.argsort(hcl_similarities)[::-1][:TOP_K]
-    servicii_top_indices = np.argsort(servicii_similarities)[::-1][:TOP_K]
-    
-    # Retrieve top-K document texts and build context strings
-    hcl_docs_str = "\n\n".join([hcl_texts[int(idx)] for idx in hcl_top_indices])
-    servicii_docs_str = "\n\n".join([servicii_texts[int(idx)] for idx in servicii_top_indices])
+    # Score both sources with one dot product each and build the top-K context strings
+    contexts, doc_ids = retrieve_contexts(
+        [hcl_index, servicii_index], question_embedding_norm, TOP_K, with_ids=True
+    )
+    hcl_docs_str, servicii_docs_str = contexts[0]
     
     # Create prompts for each source using their templates and include the general guidelines
     hcls_prompt = HCLS_PROMPT_TEMPLATE.format(docs=hcl_docs_str, question=question)
@@ -182,8 +205,7 @@ def provide_response(question: str = Query(..., description="Întrebarea pentru
     )
     final_response = generate_text(fusion_prompt, max_new_tokens=256)
     
-    return {
-        "question": question,
+    response = {
         # "top_k_hcls": [
         #     {"Hcl_sumarizat": hcl_texts[int(idx)], "similarity": float(hcl_similarities[idx])}
         #     for idx in hcl_top_indices
@@ -196,3 +218,42 @@ def provide_response(question: str = Query(..., description="Întrebarea pentru
         "servicii_response": servicii_response,
         "final_response": final_response,
     }
+    answer_cache.store(question_embedding_norm[0], response, doc_ids[0], CORPUS_VERSION)
+    
+    return {"question": question, **response}
+
+
+@app.get("/provide_response/stream")
+def provide_response_stream(question: str = Query(..., description="Întrebarea pentru care se dorește răspunsul bazat pe context.")):
+    """Streaming variant of /provide_response: the fused answer is sent as server-sent events."""
+    timer = stream_metrics.start()
+    question_embedding_norm = encode_questions(encode_batcher, [question], SIM_MODEL_NAME)
+    
+    cached = answer_cache.lookup(question_embedding_norm[0], CORPUS_VERSION)
+    if cached:
+        events = stream_text([cached["response"]["final_response"]], lambda _: {"question": question, **cached["response"]}, timer)
+        return StreamingResponse(events, media_type="text/event-stream")
+    
+    contexts, doc_ids = retrieve_contexts(
+        [hcl_index, servicii_index], question_embedding_norm, TOP_K, with_ids=True
+    )
+    hcl_docs_str, servicii_docs_str = contexts[0]
+    partials = {}
+    
+    def tokens():
+        # The partial answers are generated first; only the fusion is streamed
+        partials["hcls_response"] = generate_text(HCLS_PROMPT_TEMPLATE.format(docs=hcl_docs_str, question=question), max_new_tokens=256)
+        partials["servicii_response"] = generate_text(SERVICII_PROMPT_TEMPLATE.format(docs=servicii_docs_str, question=question), max_new_tokens=256)
+        fusion_prompt = FUSION_PROMPT_TEMPLATE.format(question=question, **partials)
+        yield from generate_text_stream(fusion_prompt, max_new_tokens=256)
+    
+    def finalize(final_response):
+        response = {**partials, "final_response": final_response.strip()}
+        answer_cache.store(question_embedding_norm[0], response, doc_ids[0], CORPUS_VERSION)
+        return {"question": question, **response}
+    
+    return StreamingResponse(stream_text(tokens(), finalize, timer), media_type="text/event-stream")
+
+@app.get("/metrics/streaming")
+def streaming_metrics():
+    return stream_metrics.stats()
@@ -2,10 +2,17 @@ from fastapi import FastAPI, Query
 from sentence_transformers import SentenceTransformer
 import torch
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 import os
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from retrieval import (
+    load_text_index, make_encode_batcher, encode_questions, retrieve_contexts,
+    embedding_cache, answer_cache, file_fingerprint, Stage, run_graph_threaded,
+    stream_text, stream_metrics,
+    PRIORITY_HIGH, PRIORITY_NORMAL, RateLimitExceeded, estimate_tokens, scheduler_from_env,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from openai import AzureOpenAI, APIConnectionError, InternalServerError
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,48 +26,77 @@ azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 client = AzureOpenAI(
     api_key=api_key,
     api_version=api_version,
-    azure_endpoint=azure_endpoint
+    azure_endpoint=azure_endpoint,
+    # 429s and retries are handled by chat_scheduler for all requests together
+    max_retries=0
 )
+# Admits chat calls within CHAT_RPM / CHAT_TPM / CHAT_MAX_CONCURRENCY and backs off on 429
+chat_scheduler = scheduler_from_env("chat", "CHAT", retry_exceptions=(APIConnectionError, InternalServerError))
 
-def get_response(question, content):
+def get_response(question, content, priority=PRIORITY_NORMAL):
     prompt = """
     Tu esti un asistent virtual menit sa raspunda la intrebarile venite de la public. Raspunsurile trebuie sa fie bazate pe continutul acesta:
     """
-    chat_completion = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": prompt + content},
-            {"role": "user", "content": question}
-        ]
+    chat_completion = chat_scheduler.submit(
+        lambda: client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": prompt + content},
+                {"role": "user", "content": question}
+            ]
+        ),
+        tokens=estimate_tokens(prompt, content, question),
+        priority=priority,
     )
     return chat_completion.choices[0].message.content
 
+def get_response_stream(question, content):
+    prompt = """
+    Tu esti un asistent virtual menit sa raspunda la intrebarile venite de la public. Raspunsurile trebuie sa fie bazate pe continutul acesta:
+    """
+    # The scheduler slot is held until the whole stream has been read
+    stream = chat_scheduler.submit_stream(
+        lambda: client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": prompt + content},
+                {"role": "user", "content": question}
+            ],
+            stream=True,
+        ),
+        tokens=estimate_tokens(prompt, content, question),
+        priority=PRIORITY_HIGH,
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
 app = FastAPI()
 
 # Configurable parameters
 TOP_K = 3
+# Seconds each LLM stage of provide_response may take
+LLM_STAGE_TIMEOUT = float(os.getenv("LLM_STAGE_TIMEOUT", "90"))
+# Threads for running independent pipeline stages concurrently
+stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STAGE_WORKERS", "16")))
 device_emb = "cuda:0" if torch.cuda.is_available() else "cpu"
 
 # Load the sentence transformer model for similarity computations
-sim_model = SentenceTransformer("Alibaba-NLP/gte-Qwen2-7B-instruct", trust_remote_code=True).to(device_emb)
+SIM_MODEL_NAME = "Alibaba-NLP/gte-Qwen2-7B-instruct"
+sim_model = SentenceTransformer(SIM_MODEL_NAME, trust_remote_code=True).to(device_emb)
+# Concurrent requests share sim_model.encode calls
+encode_batcher = make_encode_batcher(sim_model, device_emb)
 
-# Load precomputed embeddings and texts from .npy files
-hcl_embeddings_matrix = np.load('hcl_embeddings.npy')
-hcl_texts = np.load('hcl_texts.npy', allow_pickle=True)
-servicii_embeddings_matrix = np.load('servicii_embeddings.npy')
-servicii_texts = np.load('servicii_texts.npy', allow_pickle=True)
+# Load precomputed embeddings and texts from .npy files (rows are normalized once at load)
+hcl_index = load_text_index('hcl_embeddings.npy', 'hcl_texts.npy')
+servicii_index = load_text_index('servicii_embeddings.npy', 'servicii_texts.npy')
+CORPUS_VERSION = file_fingerprint('hcl_embeddings.npy', 'hcl_texts.npy', 'servicii_embeddings.npy', 'servicii_texts.npy')
 
 print("NPY embeddings and texts loaded successfully.")
 
-def normalize(embeddings):
-    """Normalize embeddings row-wise."""
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    return embeddings / norms
-
-# Normalize embeddings (if not already normalized)
-hcl_embeddings_norm = normalize(hcl_embeddings_matrix).astype('float32')
-servicii_embeddings_norm = normalize(servicii_embeddings_matrix).astype('float32')
-
 GENERAL_GUIDELINES = (
     "In prima parte a raspunsului sa fie rescrisa in intrebarea, iar mai apoi sa vina raspunsul incepand cu urmatorul rand. "
     "Raspunsul final sa aiba o structura care sa fie usor inteleasa si citita de orice user. "
@@ -86,43 +122,113 @@ FUSION_PROMPT_TEMPLATE = (
     "Raspunde la intrebare pe baza acest context {servicii_response}\n{hcls_response}"
 )
 
+@app.exception_handler(RateLimitExceeded)
+def rate_limit_exceeded(request, exc: RateLimitExceeded):
+    # The chat deployment kept answering 429 after the scheduler's retries
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(int(exc.retry_after) + 1)})
+
+@app.get("/metrics/rate_limits")
+def rate_limit_metrics():
+    return chat_scheduler.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "encode_batches": encode_batcher.metrics.stats(),
+    }
+
 @app.get("/provide_response")
 def provide_response(question: str = Query(..., description="Întrebarea pentru care se dorește răspunsul bazat pe context.")):
-    # Compute the embedding for the input question using the similarity model
-    question_embedding = sim_model.encode([question], convert_to_numpy=True, device=device_emb)
-    question_embedding_norm = normalize(question_embedding).astype('float32')
-    
-    # Compute cosine similarities for both HCLS and Servicii embeddings
-    hcl_similarities = cosine_similarity(question_embedding_norm, hcl_embeddings_norm)[0]
-    servicii_similarities = cosine_similarity(question_embedding_norm, servicii_embeddings_norm)[0]
+    # Compute the normalized embedding for the input question
+    question_embedding_norm = encode_questions(encode_batcher, [question], SIM_MODEL_NAME)
     
-    # Get the top-K indices for both sources
-    hcl_top_indices = np.argsort(hcl_similarities)[::-1][:TOP_K]
-    servicii_top_indices = np.argsort(servicii_similarities)[::-1][:TOP_K]
+    # A near-duplicate of an already answered question gets the cached answer
+    cached = answer_cache.lookup(question_embedding_norm[0], CORPUS_VERSION)
+    if cached:
+        return {"question": question, **cached["response"]}
     
-    # Retrieve top-K document texts and build context strings
-    hcl_docs_str = "\n\n".join([hcl_texts[int(idx)] for idx in hcl_top_indices])
-    servicii_docs_str = "\n\n".join([servicii_texts[int(idx)] for idx in servicii_top_indices])
+    # Score both sources with one dot product each and build the top-K context strings
+    contexts, doc_ids = retrieve_contexts(
+        [hcl_index, servicii_index], question_embedding_norm, TOP_K, with_ids=True
+    )
+    hcl_docs_str, servicii_docs_str = contexts[0]
     
     # Create prompts for each source using their templates
     hcls_prompt = HCLS_PROMPT_TEMPLATE.format(docs=hcl_docs_str, question=question)
     servicii_prompt = SERVICII_PROMPT_TEMPLATE.format(docs=servicii_docs_str, question=question)
     
-    # Generate responses using GPT (Azure OpenAI)
-    hcls_response = get_response(question, hcls_prompt)
-    servicii_response = get_response(question, servicii_prompt)
+    # The HCL and services answers are independent and run concurrently; fusion needs both
+    def fuse(hcls_response, servicii_response):
+        fusion_prompt = FUSION_PROMPT_TEMPLATE.format(
+            question=question,
+            servicii_response=servicii_response,
+            hcls_response=hcls_response,
+        )
+        return get_response(question, fusion_prompt, priority=PRIORITY_HIGH)
     
-    # Generate a final fused response folosind ambele răspunsuri parțiale
-    fusion_prompt = FUSION_PROMPT_TEMPLATE.format(
-        question=question,
-        servicii_response=servicii_response,
-        hcls_response=hcls_response,
-    )
-    final_response = get_response(question, fusion_prompt)
+    results = run_graph_threaded({
+        "hcls_response": Stage(lambda: get_response(question, hcls_prompt), timeout=LLM_STAGE_TIMEOUT, fallback="",
+                               propagate=(RateLimitExceeded,)),
+        "servicii_response": Stage(lambda: get_response(question, servicii_prompt), timeout=LLM_STAGE_TIMEOUT, fallback="",
+                                   propagate=(RateLimitExceeded,)),
+        "final_response": Stage(fuse, deps=("hcls_response", "servicii_response"), timeout=LLM_STAGE_TIMEOUT),
+    }, executor=stage_executor)
+    hcls_response = results["hcls_response"]
+    servicii_response = results["servicii_response"]
+    final_response = results["final_response"]
     
-    return {
-        "question": question,
+    response = {
         "hcls_response": hcls_response,
         "servicii_response": servicii_response,
         "final_response": final_response,
-    }
\ No newline at end of file
+    }
+    # Don't cache an answer fused from a branch that timed out
+    if hcls_response and servicii_response:
+        answer_cache.store(question_embedding_norm[0], response, doc_ids[0], CORPUS_VERSION)
+    
+    return {"question": question, **response}
+
+@app.get("/provide_response/stream")
+def provide_response_stream(question: str = Query(..., description="Întrebarea pentru care se dorește răspunsul bazat pe context.")):
+    """Streaming variant of /provide_response: the fused answer is sent as server-sent events."""
+    timer = stream_metrics.start()
+    question_embedding_norm = encode_questions(encode_batcher, [question], SIM_MODEL_NAME)
+    
+    cached = answer_cache.lookup(question_embedding_norm[0], CORPUS_VERSION)
+    if cached:
+        events = stream_text([cached["response"]["final_response"]], lambda _: {"question": question, **cached["response"]}, timer)
+        return StreamingResponse(events, media_type="text/event-stream")
+    
+    contexts, doc_ids = retrieve_contexts(
+        [hcl_index, servicii_index], question_embedding_norm, TOP_K, with_ids=True
+    )
+    hcl_docs_str, servicii_docs_str = contexts[0]
+    hcls_prompt = HCLS_PROMPT_TEMPLATE.format(docs=hcl_docs_str, question=question)
+    servicii_prompt = SERVICII_PROMPT_TEMPLATE.format(docs=servicii_docs_str, question=question)
+    partials = {}
+    
+    def tokens():
+        # The partial answers run concurrently inside the stream; only the fusion is streamed
+        partials.update(run_graph_threaded({
+            "hcls_response": Stage(lambda: get_response(question, hcls_prompt), timeout=LLM_STAGE_TIMEOUT, fallback="",
+                                   propagate=(RateLimitExceeded,)),
+            "servicii_response": Stage(lambda: get_response(question, servicii_prompt), timeout=LLM_STAGE_TIMEOUT, fallback="",
+                                       propagate=(RateLimitExceeded,)),
+        }, executor=stage_executor))
+        fusion_prompt = FUSION_PROMPT_TEMPLATE.format(question=question, **partials)
+        yield from get_response_stream(question, fusion_prompt)
+    
+    def finalize(final_response):
+        response = {**partials, "final_response": final_response}
+        if partials["hcls_response"] and partials["servicii_response"]:
+            answer_cache.store(question_embedding_norm[0], response, doc_ids[0], CORPUS_VERSION)
+        return {"question": question, **response}
+    
+    return StreamingResponse(stream_text(tokens(), finalize, timer), media_type="text/event-stream")
+
+@app.get("/metrics/streaming")
+def streaming_metrics():
+    return stream_metrics.stats()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# "int8" or "float16" to scan quantized codes and rescore a shortlist at full precision
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "")
+
+# Micro-batching of concurrent question encodes: window (ms) and maximum batch size
+ENCODE_BATCH_WAIT_MS = float(os.getenv("ENCODE_BATCH_WAIT_MS", "10"))
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "16"))
+
+# The numeric search core lives next to the CSV backend and is shared with it
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from vector_index import EmbeddingMatrix, normalize_rows  # noqa: E402
+from ann_index import load_ann, npy_ann_stem  # noqa: E402
+from query_cache import embedding_cache  # noqa: E402
+from answer_cache import answer_cache, file_fingerprint  # noqa: E402
+from batcher import ThreadedMicroBatcher  # noqa: E402
+from pipeline import Stage, run_graph_threaded  # noqa: E402
+from streaming import stream_text, stream_metrics  # noqa: E402
+from rate_limit import (  # noqa: E402
+    PRIORITY_HIGH, PRIORITY_NORMAL, RateLimitExceeded, estimate_tokens, scheduler_from_env,
+)
+
+
+class TextIndex:
+    """Pre-normalized float32 embeddings for one source, with the matching texts."""
+
+    def __init__(self, embeddings: np.ndarray, texts: Sequence[str], normalized: bool = False, name: str = ""):
+        if len(embeddings) != len(texts):
+            raise ValueError(f"{len(embeddings)} embeddings but {len(texts)} texts")
+        self.name = name
+        self.texts = texts
+        self.index = EmbeddingMatrix(embeddings, np.arange(len(texts)), normalized=normalized)
+
+    def __len__(self):
+        return len(self.index)
+
+    def search(self, question_embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (indices, similarities) for a batch of question embeddings, one row per question."""
+        return self.index.search_batch(question_embeddings, top_k)
+
+    def context(self, indices: Sequence[int], sep: str = "\n\n") -> str:
+        """Join the texts of the given indices into a prompt context, skipping search_batch's -1 padding."""
+        return sep.join(self.texts[int(idx)] for idx in indices if idx >= 0)
+
+
+def load_text_index(embeddings_path: str, texts_path: str) -> TextIndex:
+    """Load an .npy embedding matrix and its pickled texts array, plus its ANN index if one was built."""
+    texts = np.load(texts_path, allow_pickle=True)
+    name = os.path.basename(os.path.splitext(embeddings_path)[0])
+    if EMBEDDING_QUANTIZATION:
+        # Keep only the codes resident; the full-precision rows are memory-mapped for rescoring
+        text_index = TextIndex(_normalized_matrix(embeddings_path), texts, normalized=True, name=name)
+        if len(text_index):
+            text_index.index.quantize(EMBEDDING_QUANTIZATION)
+    else:
+        text_index = TextIndex(np.load(embeddings_path), texts, name=name)
+    if len(text_index):
+        # Rebuilt by embed_corpus --format npy whenever it rewrites the matrix
+        text_index.index.ann = load_ann(npy_ann_stem(embeddings_path), text_index.index.dim, len(text_index))
+    return text_index
+
+
+def _normalized_matrix(embeddings_path: str) -> np.ndarray:
+    """Memory-map a normalized float32 copy of an .npy matrix, writing it next to the source if missing or stale."""
+    normalized_path = os.path.splitext(embeddings_path)[0] + ".f32.npy"
+    if not os.path.exists(normalized_path) or os.path.getmtime(normalized_path) < os.path.getmtime(embeddings_path):
+        np.save(normalized_path, normalize_rows(np.load(embeddings_path, mmap_mode="r")))
+    return np.load(normalized_path, mmap_mode="r")
+
+
+def make_encode_batcher(model, device: str) -> ThreadedMicroBatcher:
+    """Batcher that folds questions encoded concurrently by different requests into one model.encode call."""
+    def encode_batch(questions: List[str]) -> np.ndarray:
+        return normalize_rows(model.encode(questions, convert_to_numpy=True, device=device))
+
+    return ThreadedMicroBatcher(encode_batch, max_batch_size=ENCODE_BATCH_SIZE,
+                                max_wait_ms=ENCODE_BATCH_WAIT_MS, name="encode")
+
+
+def encode_questions(encoder, questions: List[str], model_id: str = "") -> np.ndarray:
+    """
+    Encode a batch of questions into normalized float32 rows.
+
+    Questions already in the shared embedding cache (keyed on model_id) are not
+    re-encoded; the rest go through the encode batcher and are cached.
+    """
+    rows: List[Optional[np.ndarray]] = [embedding_cache.get_embedding(model_id, q) for q in questions]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        encoded = encoder([questions[i] for i in missing])
+        for i, row in zip(missing, encoded):
+            row.flags.writeable = False
+            embedding_cache.put_embedding(model_id, questions[i], row)
+            rows[i] = row
+    return np.stack(rows)
+
+
+def retrieve_contexts(indexes: Sequence[TextIndex], question_embeddings: np.ndarray, top_k: int,
+                      with_ids: bool = False):
+    """
+    Score every question against every index and build the context strings.
+
+    Each index is scored with one matrix-matrix product for the whole batch.
+    Returns one list per question, holding one context string per index.
+    With with_ids=True, also returns the "<index name>:<row>" ids used for
+    every question.
+    """
+    per_index = []
+    per_index_ids = []
+    for text_index in indexes:
+        top_indices, _ = text_index.search(question_embeddings, top_k)
+        per_index.append([text_index.context(row) for row in top_indices])
+        per_index_ids.append([[f"{text_index.name}:{int(idx)}" for idx in row if idx >= 0] for row in top_indices])
+    contexts = [list(question_contexts) for question_contexts in zip(*per_index)]
+    if not with_ids:
+        return contexts
+    ids = [sum(question_ids, []) for question_ids in zip(*per_index_ids)]
+    return contexts, ids